@@ -1,26 +1,24 @@
 # Community/api/ai_tools.py
 import json
-import vertexai
+import threading
+import time
 import traceback
-from vertexai.generative_models import GenerativeModel, Part, FunctionDeclaration, Tool, ToolConfig, Content
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.utils import timezone
 from .models import Visitor, CustomUser, Event, FCMDevice
+from . import transitions
+from . import chat_history, copilot_cache, copilot_metrics, intents, llm, tool_runner
+from .passes import create_visitor_passes
 # from firebase_admin import messaging # (Keep if using FCM)
 from datetime import datetime, timedelta # For basic time parsing
 
-# --- Initialize Vertex AI ---
-try:
-    vertexai.init(project=settings.GCP_PROJECT_ID, location=settings.GCP_LOCATION)
-except Exception as e:
-    print(f"Error initializing Vertex AI: {e}")
-
 # -----------------------------------------------------------
 # 1. DEFINE THE TOOLS (Gemini Format)
 # -----------------------------------------------------------
 
 # --- Tool 1: Create Visitor (UPGRADED) ---
-create_visitor_func = FunctionDeclaration(
+create_visitor_func = dict(
     name="create_visitor",
     description="Create one or more new visitor passes for the resident's household.",
     parameters={
@@ -40,7 +38,7 @@ create_visitor_func = FunctionDeclaration(
 )
 
 # --- Tool 2: List Visitors (UPGRADED) ---
-list_my_visitors_func = FunctionDeclaration(
+list_my_visitors_func = dict(
     name="list_my_visitors",
     description="List visitors associated with the resident's household, optionally filtering by status.",
     parameters={
@@ -57,37 +55,126 @@ list_my_visitors_func = FunctionDeclaration(
 )
 
 # --- Tool 3 & 4 (Unchanged) ---
-approve_visitor_func = FunctionDeclaration(
+approve_visitor_func = dict(
     name="approve_visitor",
     description="Approve a pending visitor pass using its unique ID.",
     parameters={ "type": "object", "properties": { "visitor_id": {"type": "string"} }, "required": ["visitor_id"] },
 )
-deny_visitor_func = FunctionDeclaration(
+deny_visitor_func = dict(
     name="deny_visitor",
     description="Deny a pending visitor pass using its unique ID.",
     parameters={ "type": "object", "properties": { "visitor_id": {"type": "string"}, "reason": {"type": "string"} }, "required": ["visitor_id"] },
 )
-checkin_visitor_func = FunctionDeclaration(
+checkin_visitor_func = dict(
     name="checkin_visitor",
     description="Check in an approved visitor at the gate. (Guard/Admin only)",
     parameters={ "type": "object", "properties": { "visitor_id": {"type": "string"} }, "required": ["visitor_id"] },
 )
 
-# --- Update the Tool object ---
-GEMINI_TOOL = Tool(
-    function_declarations=[
-        create_visitor_func,   # Upgraded
-        list_my_visitors_func, # Upgraded
-        approve_visitor_func,
-        deny_visitor_func,
-        checkin_visitor_func,
-    ],
-)
-GEMINI_TOOL_CONFIG = ToolConfig(
-    function_calling_config=ToolConfig.FunctionCallingConfig(
-        mode=ToolConfig.FunctionCallingConfig.Mode.AUTO
-    )
-)
+# --- The tool registry ---
+# One entry per tool: its declaration for Gemini, the roles it is offered
+# to (the same roles its handler or transition accepts), the service
+# method that runs it (plus an async one for the async path, if it has
+# one), the arguments passed through, a `template` that turns a successful
+# result into the reply without a second Gemini call (None: Gemini
+# phrases it), and a `hint` line for the system prompt.
+TOOLS = {
+    'create_visitor': {
+        'declaration': create_visitor_func, # Upgraded
+        'roles': [CustomUser.Role.RESIDENT],
+        'handler': '_create_visitor',
+        'args': ('names', 'purpose', 'time_details'),
+        'template': None, # The schedule is a loose parse of the user's words; let Gemini explain it
+        'hint': "You can create *multiple* visitor passes at once (e.g., for a family).",
+    },
+    'list_my_visitors': {
+        'declaration': list_my_visitors_func, # Upgraded
+        'roles': [CustomUser.Role.RESIDENT],
+        'handler': '_list_my_visitors',
+        'async_handler': '_alist_my_visitors',
+        'args': ('status',),
+        'template': '{visitor_list_text}',
+        'read_only': True, # Turns that only read may be answered from the response cache
+        'hint': "You can list visitors by status (pending, approved, etc.).",
+    },
+    'approve_visitor': {
+        'declaration': approve_visitor_func,
+        'roles': transitions.TRANSITIONS['approve']['roles'],
+        'handler': '_approve_visitor',
+        'args': ('visitor_id',),
+        'template': '{message}',
+        'hint': "Always use the visitor ID for approving or denying.",
+    },
+    'deny_visitor': {
+        'declaration': deny_visitor_func,
+        'roles': transitions.TRANSITIONS['deny']['roles'],
+        'handler': '_deny_visitor',
+        'args': ('visitor_id', 'reason'),
+        'template': '{message}',
+        'hint': "Always use the visitor ID for approving or denying.",
+    },
+    'checkin_visitor': {
+        'declaration': checkin_visitor_func,
+        'roles': transitions.TRANSITIONS['checkin']['roles'],
+        'handler': '_checkin_visitor',
+        'args': ('visitor_id',),
+        'template': '{message}',
+        'hint': "Always use the visitor ID for checking in; only APPROVED visitors can be checked in.",
+    },
+}
+
+
+def tools_for_role(role):
+    """Names of the tools offered to `role`; calls outside it would only be rejected."""
+    return [name for name, tool in TOOLS.items() if role in tool['roles']]
+
+
+# --- The Tool objects, one per role ---
+# Built on first use (or by warmup.preload), so importing this module
+# doesn't load the Vertex AI SDK. A role only pays prompt tokens for the
+# declarations it can use.
+_gemini_tools = {}
+_tools_lock = threading.Lock()
+
+def get_gemini_tool(role=None):
+    """The Tool declaring `role`'s functions (default: every function)."""
+    if not _gemini_tools:
+        with _tools_lock:
+            if not _gemini_tools:
+                from vertexai.generative_models import FunctionDeclaration, Tool
+
+                declarations = {name: FunctionDeclaration(**tool['declaration']) for name, tool in TOOLS.items()}
+                tools = {None: Tool(function_declarations=list(declarations.values()))}
+                for member in CustomUser.Role:
+                    tools[member.value] = Tool(
+                        function_declarations=[declarations[name] for name in tools_for_role(member)]
+                    )
+                _gemini_tools.update(tools)
+    return _gemini_tools[role]
+
+
+# --- The system prompt ---
+# Everything but the username and the visitor context is fixed per role,
+# so it is assembled once per role and reused by every request.
+_PROMPT_TEMPLATE = """You are a helpful assistant for a community management app. The user has the role of '{role}'.
+Based on the user's request and the visitor list, decide which action(s) to call.
+{hints}
+- You can combine actions in one request if the user asks.
+- If a visitor name is ambiguous (e.g., two visitors named Ramesh), ask for the ID.
+After you call function(s) and get the result, formulate a single, concise, natural language confirmation for the user.
+If no function call is needed, just provide a brief, helpful conversational response.
+"""
+_role_prompts = {}
+
+def get_role_prompt(role):
+    """The static part of the system prompt for `role`."""
+    prompt = _role_prompts.get(role)
+    if prompt is None:
+        hints = dict.fromkeys(TOOLS[name]['hint'] for name in tools_for_role(role))
+        prompt = _role_prompts[role] = _PROMPT_TEMPLATE.format(
+            role=str(role), hints='\n'.join(f"- {hint}" for hint in hints)
+        )
+    return prompt
 
 # -----------------------------------------------------------
 # 2. TOOL EXECUTOR SERVICE (Updated Methods)
@@ -96,24 +183,32 @@ GEMINI_TOOL_CONFIG = ToolConfig(
 class AICopilotService:
     def __init__(self, user: CustomUser):
         self.user = user
-        try:
-            self.model = GenerativeModel(settings.GEMINI_MODEL_NAME)
-        except Exception as e:
-            print(f"Error initializing GenerativeModel: {e}")
-            self.model = None
-
-    def _log_event(self, type, actor, visitor, payload=None):
-        Event.objects.create(type=type, actor=actor, subject_visitor=visitor, payload=payload or {})
+        self._model = None
+        # Cleared by anything that makes this turn's reply unfit for the response cache
+        self._cacheable = True
+
+    @property
+    def model(self):
+        # Shared per process; Vertex AI is initialized on first use (see api/llm.py)
+        if self._model is None:
+            try:
+                self._model = llm.get_model()
+            except Exception as e:
+                print(f"Error initializing GenerativeModel: {e}")
+        return self._model
 
     def _send_fcm_to_user(self, user, title, body, data=None):
         # (Your FCM sending logic here... if you re-add it)
         pass 
 
     def _get_relevant_visitors_context(self):
-        # ... (This function remains the same as before) ...
+        # Cached per (role, household) until a visitor in scope changes (see api/copilot_cache.py)
+        return copilot_cache.get_visitor_context(self.user, self._build_visitors_context)
+
+    def _build_visitors_context(self):
         context_visitors = []
         if self.user.role == CustomUser.Role.RESIDENT:
-            q = Visitor.objects.filter(host_household=self.user.household, status=Visitor.Status.PENDING)
+            q = Visitor.objects.filter(host_household_id=self.user.household_id, status=Visitor.Status.PENDING)
             context_visitors = list(q.order_by('-created_at')[:10])
         elif self.user.role in [CustomUser.Role.GUARD, CustomUser.Role.ADMIN]:
             q = Visitor.objects.filter(status__in=[Visitor.Status.APPROVED, Visitor.Status.PENDING, Visitor.Status.CHECKED_IN])
@@ -126,22 +221,9 @@ class AICopilotService:
 
     # --- UPDATED System Prompt ---
     def _build_system_prompt(self):
+        # Static role part first (built once per role), then what changes per user and per request
         visitor_context = self._get_relevant_visitors_context()
-        prompt = f"""
-        You are a helpful assistant for a community management app. The user is '{self.user.username}', who has the role of '{self.user.role}'.
-        Based on the user's request and the visitor list, decide which action(s) to call.
-        - You can create *multiple* visitor passes at once (e.g., for a family).
-        - You can list visitors by status (pending, approved, etc.).
-        - You can combine actions (e.g., create a visitor and then approve them if the user asks).
-        - Always use the visitor ID for approving or denying.
-        - If a visitor name is ambiguous (e.g., 'approve Ramesh' when there are two), ask for the ID.
-
-        {visitor_context}
-
-        After you call function(s) and get the result, formulate a single, concise, natural language confirmation for the user.
-        If no function call is needed, just provide a brief, helpful conversational response.
-        """
-        return prompt
+        return f"{get_role_prompt(self.user.role)}The user is '{self.user.username}'.\n{visitor_context}"
 
     # --- (HELPER) Basic Time Parser (Unchanged) ---
     def _parse_time_details(self, time_details):
@@ -183,27 +265,23 @@ class AICopilotService:
              return json.dumps({"status": "error", "message": "Visitor name list is required."})
         if self.user.role != CustomUser.Role.RESIDENT:
             return json.dumps({"status": "error", "message": "Permission Denied: Only residents can create visitors."})
-        if not self.user.household:
+        if not self.user.household_id:
              return json.dumps({"status": "error", "message": "Cannot create visitor: You are not associated with a household."})
 
         scheduled_dt, time_parse_message = self._parse_time_details(time_details)
         
-        created_visitors = []
+        # Skip empty names in list
+        passes = [
+            {'name': name, 'purpose': purpose or "Guest", 'scheduled_time': scheduled_dt}
+            for name in names if name
+        ]
+        if not passes:
+            return json.dumps({"status": "error", "message": "No valid visitor names were provided."})
+
         try:
-            for name in names:
-                if not name: continue # Skip empty names in list
-                visitor = Visitor.objects.create(
-                    name=name,
-                    purpose=purpose or "Guest",
-                    host_household=self.user.household,
-                    status=Visitor.Status.PENDING,
-                    scheduled_time=scheduled_dt
-                )
-                self._log_event(Event.EventType.VISITOR_CREATED, self.user, visitor)
-                created_visitors.append(f"'{visitor.name}' (ID {visitor.id})")
-            
-            if not created_visitors:
-                return json.dumps({"status": "error", "message": "No valid visitor names were provided."})
+            # Same bulk path as POST /api/visitors/bulk/: constant queries for any party size
+            visitors = create_visitor_passes(self.user, passes)
+            created_visitors = [f"'{visitor.name}' (ID {visitor.id})" for visitor in visitors]
 
             return json.dumps({
                 "status": "success",
@@ -214,23 +292,25 @@ class AICopilotService:
             return json.dumps({"status": "error", "message": f"Database error creating visitors: {e}"})
 
     # --- UPDATED list_my_visitors Method ---
-    def _list_my_visitors(self, status=None):
+    def _list_visitors_query(self, status=None):
+        """(queryset, None) for the resident's visitors, or (None, error JSON)."""
         if self.user.role != CustomUser.Role.RESIDENT:
-            return json.dumps({"status": "error", "message": "Permission Denied: Only residents can list their visitors."})
-        if not self.user.household:
-             return json.dumps({"status": "error", "message": "Cannot list visitors: You are not associated with a household."})
+            return None, json.dumps({"status": "error", "message": "Permission Denied: Only residents can list their visitors."})
+        if not self.user.household_id:
+             return None, json.dumps({"status": "error", "message": "Cannot list visitors: You are not associated with a household."})
 
         # Base query
-        visitor_query = Visitor.objects.filter(host_household=self.user.household)
+        visitor_query = Visitor.objects.filter(host_household_id=self.user.household_id)
 
         # Apply status filter if provided and valid
         valid_statuses = ["PENDING", "APPROVED", "CHECKED_IN", "CHECKED_OUT", "DENIED"]
         if status and status in valid_statuses:
             visitor_query = visitor_query.filter(status=status)
         
-        visitors = visitor_query.order_by('-created_at')[:20] # Limit results
+        return visitor_query.order_by('-created_at')[:20], None # Limit results
 
-        if not visitors.exists():
+    def _format_visitor_list(self, visitors, status=None):
+        if not visitors:
             filter_text = f" with status '{status}'" if status and status != 'ALL' else ""
             return json.dumps({"status": "success", "visitor_list_text": f"You have no visitors{filter_text}."})
 
@@ -241,139 +321,454 @@ class AICopilotService:
 
         # Return the list as a string payload
         return json.dumps({"status": "success", "visitor_list_text": visitor_list_str})
+
+    def _list_my_visitors(self, status=None):
+        visitors, error = self._list_visitors_query(status)
+        if error:
+            return error
+        return self._format_visitor_list(list(visitors), status)
+
+    async def _alist_my_visitors(self, status=None):
+        visitors, error = self._list_visitors_query(status)
+        if error:
+            return error
+        return self._format_visitor_list([v async for v in visitors], status)
         
-    # --- (approve, deny, checkin methods remain the same) ---
+    # --- approve, deny, checkin: same engine as the REST actions (api/transitions.py) ---
+    def _run_transition(self, name, visitor_id, payload=None):
+        try:
+            visitor = transitions.transition(name, visitor_id, self.user, payload)
+        except transitions.TransitionError as e:
+            if e.code == 'conflict':
+                message = f"Visitor {e.visitor['name']} is already {e.visitor['status']}."
+            else:
+                message = e.message
+            return json.dumps({"status": "error", "message": message})
+        verb = transitions.TRANSITIONS[name]['verb']
+        return json.dumps({"status": "success", "message": f"Visitor {visitor.name} (ID: {visitor.id}) {verb}."})
+
     def _approve_visitor(self, visitor_id):
-        try: visitor = Visitor.objects.get(id=int(visitor_id))
-        except (Visitor.DoesNotExist, ValueError, TypeError): return json.dumps({"status": "error", "message": "Visitor not found."})
-        if self.user.role not in [CustomUser.Role.RESIDENT, CustomUser.Role.ADMIN]: return json.dumps({"status": "error", "message": "Permission denied."})
-        if (self.user.role == CustomUser.Role.RESIDENT and visitor.host_household != self.user.household): return json.dumps({"status": "error", "message": "Permission denied: Not your visitor."})
-        if visitor.status != Visitor.Status.PENDING: return json.dumps({"status": "error", "message": f"Visitor {visitor.name} is already {visitor.status}."})
-        visitor.status = Visitor.Status.APPROVED
-        visitor.approved_by = self.user
-        visitor.approved_at = timezone.now()
-        visitor.save()
-        self._log_event(Event.EventType.VISITOR_APPROVED, self.user, visitor)
-        return json.dumps({"status": "success", "message": f"Visitor {visitor.name} (ID: {visitor.id}) approved."})
+        return self._run_transition('approve', visitor_id)
 
     def _deny_visitor(self, visitor_id, reason="Denied by AI Copilot"):
-        try: visitor = Visitor.objects.get(id=int(visitor_id))
-        except (Visitor.DoesNotExist, ValueError, TypeError): return json.dumps({"status": "error", "message": "Visitor not found."})
-        if self.user.role not in [CustomUser.Role.RESIDENT, CustomUser.Role.ADMIN]: return json.dumps({"status": "error", "message": "Permission denied."})
-        if (self.user.role == CustomUser.Role.RESIDENT and visitor.host_household != self.user.household): return json.dumps({"status": "error", "message": "Permission denied: Not your visitor."})
-        if visitor.status != Visitor.Status.PENDING: return json.dumps({"status": "error", "message": f"Visitor {visitor.name} is already {visitor.status}."})
-        visitor.status = Visitor.Status.DENIED
-        visitor.save()
-        self._log_event(Event.EventType.VISITOR_DENIED, self.user, visitor, {'reason': reason})
-        return json.dumps({"status": "success", "message": f"Visitor {visitor.name} (ID: {visitor.id}) denied."})
+        return self._run_transition('deny', visitor_id, {'reason': reason or "Denied by AI Copilot"})
 
     def _checkin_visitor(self, visitor_id):
-        try: visitor = Visitor.objects.get(id=int(visitor_id))
-        except (Visitor.DoesNotExist, ValueError, TypeError): return json.dumps({"status": "error", "message": "Visitor not found."})
-        if self.user.role not in [CustomUser.Role.GUARD, CustomUser.Role.ADMIN]: return json.dumps({"status": "error", "message": "Permission denied."})
-        if visitor.status != Visitor.Status.APPROVED: return json.dumps({"status": "error", "message": f"Visitor {visitor.name} must be APPROVED to check in."})
-        visitor.status = Visitor.Status.CHECKED_IN
-        visitor.checked_in_at = timezone.now()
-        visitor.checked_in_by = self.user
-        visitor.save()
-        self._log_event(Event.EventType.VISITOR_CHECKIN, self.user, visitor)
-        return json.dumps({"status": "success", "message": f"Visitor {visitor.name} (ID: {visitor.id}) checked in."})
-
-
-    # --- UPDATED process_message Method ---
-    def process_message(self, history: list):
-        if not self.model: return "Error: AI Model not initialized."
-        
+        return self._run_transition('checkin', visitor_id)
+
+
+    def _log_usage(self, label, response):
+        usage = getattr(response, 'usage_metadata', None)
+        if usage:
+            copilot_metrics.incr('prompt_tokens', usage.prompt_token_count)
+            copilot_metrics.incr('output_tokens', usage.candidates_token_count)
+            print(f"Gemini {label}: {usage.prompt_token_count} prompt + "
+                  f"{usage.candidates_token_count} response tokens")
+
+    # --- Prompt + history shared by the blocking and streaming paths ---
+    def _build_contents(self, history):
+        from vertexai.generative_models import Content, Part
+
         system_prompt = self._build_system_prompt()
+
+        # Keep the recent turns verbatim within the token budget, summarize the rest
+        recent, summary, stats = chat_history.fit_history(history)
+        if summary:
+            system_prompt += f"\nSummary of the earlier conversation:\n{summary}\n"
+        system_tokens = chat_history.estimate_tokens(system_prompt)
+        print(f"Copilot prompt ~{system_tokens + stats['recent_tokens']} tokens: "
+              f"system+context ~{system_tokens}, {stats['recent']}/{stats['messages']} message(s) verbatim "
+              f"~{stats['recent_tokens']}, {stats['summarized']} summarized into ~{stats['summary_tokens']}")
+
         gemini_history = []
-        for msg in history:
-            role = msg.get('role', 'user')
-            text = msg.get('text', '')
-            if text:
-                 try: gemini_history.append(Content(role=role, parts=[Part.from_text(text)]))
-                 except Exception as e: print(f"Warning: Skipping invalid history message: {e}")
-        
-        final_contents = [
+        for msg in recent:
+            try: gemini_history.append(Content(role=msg['role'], parts=[Part.from_text(msg['text'])]))
+            except Exception as e: print(f"Warning: Skipping invalid history message: {e}")
+
+        return [
             Content(role="user", parts=[Part.from_text(system_prompt)]),
             Content(role="model", parts=[Part.from_text("Okay, I'm ready. How can I assist with visitors?")]),
             *gemini_history
         ]
 
+    def _handler_args(self, function_name, function_args):
+        """(tool, kwargs) for a call, or (None, None) if no such tool is registered."""
+        tool = TOOLS.get(function_name)
+        if tool is None:
+            return None, None
+        return tool, {arg: function_args.get(arg) for arg in tool['args']}
+
+    def _unknown_tool(self, function_name):
+        return json.dumps({"status":"error", "message": f"Unknown function requested: {function_name}"})
+
+    def _dispatch(self, function_name, function_args):
+        """Run one tool by name; returns its JSON string result."""
+        tool, kwargs = self._handler_args(function_name, function_args)
+        if tool is None:
+            return self._unknown_tool(function_name)
+        return getattr(self, tool['handler'])(**kwargs)
+
+    def _tool_result(self, api_response_content_str):
+        print(f"Function result: {api_response_content_str}")
+        try: result = json.loads(api_response_content_str)
+        except json.JSONDecodeError: result = {"status": "error", "message": "Internal function returned invalid format."}
+        # An error (e.g. Permission Denied) may not hold next time, even for a read-only tool
+        if not isinstance(result, dict) or result.get('status') == 'error':
+            self._cacheable = False
+        return result
+
+    def _tool_failed(self, function_call, e):
+        # One failing call must not sink the other calls of the turn
+        self._cacheable = False
+        print(f"Error executing {function_call.name}: {e}")
+        traceback.print_exc()
+        return {"status": "error", "message": f"Could not complete {function_call.name}."}
+
+    def _note_tool(self, function_name):
+        # Never cache a turn that may have changed something
+        if not TOOLS.get(function_name, {}).get('read_only'):
+            self._cacheable = False
+
+    def _call_tool(self, function_call):
+        """Run one function call from Gemini; returns its result dict."""
+        function_args = dict(function_call.args)
+        print(f"Executing: {function_call.name} with args: {function_args}")
+        self._note_tool(function_call.name)
         try:
-            # --- 1. Call Gemini ---
-            response = self.model.generate_content(final_contents, tools=[GEMINI_TOOL])
-            candidate = response.candidates[0]
-            
-            # --- 2. Check for Function Calls Safely ---
-            function_calls = [
-                part.function_call for part in candidate.content.parts
-                if hasattr(part, 'function_call') and part.function_call is not None and getattr(part.function_call, 'name', None)
-            ]
+            return self._tool_result(self._dispatch(function_call.name, function_args))
+        except Exception as e:
+            return self._tool_failed(function_call, e)
+
+    async def _acall_tool(self, function_call):
+        """_call_tool for the async path: tools with an async_handler use the async ORM."""
+        function_args = dict(function_call.args)
+        print(f"Executing: {function_call.name} with args: {function_args}")
+        self._note_tool(function_call.name)
+        tool, kwargs = self._handler_args(function_call.name, function_args)
+        try:
+            if tool is None:
+                content = self._unknown_tool(function_call.name)
+            elif 'async_handler' in tool:
+                content = await getattr(self, tool['async_handler'])(**kwargs)
+            else:
+                # Writes run inside transaction.atomic, which the async ORM can't open
+                content = await tool_runner.run_sync(self._dispatch, function_call.name, function_args)
+        except Exception as e:
+            return self._tool_failed(function_call, e)
+        return self._tool_result(content)
+
+    def _fallback_summary(self, results):
+        # If Gemini returns no text after the tools ran, summarize them ourselves
+        success_messages = [r.get('message', '') for r in results if r.get('status') == 'success']
+        if success_messages:
+            return "Done. " + " ".join(success_messages)
+        return "Actions completed, but AI provided no final summary."
+
+    @staticmethod
+    def _visitor_key(function_call):
+        # Calls on the same visitor run in order; everything else may overlap (see api/tool_runner.py)
+        visitor_id = dict(function_call.args).get('visitor_id')
+        return str(visitor_id).strip() if visitor_id is not None else None
+
+    @staticmethod
+    def _function_calls(parts):
+        return [
+            part.function_call for part in parts
+            if hasattr(part, 'function_call') and part.function_call is not None and getattr(part.function_call, 'name', None)
+        ]
 
-            if function_calls:
-                print(f"Gemini wants to call {len(function_calls)} tool(s).")
-                function_responses_for_gemini = []
-                
-                # --- 3. Execute ALL function calls ---
-                for function_call in function_calls:
-                    function_name = function_call.name
-                    function_args = dict(function_call.args)
-                    print(f"Executing: {function_name} with args: {function_args}")
-
-                    api_response_content_str = "" # Default
-                    if function_name == "create_visitor":
-                         api_response_content_str = self._create_visitor(
-                             names=function_args.get("names"), # Pass list
-                             purpose=function_args.get("purpose"),
-                             time_details=function_args.get("time_details")
-                         )
-                    elif function_name == "list_my_visitors":
-                         api_response_content_str = self._list_my_visitors(
-                             status=function_args.get("status") # Pass status
-                         )
-                    elif function_name == "approve_visitor":
-                        api_response_content_str = self._approve_visitor(visitor_id=function_args.get("visitor_id"))
-                    elif function_name == "deny_visitor":
-                         api_response_content_str = self._deny_visitor(visitor_id=function_args.get("visitor_id"), reason=function_args.get("reason"))
-                    elif function_name == "checkin_visitor":
-                         api_response_content_str = self._checkin_visitor(visitor_id=function_args.get("visitor_id"))
-                    else:
-                        api_response_content_str = json.dumps({"status":"error", "message": f"Unknown function requested: {function_name}"})
-                    
-                    print(f"Function result: {api_response_content_str}")
-
-                    try: api_response_dict = json.loads(api_response_content_str)
-                    except json.JSONDecodeError: api_response_dict = {"status": "error", "message": "Internal function returned invalid format."}
-                    
-                    function_responses_for_gemini.append(
-                        Part.from_function_response(name=function_name, response=api_response_dict)
-                    )
-                
-                # --- 4. Send ALL Function Results back to Gemini for a final summary ---
-                function_response_content = Content(role="function", parts=function_responses_for_gemini)
-                history_for_final_call = [*final_contents, candidate.content, function_response_content]
+    def _function_response_content(self, function_calls, results):
+        from vertexai.generative_models import Content, Part
 
-                response = self.model.generate_content(history_for_final_call) # No tools needed here
+        return Content(role="function", parts=[
+            Part.from_function_response(name=function_call.name, response=result)
+            for function_call, result in zip(function_calls, results)
+        ])
 
-                # --- 5. Return Gemini's final natural language response ---
-                if response.candidates and response.candidates[0].content.parts and response.candidates[0].content.parts[0].text:
-                     return response.candidates[0].content.parts[0].text
-                else:
-                     # If Gemini returns no text, create a default summary
-                     success_messages = [json.loads(p.function_response.response['content']).get('message', '') 
-                                         for p in function_responses_for_gemini 
-                                         if json.loads(p.function_response.response['content']).get('status') == 'success']
-                     if success_messages:
-                         return "Done. " + " ".join(success_messages)
-                     return "Actions completed, but AI provided no final summary."
-
-            elif candidate.content.parts and candidate.content.parts[0].text:
-                # --- 6. No function call, just return the initial text response ---
-                return candidate.content.parts[0].text
+    def _render_locally(self, function_calls, results):
+        """
+        The reply built from the tools' templates, or None when Gemini has
+        to phrase it: a call failed, or a tool has no template.
+        """
+        lines = []
+        for function_call, result in zip(function_calls, results):
+            template = TOOLS.get(function_call.name, {}).get('template')
+            if template is None or result.get('status') != 'success':
+                return None
+            try:
+                lines.append(template.format(**result).strip())
+            except (KeyError, IndexError):
+                return None
+        return "\n".join(lines)
+
+    def _try_local_reply(self, function_calls, results):
+        """Record a tool turn; returns the local reply if the summary call can be skipped."""
+        copilot_metrics.incr('tool_calls', len(function_calls))
+        local_reply = self._render_locally(function_calls, results)
+        if local_reply is not None:
+            copilot_metrics.incr('summary_calls_avoided')
+            print("Tool results rendered locally; skipped the summary call.")
+        else:
+            copilot_metrics.incr('summary_calls')
+            copilot_metrics.incr('llm_calls')
+        return local_reply
+
+    # --- Fast path: terse commands run without Gemini (see api/intents.py) ---
+    def _match_fast_path(self, history):
+        """Tool calls if the newest message is a terse command, else None."""
+        last = history[-1] if history else None
+        if not isinstance(last, dict) or last.get('role') == 'model' or not isinstance(last.get('text'), str):
+            return None
+        calls = intents.match(last['text'], allowed=tools_for_role(self.user.role))
+        copilot_metrics.incr('fast_path_hits' if calls else 'fast_path_misses')
+        return calls
+
+    def _fast_path_reply(self, calls, results, started):
+        lines = []
+        for call, result in zip(calls, results):
+            if result.get('status') == 'success':
+                lines.append(TOOLS[call.name]['template'].format(**result).strip())
             else:
-                 return "I received a response, but couldn't understand its format."
+                lines.append(result.get('message') or f"Could not complete {call.name}.")
+        elapsed = time.perf_counter() - started
+        copilot_metrics.incr('turns')
+        copilot_metrics.incr('tool_calls', len(calls))
+        copilot_metrics.incr('fast_path_seconds', elapsed)
+        print(f"Fast path: {', '.join(call.name for call in calls)} in {elapsed * 1000:.1f} ms (no Gemini call)")
+        return "\n".join(lines)
+
+    # --- Response cache: repeated read-only questions skip Gemini and the DB (see api/copilot_cache.py) ---
+    def _cached_reply(self, key):
+        reply = copilot_cache.get_response(key)
+        copilot_metrics.incr('response_cache_hits' if reply is not None else 'response_cache_misses')
+        if reply is not None:
+            print("Copilot reply served from the response cache.")
+        return reply
+
+    def _store_reply(self, key, reply):
+        if self._cacheable:
+            copilot_cache.put_response(key, reply)
+
+    def process_message(self, history: list):
+        key = copilot_cache.response_key(self.user, history)
+        reply = self._cached_reply(key)
+        if reply is None:
+            reply = self._process_message(history)
+            self._store_reply(key, reply)
+        return reply
+
+    async def aprocess_message(self, history: list):
+        """
+        Same turn as process_message, without holding a thread while
+        Gemini works: both calls go through the SDK's async API, and the
+        tools' DB work runs on the async ORM or briefly in a sync thread.
+        """
+        key = await sync_to_async(copilot_cache.response_key)(self.user, history)
+        reply = self._cached_reply(key)
+        if reply is None:
+            reply = await self._aprocess_message(history)
+            self._store_reply(key, reply)
+        return reply
+
+    def stream_message(self, history: list):
+        """
+        Same turn as process_message, as a generator of events for SSE:
+        {'event': 'token', 'text'} as the model writes, {'event': 'tool',
+        'name', 'message'} before each function call runs, then
+        {'event': 'done', 'reply'} with the full text (or {'event': 'error'}).
+        """
+        key = copilot_cache.response_key(self.user, history)
+        reply = self._cached_reply(key)
+        if reply is not None:
+            yield {'event': 'token', 'text': reply}
+            yield {'event': 'done', 'reply': reply}
+            return
+        for event in self._turn_events(history, stream=True):
+            if event['event'] == 'done':
+                self._store_reply(key, event['reply'])
+            yield event
+
+    # --- The turn itself, shared by the sync, async and streaming entry points ---
+    def _read_chunks(self, chunks, label):
+        """
+        Read one generate_content response (a single response, or the chunks
+        of a streamed one). Yields ('text', str) per text part, then
+        ('parts', [...]) with the function-call parts seen.
+        """
+        calls = []
+        last_chunk = None
+        for chunk in chunks:
+            last_chunk = chunk
+            if not chunk.candidates:
+                continue
+            for part in chunk.candidates[0].content.parts:
+                if self._function_calls([part]):
+                    calls.append(part)
+                else:
+                    text = getattr(part, 'text', '')
+                    if text:
+                        yield 'text', text
+        if last_chunk is not None:
+            self._log_usage(label, last_chunk)
+        yield 'parts', calls
+
+    def _turn(self, history: list):
+        """
+        One copilot turn, as a generator that never does I/O itself. It yields
+        the client events of stream_message ('token', 'tool', 'done', 'error')
+        and these requests, which its driver answers with .send() (or .throw()):
+            {'event': 'model'}                                  -> the model, or None
+            {'event': 'contents', 'history'}                    -> _build_contents(history)
+            {'event': 'generate', 'contents', 'label', 'tools'} -> response chunks
+            {'event': 'run_tools', 'calls'}                     -> results, in call order
+        """
+        from vertexai.generative_models import Content
+
+        started = time.perf_counter()
+        calls = self._match_fast_path(history)
+        if calls:
+            for call in calls:
+                yield {'event': 'tool', 'name': call.name, 'message': f"Running {call.name}…"}
+            results = yield {'event': 'run_tools', 'calls': calls}
+            reply = self._fast_path_reply(calls, results, started)
+            yield {'event': 'token', 'text': reply}
+            yield {'event': 'done', 'reply': reply}
+            return
+
+        if not (yield {'event': 'model'}):
+            self._cacheable = False
+            yield {'event': 'error', 'message': "Error: AI Model not initialized."}
+            return
+
+        final_contents = yield {'event': 'contents', 'history': history}
+        copilot_metrics.incr('turns')
+        reply = []
+        try:
+            # --- 1. First call: text goes straight out; function calls are collected ---
+            copilot_metrics.incr('llm_calls')
+            chunks = yield {
+                'event': 'generate', 'contents': final_contents, 'label': "first call",
+                'tools': [get_gemini_tool(self.user.role)],
+            }
+            call_parts = []
+            for kind, value in self._read_chunks(chunks, "first call"):
+                if kind == 'text':
+                    reply.append(value)
+                    yield {'event': 'token', 'text': value}
+                else:
+                    call_parts = value
+
+            if call_parts:
+                # --- 2. Run the tools (concurrently, per-visitor order kept), saying which one is running ---
+                function_calls = self._function_calls(call_parts)
+                print(f"Gemini wants to call {len(function_calls)} tool(s).")
+                for function_call in function_calls:
+                    yield {'event': 'tool', 'name': function_call.name, 'message': f"Running {function_call.name}…"}
+                results = yield {'event': 'run_tools', 'calls': function_calls}
+
+                # --- 3. Plain successes of templated tools need no second round trip ---
+                local_reply = self._try_local_reply(function_calls, results)
+
+                # Any text from the first call stays; the summary starts a new paragraph
+                separator = "\n\n" if reply else ""
+                summary = []
+                if local_reply is not None:
+                    summary = [separator + local_reply]
+                    yield {'event': 'token', 'text': summary[0]}
+                else:
+                    # --- 4. Otherwise send the results back to Gemini for the final summary ---
+                    function_response_content = self._function_response_content(function_calls, results)
+                    history_for_final_call = [
+                        *final_contents, Content(role="model", parts=call_parts), function_response_content
+                    ]
+                    chunks = yield {
+                        'event': 'generate', 'contents': history_for_final_call, 'label': "summary call", 'tools': None,
+                    }
+                    for kind, value in self._read_chunks(chunks, "summary call"):
+                        if kind == 'text':
+                            if not summary:
+                                value = separator + value
+                            summary.append(value)
+                            yield {'event': 'token', 'text': value}
+                if not summary:
+                    # If Gemini returns no text, summarize the tools ourselves
+                    summary = [separator + self._fallback_summary(results)]
+                    yield {'event': 'token', 'text': summary[0]}
+                reply.extend(summary)
+            elif not reply:
+                self._cacheable = False
+                reply = ["I received a response, but couldn't understand its format."]
+                yield {'event': 'token', 'text': reply[0]}
+
+            yield {'event': 'done', 'reply': ''.join(reply)}
 
         except Exception as e:
+            self._cacheable = False
             print(f"Error during AI processing: {e}")
             traceback.print_exc()
-            return f"Sorry, there was an error processing your request with the AI model."
\ No newline at end of file
+            yield {'event': 'error', 'message': "Sorry, there was an error processing your request with the AI model."}
+
+    @staticmethod
+    def _final_reply(event):
+        """The reply a non-streaming caller gets for a 'done' or 'error' event, else None."""
+        if event['event'] == 'done':
+            return event['reply']
+        if event['event'] == 'error':
+            return event['message']
+        return None
+
+    def _turn_events(self, history: list, stream=False):
+        """Drive _turn on this thread, yielding its client events; `stream` streams the Gemini calls."""
+        turn = self._turn(history)
+        step, value = turn.send, None
+        while True:
+            try:
+                event = step(value)
+            except StopIteration:
+                return
+            step, value = turn.send, None
+            try:
+                if event['event'] == 'model':
+                    value = self.model
+                elif event['event'] == 'contents':
+                    value = self._build_contents(event['history'])
+                elif event['event'] == 'generate':
+                    response = self.model.generate_content(event['contents'], stream=stream, tools=event['tools'])
+                    value = response if stream else [response]
+                elif event['event'] == 'run_tools':
+                    value = tool_runner.run(event['calls'], self._call_tool, self._visitor_key)
+                else:
+                    yield event
+            except Exception as e:
+                step, value = turn.throw, e
+
+    def _process_message(self, history: list):
+        for event in self._turn_events(history):
+            reply = self._final_reply(event)
+            if reply is not None:
+                return reply
+
+    # --- Async driver (ChatbotView under asgi.py) ---
+    async def _aprocess_message(self, history: list):
+        turn = self._turn(history)
+        step, value = turn.send, None
+        while True:
+            event = step(value)
+            step, value = turn.send, None
+            try:
+                if event['event'] == 'model':
+                    # Only blocks on the first call in a process (see api/llm.py)
+                    value = await sync_to_async(lambda: self.model, thread_sensitive=False)()
+                elif event['event'] == 'contents':
+                    value = await sync_to_async(self._build_contents)(event['history'])
+                elif event['event'] == 'generate':
+                    value = [await self.model.generate_content_async(event['contents'], tools=event['tools'])]
+                elif event['event'] == 'run_tools':
+                    value = await tool_runner.arun(event['calls'], self._acall_tool, self._visitor_key)
+                else:
+                    reply = self._final_reply(event)
+                    if reply is not None:
+                        turn.close()
+                        return reply
+            except Exception as e:
+                step, value = turn.throw, e
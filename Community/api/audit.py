@@ -0,0 +1,60 @@
+# Community/api/audit.py
+"""
+Transactional audit recording shared by the REST API and the AI copilot.
+"""
+from django.db import transaction
+
+from . import changefeed
+from .models import Event
+
+
+class EventRecorder:
+    """
+    Collects the audit events of one unit of work and writes them with a
+    single bulk_create when the block exits, inside the same transaction
+    as the changes they describe:
+
+        with EventRecorder() as audit:
+            visitor.save()
+            audit.record(Event.EventType.VISITOR_APPROVED, user, visitor)
+
+    If anything in the block fails, the visitor changes and their events
+    roll back together, so the audit log never disagrees with visitor state.
+    """
+
+    def __init__(self):
+        self.events = []
+        self._atomic = None
+
+    def record(self, type, actor, visitor=None, payload=None, subject_user=None):
+        event = Event(
+            type=type,
+            actor=actor,
+            subject_visitor=visitor,
+            subject_user=subject_user,
+            payload=payload or {}
+        )
+        self.events.append(event)
+        return event
+
+    def flush(self):
+        """Write collected events now (one INSERT) and publish them to the change feed."""
+        if not self.events:
+            return
+        events, self.events = self.events, []
+        Event.objects.bulk_create(events)
+        changefeed.publish_events(events)
+
+    def __enter__(self):
+        self._atomic = transaction.atomic()
+        self._atomic.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            try:
+                self.flush()
+            except Exception as e:
+                self._atomic.__exit__(type(e), e, e.__traceback__)
+                raise
+        return self._atomic.__exit__(exc_type, exc_value, traceback)
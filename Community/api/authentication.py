@@ -0,0 +1,98 @@
+# Community/api/authentication.py
+"""
+JWT authentication without a user lookup per request.
+
+The access token already carries `username`, `role` and `household_id`
+(see MyTokenObtainPairSerializer), so the request user is built straight
+from the verified claims. To keep role edits and deactivations prompt,
+each user's current role/household/active flag is cached for
+AUTH_STATE_CACHE_SECONDS and wins over the claims: a dashboard polling
+every few seconds costs at most one small query per user per TTL, and
+UserViewSet drops the cached state as soon as it edits a user.
+
+The state lives in the AUTH_STATE_CACHE cache. With Django's default
+per-process LocMemCache, that drop only reaches the worker process that
+made the edit; the other workers keep serving the old state for up to
+AUTH_STATE_CACHE_SECONDS. Point AUTH_STATE_CACHE at a shared cache
+(Redis, Memcached) to make edits apply everywhere on the next request.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import exceptions
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import CustomUser
+
+MISSING = 'missing'
+
+
+def _state_key(user_id):
+    return f'auth:user-state:{user_id}'
+
+
+def _cache():
+    return caches[settings.AUTH_STATE_CACHE]
+
+
+def get_user_state(user_id):
+    """
+    Current {'role', 'household_id', 'is_active'} of a user (MISSING if the
+    user was deleted), cached for AUTH_STATE_CACHE_SECONDS.
+    """
+    key = _state_key(user_id)
+    cache = _cache()
+    state = cache.get(key)
+    if state is None:
+        state = (
+            CustomUser.objects.filter(id=user_id)
+            .values('role', 'household_id', 'is_active')
+            .first()
+        ) or MISSING
+        cache.set(key, state, settings.AUTH_STATE_CACHE_SECONDS)
+    return state
+
+
+def forget_user_state(user_id):
+    """
+    Make the next request of this user re-read its role/household/active
+    flag. Only as wide as AUTH_STATE_CACHE: with a per-process cache, other
+    workers pick the change up when their copy expires.
+    """
+    _cache().delete(_state_key(user_id))
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    Drop-in for simplejwt's JWTAuthentication that returns a CustomUser
+    built from the token claims and the cached user state instead of
+    loading the row. The object carries id, username, role, household_id
+    and is_active (enough for permissions, role filters and audit FKs);
+    `user.household` is loaded lazily when something needs the instance.
+    It is never saved: the other columns are not loaded.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = int(validated_token[api_settings.USER_ID_CLAIM])
+        except (KeyError, TypeError, ValueError):
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        state = get_user_state(user_id)
+        if state == MISSING:
+            raise exceptions.AuthenticationFailed('User not found', code='user_not_found')
+        if not state['is_active']:
+            raise exceptions.AuthenticationFailed('User is inactive', code='user_inactive')
+
+        user = CustomUser(
+            id=user_id,
+            username=validated_token.get('username', ''),
+            role=state['role'],
+            household_id=state['household_id'],
+            is_active=True,
+        )
+        # Behave like a row loaded from the database (e.g. for FK assignment)
+        user._state.adding = False
+        user._state.db = CustomUser.objects.db
+        return user
@@ -0,0 +1,246 @@
+# Community/api/changefeed.py
+"""
+Role-scoped change feed for the dashboards.
+
+Every audit event written for a visitor is turned into a small "change"
+record and published once its transaction commits. Connected clients
+either hold an SSE stream open (`/api/changes/stream/`) or long-poll
+`/api/changes/`, so they only do work when something actually changed.
+
+On PostgreSQL the change is sent with NOTIFY inside the writing
+transaction, so it is delivered on commit to every app server process
+(each process runs one LISTEN thread that feeds its local bus). On other
+databases the change is published to the in-process bus on commit.
+Cursors are audit event ids, so they agree across processes.
+"""
+import asyncio
+import collections
+import json
+import select
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+
+from .models import CustomUser, Event
+
+PG_CHANNEL = 'visitor_changes'
+
+
+class ChangeBus:
+    """
+    In-process buffer of recent changes, in the order their transactions
+    committed. A change's cursor is its audit event id: a database
+    sequence, so a cursor means the same thing in every process and a
+    client can resume on whichever worker serves its next request.
+    Waiters (SSE streams / long-polls) are woken on publish.
+    """
+
+    def __init__(self, maxlen):
+        self._lock = threading.Lock()
+        self._maxlen = maxlen
+        self._changes = collections.deque()  # (arrival number, change)
+        self._positions = {}  # cursor -> arrival number, for buffered changes
+        self._arrivals = 0
+        self._cursor = 0  # Highest cursor seen
+        self._floor = 0  # Changes at or below this may be missing from the buffer
+        self._household_versions = {}
+        self._waiters = set()
+
+    @property
+    def cursor(self):
+        return self._cursor
+
+    def start_at(self, cursor):
+        """Everything up to `cursor` was committed before this process started listening."""
+        with self._lock:
+            self._floor = max(self._floor, cursor)
+            self._cursor = max(self._cursor, cursor)
+
+    def scope_version(self, household_id=None):
+        """
+        Local counter of changes to visitors of `household_id` (or to any
+        visitor). Moves whenever something in that scope changes, so it
+        can key this process's caches of scope-derived data.
+        """
+        if household_id is None:
+            return self._arrivals
+        return self._household_versions.get(household_id, 0)
+
+    def publish(self, change):
+        with self._lock:
+            cursor = change['event_id']
+            self._arrivals += 1
+            change = {**change, 'cursor': cursor}
+            if len(self._changes) >= self._maxlen:
+                arrival, evicted = self._changes.popleft()
+                if self._positions.get(evicted['cursor']) == arrival:
+                    del self._positions[evicted['cursor']]
+                self._floor = max(self._floor, evicted['cursor'])
+            self._changes.append((self._arrivals, change))
+            self._positions[cursor] = self._arrivals
+            self._cursor = max(self._cursor, cursor)
+            visitor = change.get('visitor')
+            if visitor:
+                self._household_versions[visitor['host_household_id']] = self._arrivals
+            waiters = list(self._waiters)
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+        return change
+
+    def _after(self, cursor):
+        # Event ids are taken when rows are written but arrive in commit order, so a
+        # lower id can come after `cursor`. If its change is still buffered, "newer"
+        # means "arrived later"; otherwise fall back to comparing ids.
+        position = self._positions.get(cursor)
+        if position is not None:
+            return [change for arrival, change in self._changes if arrival > position]
+        if cursor < self._floor:
+            return None
+        return [change for _, change in self._changes if change['cursor'] > cursor]
+
+    def since(self, cursor):
+        """
+        Return (changes after `cursor`, complete). `complete` is False when
+        the client is too far behind for the buffer to cover the gap and it
+        has to refetch its lists. A cursor this process hasn't reached yet
+        (another worker got the change first) simply has nothing newer.
+        """
+        with self._lock:
+            changes = self._after(cursor)
+        if changes is None:
+            return [], False
+        return changes, True
+
+    async def wait(self, cursor, timeout):
+        """Sleep until a change newer than `cursor` is published, or `timeout`."""
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            if self._after(cursor) != []:
+                return
+            self._waiters.add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+
+
+bus = ChangeBus(maxlen=settings.CHANGEFEED_BUFFER_SIZE)
+
+
+# -----------------------------------------------------------
+# Publishing
+# -----------------------------------------------------------
+
+def _uses_pg_notify():
+    return connection.vendor == 'postgresql'
+
+
+def build_change(event):
+    """Compact, JSON-safe description of an audit event and its visitor."""
+    visitor = event.subject_visitor
+    return {
+        'type': event.type,
+        'event_id': event.id,
+        'timestamp': event.timestamp.isoformat(),
+        'actor': str(event.actor) if event.actor_id else None,
+        'visitor': {
+            'id': visitor.id,
+            'name': visitor.name,
+            'status': visitor.status,
+            'host_household_id': visitor.host_household_id,
+        } if visitor else None,
+    }
+
+
+def publish_events(events):
+    """
+    Publish audit events to the feed once the current transaction commits.
+    Called right after the event rows are written; costs at most one
+    statement however many events there are.
+    """
+    changes = [build_change(event) for event in events]
+    if not changes:
+        return
+    if _uses_pg_notify():
+        # NOTIFY is transactional: listeners only see it if we commit.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload',
+                [PG_CHANNEL, [json.dumps(change) for change in changes]],
+            )
+    else:
+        transaction.on_commit(lambda: [bus.publish(change) for change in changes])
+
+
+# -----------------------------------------------------------
+# PostgreSQL LISTEN thread (one per process, started on first subscriber)
+# -----------------------------------------------------------
+
+_listener_lock = threading.Lock()
+_listener_started = False
+_listener_ready = threading.Event()
+
+
+def _listen_forever():
+    wrapper = connections['default']
+    while True:
+        try:
+            conn = wrapper.get_new_connection(wrapper.get_connection_params())
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN {PG_CHANNEL}')
+                # Anything committed before LISTEN (at startup or while reconnecting) was
+                # never seen here; clients whose cursor is older must resync
+                cursor.execute(f'SELECT MAX(id) FROM {Event._meta.db_table}')
+                bus.start_at(cursor.fetchone()[0] or 0)
+            _listener_ready.set()
+            while True:
+                if select.select([conn], [], [], 30) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    bus.publish(json.loads(notify.payload))
+        except Exception as e:
+            print(f"Change feed listener error, reconnecting: {e}")
+            time.sleep(1)
+
+
+def ensure_listener():
+    global _listener_started
+    if _listener_started or not _uses_pg_notify():
+        return
+    with _listener_lock:
+        if not _listener_started:
+            threading.Thread(target=_listen_forever, name='changefeed-listener', daemon=True).start()
+            _listener_started = True
+    # Hand out cursors only once the baseline is known (warmup.warm_worker starts this early)
+    _listener_ready.wait(5)
+
+
+# -----------------------------------------------------------
+# Role scoping
+# -----------------------------------------------------------
+
+def is_visible_to(user, change):
+    """Admins and guards see every visitor change; residents only their household's."""
+    if user.role in [CustomUser.Role.ADMIN, CustomUser.Role.GUARD]:
+        return True
+    if user.role == CustomUser.Role.RESIDENT:
+        visitor = change.get('visitor')
+        return bool(visitor) and visitor['host_household_id'] == user.household_id
+    return False
+
+
+def visible_since(user, cursor):
+    """Return (visible changes after `cursor`, latest cursor, resync)."""
+    changes, complete = bus.since(cursor)
+    if not complete:
+        return [], bus.cursor, True
+    latest = changes[-1]['cursor'] if changes else cursor
+    return [c for c in changes if is_visible_to(user, c)], latest, False
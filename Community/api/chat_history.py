@@ -0,0 +1,87 @@
+# Community/api/chat_history.py
+"""
+Token budgeting for the copilot's conversation history.
+
+The client resends the whole chat every turn. Only the most recent
+messages that fit COPILOT_HISTORY_TOKEN_BUDGET are sent verbatim; older
+ones are collapsed into a short extractive summary (at most
+COPILOT_HISTORY_SUMMARY_TOKENS) that rides along with the system prompt,
+so prompt size stays flat however long the chat gets.
+"""
+from django.conf import settings
+
+# Gemini averages roughly four characters of English per token. An exact
+# count would cost a count_tokens round trip per message.
+CHARS_PER_TOKEN = 4
+SUMMARY_CLIP_CHARS = 160
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _clean(history):
+    messages = []
+    for msg in history:
+        if not isinstance(msg, dict):
+            continue
+        text = msg.get('text', '')
+        if text and isinstance(text, str):
+            messages.append({'role': 'model' if msg.get('role') == 'model' else 'user', 'text': text})
+    return messages
+
+
+def summarize(messages, max_tokens):
+    """Newest-first clipped lines of `messages`, put back in order, within `max_tokens`."""
+    lines = []
+    used = 0
+    for msg in reversed(messages):
+        text = ' '.join(msg['text'].split())
+        if len(text) > SUMMARY_CLIP_CHARS:
+            text = text[:SUMMARY_CLIP_CHARS - 1] + '…'
+        line = f"{'User' if msg['role'] == 'user' else 'Assistant'}: {text}"
+        cost = estimate_tokens(line)
+        if used + cost > max_tokens:
+            break
+        lines.append(line)
+        used += cost
+    dropped = len(messages) - len(lines)
+    if dropped:
+        lines.append(f"({dropped} earlier message(s) omitted)")
+    return '\n'.join(reversed(lines))
+
+
+def fit_history(history, budget=None, summary_tokens=None):
+    """
+    Split the client's history into (recent, summary, stats).
+    `recent` is the newest messages that fit `budget`, starting on a user
+    turn (the newest message is always kept); `summary` condenses the
+    rest ('' if nothing was dropped).
+    """
+    budget = settings.COPILOT_HISTORY_TOKEN_BUDGET if budget is None else budget
+    summary_tokens = settings.COPILOT_HISTORY_SUMMARY_TOKENS if summary_tokens is None else summary_tokens
+    messages = _clean(history)
+
+    start = len(messages)
+    used = 0
+    for i in range(len(messages) - 1, -1, -1):
+        cost = estimate_tokens(messages[i]['text'])
+        if used + cost > budget and start < len(messages):
+            break
+        used += cost
+        start = i
+    # The verbatim window must open with a user turn
+    while start < len(messages) - 1 and messages[start]['role'] != 'user':
+        used -= estimate_tokens(messages[start]['text'])
+        start += 1
+
+    older, recent = messages[:start], messages[start:]
+    summary = summarize(older, summary_tokens) if older else ''
+    stats = {
+        'messages': len(messages),
+        'recent': len(recent),
+        'recent_tokens': used,
+        'summarized': len(older),
+        'summary_tokens': estimate_tokens(summary),
+    }
+    return recent, summary, stats
@@ -0,0 +1,117 @@
+# Community/api/copilot_cache.py
+"""
+Per-process caches for the AI copilot, keyed on scope versions.
+
+A scope is what a user's copilot context covers: one household for a
+resident, every visitor for guards and admins. Its version counts the
+change feed's visitor changes in that scope (see ChangeBus.scope_version),
+so it moves whenever a visitor in the scope is created or transitions, in
+any process. Cached entries therefore stay
+valid exactly until the data under them changes; a TTL bounds the damage
+if a change notification is ever missed.
+
+Two caches live here: the visitor context block of the system prompt,
+and whole replies to read-only turns ("who's pending?"), LRU-bounded by
+COPILOT_RESPONSE_CACHE_SIZE.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from . import changefeed
+from .models import CustomUser
+
+_lock = threading.Lock()
+_contexts = {}
+_responses = OrderedDict()
+
+
+def visitor_scope(user):
+    """Household a user's copilot sees (None = all visitors)."""
+    return user.household_id if user.role == CustomUser.Role.RESIDENT else None
+
+
+def scope_version(user):
+    # Make sure this process is following the change feed before trusting it
+    changefeed.ensure_listener()
+    return changefeed.bus.scope_version(visitor_scope(user))
+
+
+def get_visitor_context(user, build):
+    """
+    The visitor context block for `user`'s (role, household), rebuilt with
+    `build()` only when the scope version moved or the entry expired.
+    """
+    key = (user.role, visitor_scope(user))
+    version = scope_version(user)
+    now = time.monotonic()
+    with _lock:
+        entry = _contexts.get(key)
+    if entry and entry[0] == version and entry[1] > now:
+        return entry[2]
+
+    context = build()
+    with _lock:
+        _contexts[key] = (version, now + settings.COPILOT_CONTEXT_CACHE_SECONDS, context)
+    return context
+
+
+def normalize_message(text):
+    """Case, spacing, curly quotes and trailing punctuation don't change the question."""
+    text = ' '.join(text.lower().replace('\u2019', "'").split())
+    return text.rstrip('.!?').rstrip()
+
+
+def response_key(user, history):
+    """
+    Cache key for the reply to the newest message of `history`, or None
+    if it isn't a user message. Besides the normalized message, the role,
+    the scope and its version, the key holds the assistant's previous
+    reply, so a bare "yes" is never answered out of its context.
+    """
+    messages = [msg for msg in history if isinstance(msg, dict) and isinstance(msg.get('text'), str)]
+    if not messages or messages[-1].get('role') == 'model':
+        return None
+    previous = next((msg['text'] for msg in reversed(messages[:-1]) if msg.get('role') == 'model'), '')
+    return (
+        normalize_message(messages[-1]['text']),
+        normalize_message(previous),
+        user.role,
+        visitor_scope(user),
+        scope_version(user),
+    )
+
+
+def get_response(key):
+    """A cached reply for `key`, or None."""
+    if key is None:
+        return None
+    now = time.monotonic()
+    with _lock:
+        entry = _responses.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del _responses[key]
+            return None
+        _responses.move_to_end(key)
+        return entry[1]
+
+
+def put_response(key, reply):
+    """Cache a reply; only call this for turns that changed nothing."""
+    if key is None:
+        return
+    with _lock:
+        _responses[key] = (time.monotonic() + settings.COPILOT_RESPONSE_CACHE_SECONDS, reply)
+        _responses.move_to_end(key)
+        while len(_responses) > settings.COPILOT_RESPONSE_CACHE_SIZE:
+            _responses.popitem(last=False)
+
+
+def clear():
+    with _lock:
+        _contexts.clear()
+        _responses.clear()
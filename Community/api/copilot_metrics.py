@@ -0,0 +1,37 @@
+# Community/api/copilot_metrics.py
+"""
+Per-process counters for the copilot pipeline.
+
+  turns                   chat turns handled
+  llm_calls               generate_content round trips to Gemini
+  tool_calls              tool (function) calls executed
+  summary_calls           second round trips made to phrase tool results
+  prompt_tokens           prompt tokens Gemini reported (usage_metadata)
+  output_tokens           response tokens Gemini reported
+  summary_calls_avoided   tool turns answered from local templates instead
+  fast_path_hits          turns answered by the local command grammar (api/intents.py)
+  fast_path_misses        turns that went to Gemini instead
+  fast_path_seconds       total time spent on fast-path turns
+  response_cache_hits     turns answered from the response cache (api/copilot_cache.py)
+  response_cache_misses   turns that had to be worked out
+"""
+import threading
+from collections import Counter
+
+_lock = threading.Lock()
+_counts = Counter()
+
+
+def incr(name, amount=1):
+    with _lock:
+        _counts[name] += amount
+
+
+def snapshot():
+    with _lock:
+        return dict(_counts)
+
+
+def reset():
+    with _lock:
+        _counts.clear()
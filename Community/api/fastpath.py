@@ -0,0 +1,125 @@
+# Community/api/fastpath.py
+"""
+Read-optimized list serialization.
+
+ModelSerializer builds a model instance and walks a tree of field objects
+for every row, which dominates CPU on the large guard/admin lists. The
+serializers here render the same JSON shape straight from `.values()`
+dicts; `FastListMixin` switches a viewset's `list` action (including
+delta sync) over to them. Retrieve, create and update keep using the
+regular serializers.
+
+The output must stay identical to the ModelSerializer it replaces;
+api/tests.py compares the two.
+"""
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+
+class ValuesSerializer:
+    """
+    Minimal read-only stand-in for `Serializer(rows, many=True)`.
+    Subclasses list the `.values()` lookups they need in `fields` and turn
+    one row dict into its representation in `to_representation`.
+    """
+    fields = ()
+
+    def __init__(self, rows, many=True, **kwargs):
+        self.rows = rows
+        self._tz = timezone.get_current_timezone() if settings.USE_TZ else None
+        self._iso = api_settings.DATETIME_FORMAT == ISO_8601
+        self._drf_datetime = serializers.DateTimeField().to_representation
+
+    @property
+    def data(self):
+        to_representation = self.to_representation
+        return [to_representation(row) for row in self.rows]
+
+    def to_representation(self, row):
+        raise NotImplementedError
+
+    def datetime(self, value):
+        """
+        Format like DRF's DateTimeField (current timezone, ISO 8601, 'Z'
+        for UTC) without its per-call settings and timezone lookups.
+        """
+        if value is None:
+            return None
+        if not self._iso or value.tzinfo is None:
+            return self._drf_datetime(value)
+        if self._tz is not None:
+            value = value.astimezone(self._tz)
+        value = value.isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+class VisitorValuesSerializer(ValuesSerializer):
+    """Same output as VisitorSerializer."""
+    fields = (
+        'id', 'name', 'phone', 'purpose', 'status',
+        'host_household_id', 'host_household__flat_number', 'host_household__name',
+        'scheduled_time', 'created_at', 'checked_in_at', 'checked_out_at', 'updated_at',
+    )
+
+    def to_representation(self, row):
+        return {
+            'id': row['id'],
+            'name': row['name'],
+            'phone': row['phone'],
+            'purpose': row['purpose'],
+            'status': row['status'],
+            'host_household': {
+                'id': row['host_household_id'],
+                'flat_number': row['host_household__flat_number'],
+                'name': row['host_household__name'],
+            },
+            'scheduled_time': self.datetime(row['scheduled_time']),
+            'created_at': self.datetime(row['created_at']),
+            'checked_in_at': self.datetime(row['checked_in_at']),
+            'checked_out_at': self.datetime(row['checked_out_at']),
+            'updated_at': self.datetime(row['updated_at']),
+        }
+
+
+class EventValuesSerializer(ValuesSerializer):
+    """Same output as EventSerializer."""
+    fields = ('id', 'type', 'timestamp', 'actor__username', 'subject_visitor_id', 'payload')
+
+    def to_representation(self, row):
+        return {
+            'id': row['id'],
+            'type': row['type'],
+            'timestamp': self.datetime(row['timestamp']),
+            'actor': row['actor__username'],
+            'subject_visitor': row['subject_visitor_id'],
+            'payload': row['payload'],
+        }
+
+
+class FastListMixin:
+    """
+    Serve the `list` action from `.values()` rows through
+    `fast_serializer_class`. Pagination and delta sync work on the row
+    dicts as well, so every row of a list is fetched as a plain dict.
+    """
+    fast_serializer_class = None
+
+    def use_fast_path(self):
+        return (
+            settings.FAST_LIST_SERIALIZATION
+            and self.fast_serializer_class is not None
+            and self.action == 'list'
+        )
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.use_fast_path():
+            queryset = queryset.values(*self.fast_serializer_class.fields)
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        if kwargs.get('many') and self.use_fast_path():
+            return self.fast_serializer_class(*args, **kwargs)
+        return super().get_serializer(*args, **kwargs)
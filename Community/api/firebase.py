@@ -0,0 +1,43 @@
+# Community/api/firebase.py
+"""
+Lazy Firebase Admin SDK initialization.
+
+The SDK is only imported and initialized when something actually sends
+a push (the notification worker), not by every process that loads the
+Django app.
+"""
+import os
+import threading
+
+_lock = threading.Lock()
+
+
+def get_app():
+    """The default firebase_admin app, initialized on first call. None if the key file is missing."""
+    import firebase_admin
+
+    if firebase_admin._apps:
+        return firebase_admin.get_app()
+    with _lock:
+        if firebase_admin._apps:
+            return firebase_admin.get_app()
+        # We will explicitly load the key file that we know works for Gemini.
+        # This path is the one from your docker-compose.yml
+        cred_path = '/app/firebase-key.json'
+        if not os.path.exists(cred_path):
+            print(f"CRITICAL: Key file {cred_path} not found. FCM will fail.")
+            return None
+        try:
+            from firebase_admin import credentials
+
+            # Explicitly create credential object from the file
+            cred = credentials.Certificate(cred_path)
+            app = firebase_admin.initialize_app(cred, {
+                # Ensure it uses the correct project ID from the key
+                'projectId': 'gen-lang-client-0431862828',
+            })
+            print("Firebase Admin SDK initialized EXPLICITLY from gcp-key.json.")
+            return app
+        except Exception as e:
+            print(f"Error initializing Firebase Admin SDK from {cred_path}: {e}")
+            return None
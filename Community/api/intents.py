@@ -0,0 +1,115 @@
+# Community/api/intents.py
+"""
+Local fast path for terse copilot commands.
+
+Messages like "approve 42", "deny 17", "check in 88 and 90" or "show
+pending" map one-to-one onto the copilot's tools, so they are parsed with
+a small compiled grammar and run without a Gemini round trip. Anything
+the grammar doesn't accept in full (free text, names instead of IDs, a
+deny reason...) goes to Gemini as before.
+"""
+import threading
+from collections import namedtuple
+
+# Same shape as a Gemini FunctionCall, so the tool runner takes either
+ToolCall = namedtuple('ToolCall', 'name args')
+
+GRAMMAR = r"""
+start: _PLEASE? command _PLEASE?
+
+?command: approve | deny | checkin | listing
+
+approve: _APPROVE ids
+deny: _DENY ids
+checkin: _CHECKIN ids
+listing: _SHOW _ME? _MY? status? _VISITORS?
+       | _MY? status _VISITORS
+
+ids: id ((_COMMA | _AND)+ id)*
+id: _HASH? INT
+  | _VISITOR _HASH? INT
+  | _ID _HASH? INT
+
+status: PENDING | APPROVED | CHECKED_IN | CHECKED_OUT | DENIED | ALL
+
+_PLEASE: "please"i | "pls"i
+_APPROVE: "approve"i | "accept"i | "allow"i
+_DENY: "deny"i | "reject"i | "decline"i
+_CHECKIN: /check[ -]?in/i
+_SHOW: "show"i | "list"i | "get"i
+_ME: "me"i
+_MY: "my"i
+_VISITORS: /visitors?/i | /pass(es)?/i
+_VISITOR: "visitor"i
+_ID: "id"i
+_HASH: "#"
+_COMMA: ","
+_AND: "and"i | "&"
+
+PENDING: "pending"i
+APPROVED: "approved"i
+CHECKED_IN: /checked[ -]?in/i
+CHECKED_OUT: /checked[ -]?out/i
+DENIED: "denied"i
+ALL: "all"i
+
+%import common.INT
+%import common.WS
+%ignore WS
+%ignore /[.!?]+$/
+"""
+
+COMMAND_TOOLS = {
+    'approve': 'approve_visitor',
+    'deny': 'deny_visitor',
+    'checkin': 'checkin_visitor',
+}
+
+_lock = threading.Lock()
+_parser = None
+
+
+def get_parser():
+    """The compiled (LALR) parser, built once per process."""
+    global _parser
+    if _parser is None:
+        with _lock:
+            if _parser is None:
+                from lark import Lark
+
+                _parser = Lark(GRAMMAR, parser='lalr')
+    return _parser
+
+
+def _to_calls(tree):
+    command = tree.children[0]
+    if command.data == 'listing':
+        statuses = [child.children[0].type for child in command.children]
+        return [ToolCall('list_my_visitors', {'status': statuses[0] if statuses else 'ALL'})]
+
+    ids = []
+    for id_node in command.children[0].children:
+        visitor_id = str(int(id_node.children[-1]))
+        if visitor_id not in ids:
+            ids.append(visitor_id)
+    return [ToolCall(COMMAND_TOOLS[command.data], {'visitor_id': visitor_id}) for visitor_id in ids]
+
+
+def match(text, allowed=None):
+    """
+    Tool calls for a terse command, or None if `text` isn't one (the
+    caller then asks Gemini). With `allowed` (tool names), a command that
+    needs any other tool is not a match either: Gemini, which only sees
+    the caller's tools, explains what they can do instead.
+    """
+    from lark.exceptions import LarkError
+
+    if not text or len(text) > 200:
+        return None
+    try:
+        calls = _to_calls(get_parser().parse(text.strip()))
+    except LarkError:
+        return None
+    if allowed is not None and any(call.name not in allowed for call in calls):
+        return None
+    return calls
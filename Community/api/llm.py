@@ -0,0 +1,98 @@
+# Community/api/llm.py
+"""
+Process-wide Gemini model registry.
+
+Vertex AI is initialized on first copilot use (not at import), and each
+model is constructed once per process and shared by every request and
+thread. The model's prediction client (credentials + gRPC channel) is
+created under the registry lock, so all requests reuse one warm
+connection instead of paying credential discovery and a TLS handshake
+per chat message. The async client used by the ASGI chat path is bound
+to the event loop it is created on, so it is built separately, on the
+server's loop, by `warm_up_async()`.
+
+Models come from COPILOT_MODEL_BACKEND, a callable taking the model name:
+Vertex AI by default, or api.replay.ReplayModel to run the copilot
+offline on recorded responses.
+"""
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+_lock = threading.Lock()
+_initialized = False
+_models = {}
+
+
+def _ensure_initialized():
+    global _initialized
+    if not _initialized:
+        import vertexai
+
+        vertexai.init(project=settings.GCP_PROJECT_ID, location=settings.GCP_LOCATION)
+        _initialized = True
+
+
+def vertex_model(name):
+    """The default backend: a Vertex AI GenerativeModel with its client already built."""
+    from vertexai.generative_models import GenerativeModel
+
+    _ensure_initialized()
+    model = GenerativeModel(name)
+    # Build the (thread-safe) prediction client once, here, so
+    # concurrent first requests don't each create a channel
+    getattr(model, '_prediction_client', None)
+    return model
+
+
+def get_model(name=None):
+    """
+    The shared model for `name` (default GEMINI_MODEL_NAME), built by
+    COPILOT_MODEL_BACKEND. Raises if the backend cannot create it (e.g.
+    Vertex AI cannot be initialized).
+    """
+    name = name or settings.GEMINI_MODEL_NAME
+    model = _models.get(name)
+    if model is not None:
+        return model
+    with _lock:
+        model = _models.get(name)
+        if model is None:
+            model = import_string(settings.COPILOT_MODEL_BACKEND)(name)
+            _models[name] = model
+    return model
+
+
+def warm_up(name=None):
+    """Create the shared model and its client now; returns False (and logs) on failure."""
+    try:
+        get_model(name)
+        return True
+    except Exception as e:
+        print(f"Gemini warm-up failed: {e}")
+        return False
+
+
+def warm_up_async(name=None):
+    """
+    Build the shared model's async client now. Call it on the server's
+    event loop (see community_app/asgi.py): gRPC aio channels only work on
+    the loop they were created on. Returns False (and logs) on failure.
+    """
+    try:
+        model = get_model(name)
+        if hasattr(type(model), '_prediction_async_client'):  # Replay backends have none
+            model._prediction_async_client
+        return True
+    except Exception as e:
+        print(f"Gemini async warm-up failed: {e}")
+        return False
+
+
+def reset():
+    """Forget all models (e.g. after settings change in tests)."""
+    global _initialized
+    with _lock:
+        _models.clear()
+        _initialized = False
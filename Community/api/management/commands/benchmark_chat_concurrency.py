@@ -0,0 +1,227 @@
+# Community/api/management/commands/benchmark_chat_concurrency.py
+
+import asyncio
+import contextlib
+import io
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from api import llm
+from api.ai_tools import get_gemini_tool
+from api.models import CustomUser, Household, Visitor
+from api.serializers import MyTokenObtainPairSerializer
+
+HOST = 'localhost'
+
+
+class FakeModel:
+    """
+    Local stand-in for Gemini: every turn asks for list_my_visitors, then
+    answers, each call taking `latency` seconds (blocking or awaited).
+    """
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def _response(self, contents):
+        from vertexai.generative_models import GenerationResponse
+
+        if contents[-1].role == 'function':
+            part = {'text': 'Here are your visitors.'}
+        else:
+            part = {'function_call': {'name': 'list_my_visitors', 'args': {}}}
+        return GenerationResponse.from_dict({'candidates': [{'content': {'role': 'model', 'parts': [part]}}]})
+
+    def generate_content(self, contents, **kwargs):
+        time.sleep(self.latency)
+        return self._response(contents)
+
+    async def generate_content_async(self, contents, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._response(contents)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+async def asgi_request(app, method, path, token, body=b''):
+    """One request through the ASGI handler (as uvicorn would call it); returns (status code, body)."""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': method, 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': b'', 'root_path': '',
+        'headers': [
+            (b'host', HOST.encode()),
+            (b'authorization', f'Bearer {token}'.encode()),
+            (b'content-type', b'application/json'),
+        ],
+        'client': ('127.0.0.1', 0), 'server': (HOST, 80),
+    }
+    pending = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    status = None
+    chunks = []
+
+    async def receive():
+        if pending:
+            return pending.pop()
+        await asyncio.Event().wait()  # The client never disconnects
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        elif message['type'] == 'http.response.body':
+            chunks.append(message.get('body', b''))
+
+    await app(scope, receive, send)
+    return status, b''.join(chunks)
+
+
+def wsgi_request(app, method, path, token, body=b''):
+    """One request through the WSGI handler, on the calling (worker) thread."""
+    environ = {
+        'REQUEST_METHOD': method, 'PATH_INFO': path, 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+        'SERVER_NAME': HOST, 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': HOST, 'HTTP_AUTHORIZATION': f'Bearer {token}',
+        'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body), 'wsgi.errors': io.StringIO(), 'wsgi.url_scheme': 'http',
+        'wsgi.version': (1, 0), 'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+    }
+    result = {}
+
+    def start_response(status, headers, exc_info=None):
+        result['status'] = int(status.split()[0])
+
+    response = app(environ, start_response)
+    b''.join(response)
+    response.close()
+    return result['status']
+
+
+class Command(BaseCommand):
+    help = ('Measures guard visitor-list latency while many copilot chats are in flight, '
+            'with the async ChatbotView under ASGI versus chats pinning WSGI worker threads '
+            '(Gemini is replaced by a local fake model)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chats', type=int, default=50, help='Copilot chats started at once.')
+        parser.add_argument('--llm-latency', type=float, default=1.0, help='Seconds per fake Gemini call.')
+        parser.add_argument('--threads', type=int, default=8, help='Worker threads of the simulated WSGI server.')
+        parser.add_argument('--probe-interval', type=float, default=0.05, help='Seconds between guard requests.')
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        household = Household.objects.create(flat_number=f'BENCH-{tag}', name='Chat benchmark')
+        resident = CustomUser.objects.create_user(
+            f'bench-resident-{tag}', email=f'bench-resident-{tag}@example.com',
+            role=CustomUser.Role.RESIDENT, household=household
+        )
+        guard = CustomUser.objects.create_user(
+            f'bench-guard-{tag}', email=f'bench-guard-{tag}@example.com', role=CustomUser.Role.GUARD
+        )
+        Visitor.objects.bulk_create(Visitor(name=f'Guest {i}', host_household=household) for i in range(50))
+        self.tokens = {
+            'resident': str(MyTokenObtainPairSerializer.get_token(resident).access_token),
+            'guard': str(MyTokenObtainPairSerializer.get_token(guard).access_token),
+        }
+        # Free text, so the command grammar (api/intents.py) leaves it to the model
+        self.chat_body = json.dumps({'history': [{'role': 'user', 'text': 'who has come to see me?'}]}).encode()
+        llm._models[settings.GEMINI_MODEL_NAME] = FakeModel(options['llm_latency'])
+        get_gemini_tool()  # Load the SDK up front, as a preloaded server would (see gunicorn.conf.py)
+
+        self.stdout.write(
+            f"{options['chats']} chats, {options['llm_latency']:.2f}s per Gemini call (2 per chat); "
+            f"guard GET /api/visitors/ every {options['probe_interval'] * 1000:.0f} ms"
+        )
+        try:
+            # The copilot logs every turn; keep the report readable
+            # Every chat asks the same question; keep them all going to the (fake) model
+            with contextlib.redirect_stdout(io.StringIO()), override_settings(COPILOT_RESPONSE_CACHE_SIZE=0):
+                asgi = asyncio.run(self.run_asgi(options))
+                wsgi = self.run_wsgi(options)
+        finally:
+            llm.reset()
+            resident.delete()
+            guard.delete()
+            household.delete()
+
+        self.report('ASGI, async ChatbotView', asgi)
+        self.report(f"WSGI, {options['threads']} worker threads", wsgi)
+
+    def report(self, label, result):
+        idle, busy, chats, errors = result['idle'], result['busy'], result['chats'], result['errors']
+        self.stdout.write(f"{label}:")
+        self.stdout.write(
+            f"  guard list idle       p50 {percentile(idle, 0.5) * 1000:8.1f} ms   p99 {percentile(idle, 0.99) * 1000:8.1f} ms"
+        )
+        self.stdout.write(
+            f"  guard list mid-chats  p50 {percentile(busy, 0.5) * 1000:8.1f} ms   p99 {percentile(busy, 0.99) * 1000:8.1f} ms"
+            f"   ({len(busy)} requests)"
+        )
+        self.stdout.write(f"  all chats answered in {chats:.2f}s ({errors} non-200)")
+
+    async def run_asgi(self, options):
+        app = ASGIHandler()
+
+        async def probe(count=None, until=None):
+            latencies = []
+            while (count is not None and len(latencies) < count) or (until is not None and not until.done()):
+                start = time.perf_counter()
+                await asgi_request(app, 'GET', '/api/visitors/', self.tokens['guard'])
+                latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(options['probe_interval'])
+            return latencies
+
+        idle = await probe(count=20)
+        start = time.perf_counter()
+        chats = asyncio.ensure_future(asyncio.gather(*[
+            asgi_request(app, 'POST', '/api/chat/', self.tokens['resident'], self.chat_body)
+            for _ in range(options['chats'])
+        ]))
+        busy = await probe(until=chats)
+        responses = await chats
+        return {
+            'idle': idle, 'busy': busy, 'chats': time.perf_counter() - start,
+            'errors': sum(status != 200 for status, _ in responses),
+        }
+
+    def run_wsgi(self, options):
+        app = WSGIHandler()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            def request(method, path, token, body=b''):
+                # Latency as the client sees it: queueing for a free worker + handling
+                start = time.perf_counter()
+                pool.submit(wsgi_request, app, method, path, token, body).result()
+                return time.perf_counter() - start
+
+            def probe(count=None, until=None):
+                latencies = []
+                while (count is not None and len(latencies) < count) or (until is not None and not until.is_set()):
+                    latencies.append(request('GET', '/api/visitors/', self.tokens['guard']))
+                    time.sleep(options['probe_interval'])
+                return latencies
+
+            idle = probe(count=20)
+            start = time.perf_counter()
+            futures = [
+                pool.submit(wsgi_request, app, 'POST', '/api/chat/', self.tokens['resident'], self.chat_body)
+                for _ in range(options['chats'])
+            ]
+            done = threading.Event()
+            threading.Thread(target=lambda: ([f.result() for f in futures], done.set()), daemon=True).start()
+            busy = probe(until=done)
+            statuses = [future.result() for future in futures]
+        return {
+            'idle': idle, 'busy': busy, 'chats': time.perf_counter() - start,
+            'errors': sum(status != 200 for status in statuses),
+        }
@@ -0,0 +1,180 @@
+# Community/api/management/commands/benchmark_copilot_replay.py
+
+import asyncio
+import contextlib
+import io
+import json
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import override_settings
+from api import copilot_cache, copilot_metrics, llm, notifications
+from api.ai_tools import get_gemini_tool
+from api.models import CustomUser, Event, FCMDevice, Household, OutboxNotification, Visitor
+from api.serializers import MyTokenObtainPairSerializer
+from .benchmark_chat_concurrency import asgi_request, percentile
+
+# One resident's session, each message sent with the chat so far; {visitor_id} is their pending visitor.
+# The replies come from the recording (api/replays/sample.json by default) or the command grammar.
+SCRIPT = [
+    'hi',
+    'who is pending?',
+    'my cousin Priya is coming tonight at 8',
+    'approve {visitor_id}',
+    'what passes do I have?',
+    'thanks!',
+]
+
+
+class QueryCounter:
+    """Counts queries on every DB connection, including those opened later by other threads."""
+
+    def __init__(self):
+        self.count = 0
+        self.active = False
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.active:
+            with self._lock:
+                self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def __enter__(self):
+        for connection in connections.all():
+            self.install(connection)
+        connection_created.connect(self.install)
+        self.active = True
+        return self
+
+    def __exit__(self, *exc_info):
+        self.active = False
+        connection_created.disconnect(self.install)
+
+
+class Command(BaseCommand):
+    help = ('Drives concurrent scripted copilot conversations through ChatbotView (ASGI) with replayed '
+            'Gemini responses and a stub FCM sender, and reports latency, LLM round trips, DB queries '
+            'and tokens per turn (no network needed)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--conversations', type=int, default=20, help='Residents chatting at once.')
+        parser.add_argument('--llm-latency', type=float, default=0.5, help='Seconds per replayed Gemini call.')
+        parser.add_argument('--fcm-latency', type=float, default=0.05, help='Seconds per stub FCM send.')
+        parser.add_argument('--recording', default=settings.COPILOT_REPLAY_FILE,
+                            help='Recorded Gemini responses (see api/replay.py).')
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        households, residents, visitor_ids = [], [], []
+        for i in range(options['conversations']):
+            household = Household.objects.create(flat_number=f'BENCH-{tag}-{i}', name='Replay benchmark')
+            resident = CustomUser.objects.create_user(
+                f'bench-replay-{tag}-{i}', email=f'bench-replay-{tag}-{i}@example.com',
+                role=CustomUser.Role.RESIDENT, household=household
+            )
+            FCMDevice.objects.create(user=resident, registration_id=f'bench-replay-{tag}-{i}')
+            visitor_ids.append(Visitor.objects.create(name='Guest', host_household=household).id)
+            households.append(household)
+            residents.append(resident)
+        # Approvals notify the guards; give them a device so deliveries reach the stub sender
+        guard = CustomUser.objects.create_user(
+            f'bench-replay-guard-{tag}', email=f'bench-replay-guard-{tag}@example.com', role=CustomUser.Role.GUARD
+        )
+        FCMDevice.objects.create(user=guard, registration_id=f'bench-replay-guard-{tag}')
+        tokens = [str(MyTokenObtainPairSerializer.get_token(resident).access_token) for resident in residents]
+        last_outbox_id = OutboxNotification.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+        overrides = override_settings(
+            COPILOT_MODEL_BACKEND='api.replay.ReplayModel',
+            COPILOT_REPLAY_FILE=options['recording'],
+            COPILOT_REPLAY_LATENCY=options['llm_latency'],
+            NOTIFICATION_SENDER='api.notifications.LocalStubSender',
+        )
+        try:
+            with overrides:
+                llm.reset()
+                copilot_cache.clear()
+                copilot_metrics.reset()
+                notifications.LocalStubSender.reset()
+                notifications.LocalStubSender.latency = options['fcm_latency']
+                get_gemini_tool()  # Load the SDK up front, as a preloaded server would (see gunicorn.conf.py)
+                # The copilot logs every turn; keep the report readable
+                with contextlib.redirect_stdout(io.StringIO()), QueryCounter() as queries:
+                    start = time.perf_counter()
+                    latencies, errors = asyncio.run(self.run_conversations(tokens, visitor_ids))
+                    elapsed = time.perf_counter() - start
+                metrics = copilot_metrics.snapshot()
+                outbox = list(OutboxNotification.objects.filter(id__gt=last_outbox_id))
+                with contextlib.redirect_stdout(io.StringIO()):
+                    start = time.perf_counter()
+                    sender = notifications.get_sender()
+                    delivered = sum(notifications.deliver(notification, sender) for notification in outbox)
+                    delivery = time.perf_counter() - start
+                pushes = len(notifications.LocalStubSender.sent)
+        finally:
+            llm.reset()
+            notifications.LocalStubSender.reset()
+            # Run against a benchmark database: notifications queued meanwhile went to the stub too
+            OutboxNotification.objects.filter(id__gt=last_outbox_id).delete()
+            Event.objects.filter(actor__in=residents).delete()
+            for user in [*residents, guard]:
+                user.delete()
+            for household in households:
+                household.delete()
+
+        turns = len(latencies)
+        self.stdout.write(
+            f"{options['conversations']} concurrent conversations x {len(SCRIPT)} turns through ChatbotView (ASGI), "
+            f"replayed Gemini at {options['llm_latency']:.2f}s per call: {turns} turns in {elapsed:.2f}s ({errors} non-200)"
+        )
+        self.stdout.write(
+            f"  turn latency         p50 {percentile(latencies, 0.5) * 1000:8.1f} ms   "
+            f"p99 {percentile(latencies, 0.99) * 1000:8.1f} ms"
+        )
+        self.stdout.write(f"  LLM round trips/turn {metrics.get('llm_calls', 0) / turns:8.2f}")
+        self.stdout.write(f"  DB queries/turn      {queries.count / turns:8.1f}")
+        self.stdout.write(
+            f"  tokens/turn          {metrics.get('prompt_tokens', 0) / turns:8.0f} prompt + "
+            f"{metrics.get('output_tokens', 0) / turns:.0f} output"
+        )
+        self.stdout.write(
+            f"  answered locally     {metrics.get('fast_path_hits', 0)} by the command grammar, "
+            f"{metrics.get('response_cache_hits', 0)} from the response cache"
+        )
+        self.stdout.write(
+            f"Notifications: {delivered}/{len(outbox)} outbox row(s) delivered to the stub FCM sender "
+            f"({pushes} send(s) at {options['fcm_latency'] * 1000:.0f} ms) in {delivery:.2f}s"
+        )
+
+    async def run_conversations(self, tokens, visitor_ids):
+        app = ASGIHandler()
+        latencies = []
+        errors = 0
+
+        async def converse(token, visitor_id):
+            nonlocal errors
+            history = []
+            for message in SCRIPT:
+                history.append({'role': 'user', 'text': message.format(visitor_id=visitor_id)})
+                body = json.dumps({'history': history}).encode()
+                start = time.perf_counter()
+                status, content = await asgi_request(app, 'POST', '/api/chat/', token, body)
+                latencies.append(time.perf_counter() - start)
+                if status != 200:
+                    errors += 1
+                    return
+                history.append({'role': 'model', 'text': json.loads(content)['reply']})
+
+        await asyncio.gather(*(converse(token, visitor_id) for token, visitor_id in zip(tokens, visitor_ids)))
+        return latencies, errors
@@ -0,0 +1,45 @@
+# Community/api/management/commands/benchmark_copilot_setup.py
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api import llm
+
+
+class Command(BaseCommand):
+    help = ('Measures the per-request Gemini setup cost that the shared model registry removes '
+            'from /api/chat/ (no model calls are made)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20, help='Simulated chat requests.')
+
+    def handle(self, *args, **options):
+        from vertexai.generative_models import GenerativeModel
+
+        n = options['requests']
+        try:
+            start = time.perf_counter()
+            llm.get_model()
+            first = time.perf_counter() - start
+        except Exception as e:
+            raise CommandError(f"Could not create the Gemini client (check GCP credentials): {e}")
+
+        # Before: every request built its own model, and its first call built a new client
+        start = time.perf_counter()
+        for _ in range(n):
+            model = GenerativeModel(settings.GEMINI_MODEL_NAME)
+            model._prediction_client
+        per_request_before = (time.perf_counter() - start) / n
+
+        # After: every request reuses the process-wide model and its warm client
+        start = time.perf_counter()
+        for _ in range(n):
+            llm.get_model()
+        per_request_after = (time.perf_counter() - start) / n
+
+        self.stdout.write(f"First use (init + model + client, once per process): {first * 1000:8.2f} ms")
+        self.stdout.write(f"Per request, new model + client:                     {per_request_before * 1000:8.2f} ms")
+        self.stdout.write(f"Per request, shared registry:                        {per_request_after * 1000:8.4f} ms")
+        self.stdout.write("Not counted above: the TLS handshake a new channel pays on its first call, "
+                          "which the shared client also avoids.")
@@ -0,0 +1,101 @@
+# Community/api/management/commands/benchmark_intents.py
+
+import contextlib
+import io
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from api import intents
+from api.ai_tools import AICopilotService
+from api.models import CustomUser, Household, Visitor
+
+# A mix of terse commands and free text, roughly as residents and guards type them
+SAMPLE_MESSAGES = [
+    'approve 42', 'Approve #7', 'deny 17', 'please approve 12, 14 and 15', 'check in 88',
+    'checkin 31 and 32', 'show pending', 'list my visitors', 'show approved visitors', 'pending visitors',
+    'approve Ramesh', 'my cousin Priya is coming tonight at 8', 'deny 17 because he was rude',
+    'who is waiting at the gate?', 'create a pass for the plumber tomorrow', 'hi',
+    'can you approve the delivery guy', 'what did I approve yesterday?', 'show me checked in visitors', 'thanks!',
+]
+
+
+class Rollback(Exception):
+    pass
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+class Command(BaseCommand):
+    help = ('Reports the copilot fast-path hit rate and parse latency over a message sample, '
+            'and end-to-end latency of fast-path turns (seed data is rolled back)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', help='File with one chat message per line (default: a built-in sample).')
+        parser.add_argument('--repeat', type=int, default=200, help='Parses per message for the latency figures.')
+        parser.add_argument('--turns', type=int, default=50, help='Fast-path chat turns to run end to end.')
+
+    def handle(self, *args, **options):
+        if options['messages']:
+            with open(options['messages'], encoding='utf-8') as f:
+                messages = [line.strip() for line in f if line.strip()]
+            if not messages:
+                raise CommandError('The messages file is empty.')
+        else:
+            messages = SAMPLE_MESSAGES
+
+        intents.get_parser()  # Compiled once per process; not part of the per-message cost
+        hits, hit_times, miss_times = 0, [], []
+        for text in messages:
+            start = time.perf_counter()
+            for _ in range(options['repeat']):
+                calls = intents.match(text)
+            elapsed = (time.perf_counter() - start) / options['repeat']
+            if calls:
+                hits += 1
+                hit_times.append(elapsed)
+            else:
+                miss_times.append(elapsed)
+
+        self.stdout.write(f"Hit rate: {hits}/{len(messages)} messages ({hits / len(messages):.0%}) skip Gemini")
+        for label, times in [('hits', hit_times), ('misses', miss_times)]:
+            self.stdout.write(
+                f"  match() on {label:<6} p50 {percentile(times, 0.5) * 1e6:7.1f} us   "
+                f"p99 {percentile(times, 0.99) * 1e6:7.1f} us"
+            )
+
+        try:
+            with transaction.atomic():
+                self.run_turns(options['turns'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run_turns(self, turns):
+        household = Household.objects.create(flat_number='BENCH-INTENTS', name='Intent benchmark')
+        resident = CustomUser.objects.create(
+            username='bench-intents', email='bench-intents@example.com',
+            role=CustomUser.Role.RESIDENT, household=household,
+        )
+        visitors = Visitor.objects.bulk_create(
+            Visitor(name=f'Guest {i}', host_household=household) for i in range(turns)
+        )
+        service = AICopilotService(resident)
+        times = {'approve <id>': [], 'show pending': []}
+        # The copilot logs every turn; keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            for visitor in visitors:
+                for label, text in [('approve <id>', f'approve {visitor.id}'), ('show pending', 'show pending')]:
+                    start = time.perf_counter()
+                    service.process_message([{'role': 'user', 'text': text}])
+                    times[label].append(time.perf_counter() - start)
+
+        self.stdout.write(f"End-to-end fast-path turns ({turns} each, no Gemini round trip):")
+        for label, values in times.items():
+            self.stdout.write(
+                f"  {label:<14} p50 {percentile(values, 0.5) * 1000:7.2f} ms   "
+                f"p99 {percentile(values, 0.99) * 1000:7.2f} ms"
+            )
@@ -0,0 +1,90 @@
+# Community/api/management/commands/benchmark_serialization.py
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from api.fastpath import EventValuesSerializer, VisitorValuesSerializer
+from api.models import CustomUser, Event, Household, Visitor
+from api.renderers import FastJSONRenderer
+from api.serializers import EventSerializer, VisitorSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Measures list serialization throughput (rows/sec): ModelSerializer + JSONRenderer '
+            'against the .values() fast path + orjson renderer')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000, help='Visitors and events to serialize.')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per path; the best one is reported.')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        if rows < 1:
+            raise CommandError('--rows must be positive.')
+        # Seed inside a transaction that is always rolled back
+        try:
+            with transaction.atomic():
+                self.seed(rows)
+                self.run(rows, options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, rows):
+        households = Household.objects.bulk_create(
+            Household(flat_number=f'BENCH-{i}', name=f'Bench {i}') for i in range(50)
+        )
+        actor = CustomUser.objects.create(username='bench-actor', email='bench-actor@example.com')
+        visitors = Visitor.objects.bulk_create(
+            Visitor(name=f'Visitor {i}', purpose='Benchmark', host_household=households[i % len(households)])
+            for i in range(rows)
+        )
+        Event.objects.bulk_create(
+            Event(type=Event.EventType.VISITOR_CREATED, actor=actor, subject_visitor=visitor, payload={'i': i})
+            for i, visitor in enumerate(visitors)
+        )
+        self.visitor_ids = [visitor.id for visitor in visitors]
+
+    def run(self, rows, repeat):
+        visitors = Visitor.objects.filter(id__in=self.visitor_ids).order_by('-created_at', '-id')
+        events = Event.objects.filter(subject_visitor_id__in=self.visitor_ids).order_by('-timestamp', '-id')
+        cases = [
+            ('visitors', VisitorSerializer, VisitorValuesSerializer,
+             visitors.select_related('host_household'), visitors),
+            ('events', EventSerializer, EventValuesSerializer,
+             events.select_related('actor'), events),
+        ]
+        for name, serializer_class, fast_class, queryset, values_base in cases:
+            def model_path():
+                data = serializer_class(list(queryset), many=True).data
+                return JSONRenderer().render(data)
+
+            def fast_path():
+                data = fast_class(list(values_base.values(*fast_class.fields))).data
+                return FastJSONRenderer().render(data)
+
+            if model_path() != fast_path():
+                raise CommandError(f'{name}: fast path output differs from {serializer_class.__name__}.')
+
+            model_time = self.best_of(model_path, repeat)
+            fast_time = self.best_of(fast_path, repeat)
+            self.stdout.write(
+                f"{name:<9} ModelSerializer: {rows / model_time:>10,.0f} rows/sec   "
+                f"fast path: {rows / fast_time:>10,.0f} rows/sec   "
+                f"({model_time / fast_time:.1f}x, fetch + serialize + render)"
+            )
+
+    def best_of(self, func, repeat):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
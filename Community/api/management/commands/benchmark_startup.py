@@ -0,0 +1,127 @@
+# Community/api/management/commands/benchmark_startup.py
+
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Time to a servable app (settings + URLconf, i.e. every view module).
+# 'eager' also imports the SDKs the views used to pull in at import time.
+IMPORT_SCRIPT = '''
+import json, resource, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+from importlib import import_module
+from django.conf import settings
+import_module(settings.ROOT_URLCONF)
+if sys.argv[1] == 'eager':
+    import firebase_admin.messaging, vertexai.generative_models
+print(json.dumps({
+    'seconds': time.perf_counter() - start,
+    'rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+}))
+'''
+
+# Forks N workers, either after loading the app and SDKs once ('preload',
+# as gunicorn.conf.py does) or loading them in every worker. Workers are
+# measured while all of them are alive, so PSS reflects the sharing.
+WORKERS_SCRIPT = '''
+import json, os, sys
+mode, workers = sys.argv[1], int(sys.argv[2])
+
+def load():
+    import django
+    django.setup()
+    from importlib import import_module
+    from django.conf import settings
+    import_module(settings.ROOT_URLCONF)
+    import firebase_admin.messaging, vertexai.generative_models
+    from api.ai_tools import get_gemini_tool
+    get_gemini_tool()
+
+def memory():
+    fields = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 3 and parts[0].endswith(':'):
+                fields[parts[0][:-1]] = int(parts[1])
+    return {
+        'rss_kb': fields['Rss'],
+        'pss_kb': fields['Pss'],
+        'private_kb': fields['Private_Clean'] + fields['Private_Dirty'],
+    }
+
+if mode == 'preload':
+    load()
+ready_r, ready_w = os.pipe()
+go_r, go_w = os.pipe()
+result_r, result_w = os.pipe()
+pids = []
+for _ in range(workers):
+    pid = os.fork()
+    if pid == 0:
+        os.close(go_w)
+        if mode != 'preload':
+            load()
+        os.write(ready_w, b'.')
+        os.read(go_r, 1)
+        os.write(result_w, (json.dumps(memory()) + '\\n').encode())
+        os._exit(0)
+    pids.append(pid)
+
+ready = 0
+while ready < workers:
+    ready += len(os.read(ready_r, workers))
+os.close(go_w)
+os.close(result_w)
+results = []
+with os.fdopen(result_r) as f:
+    for _ in range(workers):
+        results.append(json.loads(f.readline()))
+for pid in pids:
+    os.waitpid(pid, 0)
+print(json.dumps(results))
+'''
+
+
+class Command(BaseCommand):
+    help = 'Reports app import time and per-worker memory, with and without lazy SDK imports and preloading'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Workers to fork for the memory test.')
+        parser.add_argument('--runs', type=int, default=3, help='Import-time runs per mode; the best is reported.')
+
+    def run_script(self, script, *args):
+        env = {**os.environ, 'PYTHONPATH': os.pathsep.join(p for p in sys.path if p)}
+        result = subprocess.run(
+            [sys.executable, '-c', script, *map(str, args)],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise CommandError(result.stderr.strip().splitlines()[-1] if result.stderr else 'Benchmark failed')
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+    def handle(self, *args, **options):
+        if not hasattr(os, 'fork') or not os.path.exists('/proc/self/smaps_rollup'):
+            raise CommandError('This benchmark needs Linux (fork and /proc/self/smaps_rollup).')
+
+        self.stdout.write('App import (django.setup + URLconf), best of %d:' % options['runs'])
+        for mode, label in [('lazy', 'lazy SDK imports'), ('eager', 'SDKs imported up front')]:
+            runs = [self.run_script(IMPORT_SCRIPT, mode) for _ in range(options['runs'])]
+            best = min(runs, key=lambda r: r['seconds'])
+            self.stdout.write(f"  {label:<24} {best['seconds']:6.2f}s   max RSS {best['rss_kb'] / 1024:7.1f} MiB")
+
+        workers = options['workers']
+        self.stdout.write(f'Per worker with the app and SDKs loaded ({workers} workers):')
+        for mode, label in [('preload', 'preloaded in master'), ('per-worker', 'loaded in each worker')]:
+            results = self.run_script(WORKERS_SCRIPT, mode, workers)
+            avg = {key: sum(r[key] for r in results) / len(results) / 1024 for key in results[0]}
+            self.stdout.write(
+                f"  {label:<24} RSS {avg['rss_kb']:7.1f} MiB   PSS {avg['pss_kb']:7.1f} MiB   "
+                f"private {avg['private_kb']:7.1f} MiB"
+            )
@@ -0,0 +1,140 @@
+# Community/api/management/commands/check_query_plans.py
+
+import json
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from api.models import Household, Visitor, Event
+from api.pagination import keyset_filter
+from api.sync import scope_state_query
+
+CHECKED_TABLES = {Visitor._meta.db_table, Event._meta.db_table}
+LIST_LIMIT = 51 # A page plus the "has more" row
+
+
+def hot_queries(household_id):
+    """
+    The read queries behind every dashboard poll and copilot turn.
+    Keep these in step with api/views.py and api/ai_tools.py.
+    """
+    active = [Visitor.Status.APPROVED, Visitor.Status.PENDING, Visitor.Status.CHECKED_IN]
+    deep_position = [timezone.now() - timedelta(days=365), 0]
+    day_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return [
+        ("Resident visitor list (VisitorViewSet.get_queryset)",
+         Visitor.objects.filter(host_household_id=household_id).order_by('-created_at', '-id')[:LIST_LIMIT]),
+        ("Guard/Admin visitor list (VisitorViewSet.get_queryset)",
+         Visitor.objects.all().order_by('-created_at', '-id')[:LIST_LIMIT]),
+        ("Guard/Admin visitor list, page a year deep (KeysetPagination)",
+         Visitor.objects.filter(keyset_filter(('-created_at', '-id'), deep_position))
+         .order_by('-created_at', '-id')[:LIST_LIMIT]),
+        ("Guard visitor list for one day (VisitorViewSet ?date=)",
+         Visitor.objects.filter(
+             Q(scheduled_time__gte=day_start, scheduled_time__lt=day_start + timedelta(days=1))
+             | Q(scheduled_time__isnull=True, created_at__gte=day_start, created_at__lt=day_start + timedelta(days=1))
+         ).order_by('-created_at', '-id')[:LIST_LIMIT]),
+        ("list_my_visitors with status (AICopilotService)",
+         Visitor.objects.filter(host_household_id=household_id, status=Visitor.Status.APPROVED).order_by('-created_at')[:20]),
+        ("Resident copilot context (AICopilotService)",
+         Visitor.objects.filter(host_household_id=household_id, status=Visitor.Status.PENDING).order_by('-created_at')[:10]),
+        ("Guard/Admin copilot context (AICopilotService)",
+         Visitor.objects.filter(status__in=active).order_by('-created_at')[:20]),
+        ("Resident visitor list ETag state (DeltaSyncMixin.get_scope_state)",
+         scope_state_query(Visitor.objects.filter(host_household_id=household_id), 'updated_at')),
+        ("Guard/Admin visitor list ETag state (DeltaSyncMixin.get_scope_state)",
+         scope_state_query(Visitor.objects.all(), 'updated_at')),
+        ("Audit log (EventViewSet)",
+         Event.objects.all().order_by('-timestamp', '-id')[:LIST_LIMIT]),
+        ("Audit log, page a year deep (KeysetPagination)",
+         Event.objects.filter(keyset_filter(('-timestamp', '-id'), deep_position))
+         .order_by('-timestamp', '-id')[:LIST_LIMIT]),
+        ("Audit log ETag state (DeltaSyncMixin.get_scope_state)",
+         scope_state_query(Event.objects.all(), 'timestamp')),
+    ]
+
+
+def walk_plan(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from walk_plan(child)
+
+
+class Command(BaseCommand):
+    help = 'EXPLAINs the hot visitor/event queries and fails if any of them sequentially scans a large table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed-visitors', type=int, default=0,
+                            help='Insert this many synthetic visitors (and one event each) before checking.')
+        parser.add_argument('--households', type=int, default=2000,
+                            help='Number of synthetic households to spread seeded visitors over.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Query plans are only meaningful on PostgreSQL.")
+
+        if options['seed_visitors']:
+            self._seed(options['seed_visitors'], options['households'])
+
+        household = (Household.objects.filter(flat_number__startswith='SEED-').order_by('id').first()
+                     or Household.objects.order_by('id').first())
+        if household is None:
+            raise CommandError("No households found. Run with --seed-visitors first.")
+
+        self.stdout.write(f"Visitors: {Visitor.objects.count()}, events: {Event.objects.count()}")
+        failures = 0
+        for label, queryset in hot_queries(household.id):
+            plan = json.loads(queryset.explain(format='json', analyze=True))[0]
+            nodes = list(walk_plan(plan['Plan']))
+            seq_scans = [n['Relation Name'] for n in nodes
+                         if n['Node Type'] == 'Seq Scan' and n.get('Relation Name') in CHECKED_TABLES]
+            indexes = sorted({n['Index Name'] for n in nodes if 'Index Name' in n})
+            summary = f"{label}: {plan['Execution Time']:.2f} ms via {', '.join(indexes) or 'no index'}"
+            if seq_scans:
+                failures += 1
+                self.stdout.write(self.style.ERROR(f"FAIL {summary} (Seq Scan on {', '.join(seq_scans)})"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"OK   {summary}"))
+
+        if failures:
+            raise CommandError(f"{failures} hot query(ies) fell back to a sequential scan.")
+        self.stdout.write(self.style.SUCCESS("All hot queries use index scans."))
+
+    def _seed(self, visitors, households):
+        """Bulk-load synthetic data with generate_series; mostly finished visits, like production."""
+        self.stdout.write(f"Seeding {visitors} visitors over {households} households...")
+        started = time.monotonic()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO api_household (flat_number, name) "
+                "SELECT 'SEED-' || g, '' FROM generate_series(1, %s) g "
+                "ON CONFLICT (flat_number) DO NOTHING",
+                [households],
+            )
+            cursor.execute("SELECT min(id), count(*) FROM api_household WHERE flat_number LIKE %s", ['SEED-%'])
+            first_id, count = cursor.fetchone()
+            cursor.execute("SELECT coalesce(max(id), 0) FROM api_visitor")
+            last_visitor_id = cursor.fetchone()[0]
+            cursor.execute(
+                """
+                INSERT INTO api_visitor (name, phone, purpose, status, host_household_id, created_at, updated_at)
+                SELECT 'Seed visitor ' || g, '', 'Guest',
+                       CASE WHEN r < 0.90 THEN 'CHECKED_OUT' WHEN r < 0.95 THEN 'DENIED'
+                            WHEN r < 0.97 THEN 'PENDING' WHEN r < 0.99 THEN 'APPROVED'
+                            ELSE 'CHECKED_IN' END,
+                       %s + (g %% %s), ts, ts
+                FROM (SELECT g, random() AS r, now() - random() * interval '730 days' AS ts
+                      FROM generate_series(1, %s) g) s
+                """,
+                [first_id, count, visitors],
+            )
+            cursor.execute(
+                "INSERT INTO api_event (type, timestamp, payload, subject_visitor_id) "
+                "SELECT 'VISITOR_CREATED', created_at, '{}'::jsonb, id FROM api_visitor WHERE id > %s",
+                [last_visitor_id],
+            )
+            cursor.execute("ANALYZE api_household, api_visitor, api_event")
+        self.stdout.write(f"Seeded in {time.monotonic() - started:.1f}s.")
@@ -0,0 +1,43 @@
+# Community/api/management/commands/deliver_notifications.py
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from api import notifications
+
+
+class Command(BaseCommand):
+    help = 'Drains the notification outbox, sending due notifications on a thread pool with retries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Concurrent sends.')
+        parser.add_argument('--batch-size', type=int, default=100, help='Notifications claimed per round.')
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds to sleep when the outbox is empty.')
+        parser.add_argument('--once', action='store_true', help='Drain what is due now and exit.')
+
+    def handle(self, *args, **options):
+        sender = notifications.get_sender()
+        self.stdout.write(f"Delivering notifications with {type(sender).__name__} "
+                          f"({options['workers']} workers).")
+
+        def deliver(notification):
+            try:
+                return notifications.deliver(notification, sender)
+            finally:
+                # Each pool thread holds its own DB connection; drop it if it went stale
+                close_old_connections()
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                batch = notifications.claim_due(options['batch_size'])
+                if batch:
+                    results = list(pool.map(deliver, batch))
+                    self.stdout.write(f"Sent {sum(results)}/{len(batch)} notification(s).")
+                    continue
+                if options['once']:
+                    break
+                connection.close()
+                time.sleep(options['poll_interval'])
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:48
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_updated_at(apps, schema_editor):
+    # Use the latest lifecycle timestamp we know of instead of the migration time
+    Visitor = apps.get_model('api', 'Visitor')
+    Visitor.objects.update(
+        updated_at=Coalesce('checked_out_at', 'checked_in_at', 'approved_at', 'created_at')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_fcmdevice'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='visitor',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+    ]
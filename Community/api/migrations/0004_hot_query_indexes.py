@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_visitor_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['-timestamp', '-id'], name='event_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visitor',
+            index=models.Index(fields=['-created_at', '-id'], name='visitor_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visitor',
+            index=models.Index(fields=['host_household', '-created_at'], name='visitor_hh_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visitor',
+            index=models.Index(fields=['host_household', 'status', '-created_at'], name='visitor_hh_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visitor',
+            index=models.Index(fields=['host_household', 'updated_at'], name='visitor_hh_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visitor',
+            index=models.Index(condition=models.Q(('status__in', ['APPROVED', 'PENDING', 'CHECKED_IN'])), fields=['-created_at'], name='visitor_active_created_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_outboxnotification'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fcmdevice',
+            index=models.Index(fields=['user'], include=('registration_id',), name='fcmdevice_user_token_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_visitor_scheduled_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxnotification',
+            name='delivered_through',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='outboxnotification',
+            name='retry_tokens',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:15
+
+from django.db import migrations, models
+
+
+def create_list_versions(apps, schema_editor):
+    ListVersion = apps.get_model('api', 'ListVersion')
+    for name in ['api.visitor', 'api.event']:
+        ListVersion.objects.get_or_create(name=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_outbox_fan_out_progress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListVersion',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('version', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_list_versions, migrations.RunPython.noop),
+    ]
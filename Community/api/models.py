@@ -1,6 +1,7 @@
 # api/models.py
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
 
@@ -59,6 +60,29 @@ class Visitor(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     checked_in_at = models.DateTimeField(null=True, blank=True)
     checked_out_at = models.DateTimeField(null=True, blank=True)
+    # Bumped on every save; drives delta-sync cursors and list ETags
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        # Designed around the hot queries; `manage.py check_query_plans` verifies them with EXPLAIN
+        indexes = [
+            # Guard/Admin visitor list, newest first
+            models.Index(fields=['-created_at', '-id'], name='visitor_created_idx'),
+            # Resident visitor list / list_my_visitors(status=ALL)
+            models.Index(fields=['host_household', '-created_at'], name='visitor_hh_created_idx'),
+            # list_my_visitors(status=X) and the resident copilot context
+            models.Index(fields=['host_household', 'status', '-created_at'], name='visitor_hh_status_created_idx'),
+            # Guard dashboard, one day's visitors (VisitorViewSet ?date=)
+            models.Index(fields=['scheduled_time'], name='visitor_scheduled_idx'),
+            # Resident list ETag (latest change in the household)
+            models.Index(fields=['host_household', 'updated_at'], name='visitor_hh_updated_idx'),
+            # Guard/Admin copilot context: only the small set of active visitors is indexed
+            models.Index(
+                fields=['-created_at'],
+                name='visitor_active_created_idx',
+                condition=models.Q(status__in=['APPROVED', 'PENDING', 'CHECKED_IN']),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.name} for {self.host_household.flat_number}"
@@ -112,6 +136,12 @@ class Event(models.Model):
     # Store extra details as JSON [cite: 47]
     payload = models.JSONField(null=True, blank=True) 
 
+    class Meta:
+        indexes = [
+            # Audit log, newest first
+            models.Index(fields=['-timestamp', '-id'], name='event_timestamp_idx'),
+        ]
+
     def __str__(self):
         return f"{self.type} by {self.actor} at {self.timestamp}"
 class FCMDevice(models.Model):
@@ -120,5 +150,63 @@ class FCMDevice(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     # Optional: Add device info like type (web, android, ios), name, last_used
 
+    class Meta:
+        indexes = [
+            # Covers the fan-out token lookup (user -> registration_id) without touching the table
+            models.Index(fields=['user'], include=['registration_id'], name='fcmdevice_user_token_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}'s device ({self.registration_id[:10]}...)"
+
+class OutboxNotification(models.Model):
+    """
+    A push notification waiting to be delivered. Written in the same
+    transaction as the state change that triggers it and drained by
+    `manage.py deliver_notifications`, so requests never wait on FCM.
+    """
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', _('Pending')
+        SENT = 'SENT', _('Sent')
+        FAILED = 'FAILED', _('Failed')
+
+    # Who receives it: {'household_id': 1}, {'role': 'GUARD'} or {'user_ids': [1, 2]}
+    audience = models.JSONField()
+    title = models.CharField(max_length=255)
+    body = models.TextField()
+    data = models.JSONField(default=dict, blank=True)
+
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    # Fan-out progress, so a retry only sends what did not get through: audience
+    # tokens are sent in registration_id order up to and including this one...
+    delivered_through = models.TextField(blank=True)
+    # ...except these, which failed and are sent again first
+    retry_tokens = models.JSONField(default=list, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The worker only ever scans due, pending rows
+            models.Index(fields=['next_attempt_at'], name='outbox_due_idx', condition=models.Q(status='PENDING')),
+        ]
+
+    def __str__(self):
+        return f"{self.title} -> {self.audience} ({self.status})"
+
+class ListVersion(models.Model):
+    """
+    A counter per list endpoint, bumped whenever rows that list shows are
+    deleted (api/sync.py). List ETags include it, so a deletion changes
+    them without the list ever being counted.
+    """
+    # Model label of the list's rows, e.g. 'api.visitor'
+    name = models.CharField(max_length=100, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+
     def __str__(self):
-        return f"{self.user.username}'s device ({self.registration_id[:10]}...)"
\ No newline at end of file
+        return f"{self.name} v{self.version}"
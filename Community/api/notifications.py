@@ -0,0 +1,254 @@
+# Community/api/notifications.py
+"""
+Notification outbox.
+
+Request handlers `build()` notifications and `enqueue_many()` them inside
+the transaction that changes visitor state; that is a single INSERT and
+never touches the network.
+`manage.py deliver_notifications` claims due rows, fans each one out to
+its audience's devices through the configured sender
+(NOTIFICATION_SENDER), and retries failures with exponential backoff.
+"""
+import random
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import firebase
+from .models import FCMDevice, OutboxNotification
+
+
+def build(title, body, household_id=None, role=None, user_ids=None, data=None):
+    """Unsaved notification for a household's members, everyone with a role, or explicit users."""
+    if household_id is not None:
+        audience = {'household_id': household_id}
+    elif role is not None:
+        audience = {'role': role}
+    else:
+        audience = {'user_ids': list(user_ids or [])}
+    return OutboxNotification(audience=audience, title=title, body=body, data=data or {})
+
+
+def enqueue_many(notifications):
+    """Queue several `build()` notifications with a single INSERT."""
+    return OutboxNotification.objects.bulk_create(notifications)
+
+
+def resolve_tokens(audience, after=''):
+    """The FCM tokens of the audience's active users past `after`, in registration_id order, in one query."""
+    devices = FCMDevice.objects.filter(user__is_active=True)
+    if 'household_id' in audience:
+        devices = devices.filter(user__household_id=audience['household_id'])
+    elif 'role' in audience:
+        devices = devices.filter(user__role=audience['role'])
+    else:
+        devices = devices.filter(user_id__in=audience.get('user_ids', []))
+    if after:
+        devices = devices.filter(registration_id__gt=after)
+    return list(devices.order_by('registration_id').values_list('registration_id', flat=True))
+
+
+def prune(dead_tokens):
+    """Delete tokens FCM reports as unregistered, so later fan-outs stop paying for them."""
+    if dead_tokens:
+        FCMDevice.objects.filter(registration_id__in=dead_tokens).delete()
+        print(f"Pruned {len(dead_tokens)} unregistered FCM token(s)")
+
+
+def _chunks(tokens):
+    size = settings.FCM_MULTICAST_BATCH_SIZE
+    return [tokens[start:start + size] for start in range(0, len(tokens), size)]
+
+
+def fan_out(notification, sender):
+    """
+    Send a notification to every device of its audience: one token query,
+    then as few multicast calls as FCM allows. Dead tokens are pruned as
+    each batch returns, and progress is saved on the row between batches,
+    so a retry only sends the tokens that failed and those not reached yet.
+    Raises SendError if any token failed. Returns the number of tokens targeted.
+    """
+    pending_retry = list(notification.retry_tokens)
+    fresh = resolve_tokens(notification.audience, after=notification.delivered_through)
+    targeted = len(pending_retry) + len(fresh)
+    batches = [(batch, False) for batch in _chunks(pending_retry)] + [(batch, True) for batch in _chunks(fresh)]
+    failed = []
+    for index, (batch, is_fresh) in enumerate(batches):
+        try:
+            dead_tokens = sender.send(batch, notification.title, notification.body, notification.data)
+        except SendError as e:
+            dead_tokens = e.dead_tokens
+            failed.extend(e.failed_tokens)
+        prune(dead_tokens)
+        if is_fresh:
+            notification.delivered_through = batch[-1]
+        else:
+            del pending_retry[:len(batch)]
+        notification.retry_tokens = failed + pending_retry
+        # A lone batch that went through needs no bookkeeping; deliver() marks the row sent
+        if index < len(batches) - 1 or failed:
+            OutboxNotification.objects.filter(id=notification.id).update(
+                delivered_through=notification.delivered_through,
+                retry_tokens=notification.retry_tokens,
+            )
+    if failed:
+        raise SendError(f"{len(failed)} device(s) failed, will retry", failed_tokens=failed)
+    return targeted
+
+
+# -----------------------------------------------------------
+# Senders: send(tokens, title, body, data) -> list of dead tokens
+# -----------------------------------------------------------
+
+class SendError(Exception):
+    """Raised by a sender when some tokens did not get through; dead tokens are still reported."""
+
+    def __init__(self, message, dead_tokens=(), failed_tokens=()):
+        super().__init__(message)
+        self.dead_tokens = list(dead_tokens)
+        self.failed_tokens = list(failed_tokens)
+
+
+class FCMSender:
+    """
+    Sends through Firebase Cloud Messaging with send_each_for_multicast
+    (the legacy batch endpoint behind send_multicast has been shut down).
+    Tokens FCM answers UNAVAILABLE/INTERNAL are retried on their own a few
+    times; any still failing are raised as SendError for the outbox to retry.
+    """
+
+    def send(self, tokens, title, body, data):
+        from firebase_admin import exceptions, messaging
+
+        firebase.get_app()
+        dead_tokens, failed, pending = [], [], list(tokens)
+        for attempt in range(settings.FCM_TRANSIENT_RETRIES + 1):
+            if attempt:
+                time.sleep(settings.FCM_TRANSIENT_RETRY_SECONDS * 2 ** (attempt - 1))
+            message = messaging.MulticastMessage(
+                notification=messaging.Notification(title=title, body=body),
+                tokens=pending,
+                data=data or {}
+            )
+            response = messaging.send_each_for_multicast(message)
+            transient = []
+            for token, result in zip(pending, response.responses):
+                if result.success:
+                    continue
+                if isinstance(result.exception, (messaging.UnregisteredError, messaging.SenderIdMismatchError)):
+                    dead_tokens.append(token)
+                elif isinstance(result.exception, (exceptions.UnavailableError, exceptions.InternalError)):
+                    transient.append(token)
+                else:
+                    failed.append(token)
+            print(f'Sent FCM to {response.success_count}/{len(pending)} device(s)')
+            pending = transient
+            if not pending:
+                break
+        failed.extend(pending)
+        if failed:
+            raise SendError(f"FCM failed for {len(failed)}/{len(tokens)} device(s)", dead_tokens, failed)
+        return dead_tokens
+
+
+class LocalStubSender:
+    """
+    Records notifications in memory instead of sending them. Used by tests
+    and local development (set NOTIFICATION_SENDER to this class).
+    Set `fail_next` to make the next N sends raise; tokens in `dead_tokens`
+    are reported back as unregistered and tokens in `unavailable_tokens`
+    fail like FCMSender's transient errors; `latency` makes each send take
+    that many seconds, like a round trip to FCM.
+    """
+    sent = []
+    fail_next = 0
+    dead_tokens = set()
+    unavailable_tokens = set()
+    latency = 0.0
+    _lock = threading.Lock()
+
+    def send(self, tokens, title, body, data):
+        if LocalStubSender.latency:
+            time.sleep(LocalStubSender.latency)
+        with self._lock:
+            if LocalStubSender.fail_next:
+                LocalStubSender.fail_next -= 1
+                raise ConnectionError("Simulated notification failure")
+            LocalStubSender.sent.append({'tokens': list(tokens), 'title': title, 'body': body, 'data': data})
+        dead_tokens = [token for token in tokens if token in LocalStubSender.dead_tokens]
+        failed = [token for token in tokens if token in LocalStubSender.unavailable_tokens]
+        if failed:
+            raise SendError(f"Simulated UNAVAILABLE for {len(failed)} device(s)", dead_tokens, failed)
+        return dead_tokens
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls.sent = []
+            cls.fail_next = 0
+            cls.dead_tokens = set()
+            cls.unavailable_tokens = set()
+            cls.latency = 0.0
+
+
+def get_sender():
+    return import_string(settings.NOTIFICATION_SENDER)()
+
+
+# -----------------------------------------------------------
+# Delivery (used by the deliver_notifications worker)
+# -----------------------------------------------------------
+
+def claim_due(limit):
+    """
+    Lease up to `limit` due notifications to this worker by pushing their
+    next_attempt_at forward. Rows locked by another worker are skipped; if
+    this worker dies the lease simply expires and the rows are retried.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            OutboxNotification.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboxNotification.Status.PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at')
+            .values_list('id', flat=True)[:limit]
+        )
+        OutboxNotification.objects.filter(id__in=ids).update(
+            next_attempt_at=now + timedelta(seconds=settings.NOTIFICATION_LEASE_SECONDS)
+        )
+    return list(OutboxNotification.objects.filter(id__in=ids))
+
+
+def retry_delay(attempts):
+    base = settings.NOTIFICATION_RETRY_BASE_SECONDS
+    delay = min(base * 2 ** (attempts - 1), settings.NOTIFICATION_RETRY_MAX_SECONDS)
+    return timedelta(seconds=delay + random.uniform(0, base))
+
+
+def deliver(notification, sender):
+    """Send one claimed notification and record the outcome. Returns True if it was sent."""
+    try:
+        fan_out(notification, sender)
+    except Exception as e:
+        attempts = notification.attempts + 1
+        failed = attempts >= settings.NOTIFICATION_MAX_ATTEMPTS
+        OutboxNotification.objects.filter(id=notification.id).update(
+            attempts=attempts,
+            last_error=str(e)[:1000],
+            status=OutboxNotification.Status.FAILED if failed else OutboxNotification.Status.PENDING,
+            next_attempt_at=timezone.now() + retry_delay(attempts),
+        )
+        print(f"Notification {notification.id} attempt {attempts} failed: {e}")
+        return False
+
+    OutboxNotification.objects.filter(id=notification.id).update(
+        attempts=notification.attempts + 1,
+        status=OutboxNotification.Status.SENT,
+        sent_at=timezone.now(),
+    )
+    return True
@@ -0,0 +1,114 @@
+# Community/api/pagination.py
+"""
+Keyset (cursor) pagination for the list endpoints.
+
+Pages are fetched with `WHERE (sort_key, id) < (last_sort_key, last_id)`
+against an index on the same columns, so page N costs the same as page 1
+no matter how large the table grows. Cursors are opaque base64 tokens.
+"""
+import base64
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_position(values):
+    raw = json.dumps([v.isoformat() if hasattr(v, 'isoformat') else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_position(cursor, model, ordering):
+    """Decode a cursor back into typed values for the `ordering` fields, or None if invalid."""
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        fields = [model._meta.get_field(name.lstrip('-')) for name in ordering]
+        if not isinstance(raw, list) or len(raw) != len(fields):
+            return None
+        return [field.to_python(value) for field, value in zip(fields, raw)]
+    except Exception:
+        return None
+
+
+def _lookup(name):
+    return name.lstrip('-'), 'lt' if name.startswith('-') else 'gt'
+
+
+def keyset_filter(ordering, position):
+    """
+    Q for rows strictly after `position` in `ordering`: either a unique
+    column, or a sort column plus unique tie-breaker such as
+    ('-created_at', '-id'). The two-column form is written as
+        a <= x AND (a < x OR b < y)
+    so the leading condition is an index range the planner can use.
+    """
+    first, first_op = _lookup(ordering[0])
+    if len(ordering) == 1:
+        return Q(**{f'{first}__{first_op}': position[0]})
+    second, second_op = _lookup(ordering[1])
+    return Q(**{f'{first}__{first_op}e': position[0]}) & (
+        Q(**{f'{first}__{first_op}': position[0]}) | Q(**{f'{second}__{second_op}': position[1]})
+    )
+
+
+def row_value(row, name):
+    """Field value of a page row: a model instance or a `.values()` dict."""
+    return row[name] if isinstance(row, dict) else getattr(row, name)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginates on the view's `keyset_ordering` (a sort column plus a unique
+    tie-breaker). Clients follow `next` until it is null; `page_size` can be
+    requested up to KEYSET_MAX_PAGE_SIZE.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def get_page_size(self, request):
+        try:
+            requested = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return settings.REST_FRAMEWORK['PAGE_SIZE']
+        return max(1, min(requested, settings.KEYSET_MAX_PAGE_SIZE))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = getattr(view, 'keyset_ordering', ('-id',))
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*ordering)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            position = decode_position(cursor, queryset.model, ordering)
+            if position is None:
+                raise NotFound('Invalid cursor.')
+            queryset = queryset.filter(keyset_filter(ordering, position))
+
+        # Fetch one extra row to know whether there is a next page
+        page = list(queryset[:page_size + 1])
+        self.next_url = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            last = page[-1]
+            next_cursor = encode_position([row_value(last, name.lstrip('-')) for name in ordering])
+            self.next_url = replace_query_param(
+                request.build_absolute_uri(), self.cursor_query_param, next_cursor
+            )
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.next_url, 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
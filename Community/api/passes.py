@@ -0,0 +1,25 @@
+# Community/api/passes.py
+"""
+Visitor pass creation shared by the REST API and the AI copilot.
+"""
+from .audit import EventRecorder
+from .models import Event, Visitor
+
+
+def create_visitor_passes(actor, passes):
+    """
+    Create PENDING visitor passes for the actor's household in one
+    transaction: one INSERT for all the visitors and one for their
+    VISITOR_CREATED events, however many passes there are.
+    `passes` are dicts of Visitor fields (name, phone, purpose, scheduled_time).
+    """
+    household = actor.household
+    visitors = [
+        Visitor(**fields, host_household=household, status=Visitor.Status.PENDING)
+        for fields in passes
+    ]
+    with EventRecorder() as audit:
+        Visitor.objects.bulk_create(visitors)
+        for visitor in visitors:
+            audit.record(Event.EventType.VISITOR_CREATED, actor, visitor)
+    return visitors
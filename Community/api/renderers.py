@@ -0,0 +1,37 @@
+# Community/api/renderers.py
+"""
+JSON renderer backed by orjson.
+"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # Fall back to DRF's json-based renderer
+    orjson = None
+
+_default = JSONEncoder().default
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Drop-in for DRF's JSONRenderer (compact, UTF-8) that encodes with
+    orjson. Types orjson doesn't know (Decimal, lazy strings, ...) go
+    through DRF's encoder; indented output (e.g. `; indent=4` in Accept)
+    is left to DRF.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Datetimes go through DRF's encoder too, so they format exactly as before
+        ret = orjson.dumps(
+            data,
+            default=_default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        )
+        # Same JavaScript-safety escaping as DRF
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
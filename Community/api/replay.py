@@ -0,0 +1,163 @@
+# Community/api/replay.py
+"""
+Offline stand-ins for Gemini, for tests, local development and benchmarks.
+
+A recording is a JSON object mapping request keys to lists of
+GenerationResponse dicts (the shape `GenerationResponse.to_dict()`
+gives), function calls included. A request's key is the user's newest
+message, normalized like the response cache does it ("who's pending"),
+with " -> <tool names>" appended for the call that phrases tool results.
+Lookups fall back to "* -> <tool names>", then "*". Several responses
+under one key are replayed in turn.
+
+ReplayModel serves a recording, waiting COPILOT_REPLAY_LATENCY seconds
+per call. RecordingModel wraps the real model and appends what it
+receives to COPILOT_REPLAY_FILE, so a live session can be replayed
+later. Select either with COPILOT_MODEL_BACKEND.
+"""
+import asyncio
+import itertools
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+
+from . import chat_history, llm
+from .copilot_cache import normalize_message
+
+FALLBACK_KEY = '*'
+
+
+def request_key(contents):
+    """The recording key for a list of Content objects (see the module docstring)."""
+    messages = [content.to_dict() for content in contents]
+    user_text = next(
+        (part['text'] for message in reversed(messages) if message.get('role') == 'user'
+         for part in message.get('parts', []) if 'text' in part),
+        '',
+    )
+    key = normalize_message(user_text)
+    last = messages[-1] if messages else {}
+    if last.get('role') == 'function':
+        names = sorted({part['function_response']['name'] for part in last.get('parts', [])})
+        key += ' -> ' + ','.join(names)
+    return key
+
+
+def _text_tokens(value):
+    return chat_history.estimate_tokens(json.dumps(value) if not isinstance(value, str) else value)
+
+
+def _estimated_usage(contents, response):
+    # Recordings made by hand carry no usage; estimate it the way chat_history budgets prompts
+    prompt = sum(_text_tokens(part.get('text') or part) for content in contents for part in content.to_dict()['parts'])
+    output = sum(
+        _text_tokens(part.get('text') or part)
+        for candidate in response.get('candidates', []) for part in candidate['content']['parts']
+    )
+    return {'prompt_token_count': prompt, 'candidates_token_count': output, 'total_token_count': prompt + output}
+
+
+class ReplayModel:
+    """Answers generate_content from a recording; no network, no credentials."""
+
+    def __init__(self, name=None, recording=None, latency=None):
+        if recording is None:
+            with open(settings.COPILOT_REPLAY_FILE, encoding='utf-8') as f:
+                recording = json.load(f)
+        self.latency = settings.COPILOT_REPLAY_LATENCY if latency is None else latency
+        self._lock = threading.Lock()
+        self._replies = {key: itertools.cycle(responses) for key, responses in recording.items() if responses}
+
+    def _lookup(self, contents):
+        key = request_key(contents)
+        candidates = [key]
+        if ' -> ' in key:
+            candidates.append(FALLBACK_KEY + key[key.index(' -> '):])
+        candidates.append(FALLBACK_KEY)
+        with self._lock:
+            for candidate in candidates:
+                if candidate in self._replies:
+                    response = dict(next(self._replies[candidate]))
+                    break
+            else:
+                raise LookupError(f"No recorded Gemini response for {key!r}")
+        response.setdefault('usage_metadata', _estimated_usage(contents, response))
+        return response
+
+    def _chunks(self, response):
+        # One chunk per part, usage on the last, as Gemini streams it
+        from vertexai.generative_models import GenerationResponse
+
+        parts = response['candidates'][0]['content']['parts']
+        for index, part in enumerate(parts):
+            chunk = {'candidates': [{'content': {'role': 'model', 'parts': [part]}}]}
+            if index == len(parts) - 1:
+                chunk['usage_metadata'] = response['usage_metadata']
+            yield GenerationResponse.from_dict(chunk)
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        from vertexai.generative_models import GenerationResponse
+
+        response = self._lookup(contents)
+        time.sleep(self.latency)
+        return self._chunks(response) if stream else GenerationResponse.from_dict(response)
+
+    async def generate_content_async(self, contents, **kwargs):
+        from vertexai.generative_models import GenerationResponse
+
+        response = self._lookup(contents)
+        await asyncio.sleep(self.latency)
+        return GenerationResponse.from_dict(response)
+
+
+class RecordingModel:
+    """Passes calls through to Vertex AI and appends each response to COPILOT_REPLAY_FILE."""
+
+    _file_lock = threading.Lock()
+
+    def __init__(self, name):
+        self.model = llm.vertex_model(name)
+
+    def _record(self, contents, response):
+        path = settings.COPILOT_REPLAY_FILE
+        with self._file_lock:
+            recording = {}
+            if os.path.exists(path):
+                with open(path, encoding='utf-8') as f:
+                    recording = json.load(f)
+            recording.setdefault(request_key(contents), []).append(response)
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(recording, f, indent=2)
+
+    def _recorded_stream(self, contents, chunks):
+        # Keep the chunks' parts (adjacent text merged) and the final usage
+        parts, usage = [], None
+        for chunk in chunks:
+            data = chunk.to_dict()
+            usage = data.get('usage_metadata') or usage
+            for candidate in data.get('candidates', [])[:1]:
+                for part in candidate.get('content', {}).get('parts', []):
+                    if 'text' in part and parts and 'text' in parts[-1]:
+                        parts[-1] = {'text': parts[-1]['text'] + part['text']}
+                    else:
+                        parts.append(part)
+            yield chunk
+        response = {'candidates': [{'content': {'role': 'model', 'parts': parts}}]}
+        if usage:
+            response['usage_metadata'] = usage
+        self._record(contents, response)
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        response = self.model.generate_content(contents, stream=stream, **kwargs)
+        if stream:
+            return self._recorded_stream(contents, response)
+        self._record(contents, response.to_dict())
+        return response
+
+    async def generate_content_async(self, contents, **kwargs):
+        response = await self.model.generate_content_async(contents, **kwargs)
+        self._record(contents, response.to_dict())
+        return response
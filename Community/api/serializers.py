@@ -1,5 +1,6 @@
 # api/serializers.py
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from django.conf import settings
 from rest_framework import serializers
 from .models import CustomUser, Household, Visitor, Event  # <-- THIS LINE IS CRITICAL
 from .models import FCMDevice
@@ -39,10 +40,12 @@ class VisitorSerializer(serializers.ModelSerializer):
     host_household = HouseholdSerializer(read_only=True)
     
     # We'll use this to show the host household's ID
+    # Optional: residents' passes are always created for their own household
     host_household_id = serializers.PrimaryKeyRelatedField(
         queryset=Household.objects.all(), 
         source='host_household', 
-        write_only=True
+        write_only=True,
+        required=False
     )
 
     class Meta:
@@ -50,11 +53,23 @@ class VisitorSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'name', 'phone', 'purpose', 'status', 
             'host_household', 'host_household_id', 'scheduled_time', 
-            'created_at', 'checked_in_at', 'checked_out_at'
+            'created_at', 'checked_in_at', 'checked_out_at', 'updated_at'
         ]
         # Status and host_household are set by the system, not by direct user input
         read_only_fields = ['status', 'host_household']
 
+class BulkTransitionSerializer(serializers.Serializer):
+    """
+    Body of the bulk gate endpoints: the visitors to move, plus an
+    optional reason (recorded on bulk denials).
+    """
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.VISITOR_BULK_MAX_TRANSITIONS
+    )
+    reason = serializers.CharField(required=False, default='No reason provided')
+
 class EventSerializer(serializers.ModelSerializer):
     # Show the username of the actor, not just their ID
     actor = serializers.StringRelatedField()
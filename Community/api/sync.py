@@ -0,0 +1,128 @@
+# Community/api/sync.py
+"""
+Delta-sync support for the list endpoints the dashboards refetch.
+
+- Every list response carries an ETag derived from the newest change
+  timestamp of the role-scoped queryset, the list's deletion version
+  (ListVersion), the caller's role and household, and the query string.
+  A matching If-None-Match gets a bodyless 304 for the price of one
+  query: an index probe for the newest row plus a primary-key lookup.
+- `?since=<cursor>` returns only rows created or changed after the cursor,
+  plus the cursor to send next time. At most KEYSET_MAX_PAGE_SIZE rows are
+  returned per call; `has_more` tells the client to call again right away.
+"""
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Subquery
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from .models import ListVersion
+from .pagination import decode_position, encode_position, keyset_filter, row_value
+
+# Deleting a row of the key's model changes what these lists show: events
+# name their actor and subject visitor, which go to NULL with them
+DELETION_CHANGES_LISTS = {
+    'api.visitor': ['api.visitor', 'api.event'],
+    'api.event': ['api.event'],
+    'api.customuser': ['api.event'],
+}
+
+
+def bump_list_versions(sender, **kwargs):
+    """post_delete receiver (connected in ApiConfig.ready) for the models in DELETION_CHANGES_LISTS."""
+    for name in DELETION_CHANGES_LISTS[sender._meta.label_lower]:
+        if not ListVersion.objects.filter(name=name).update(version=F('version') + 1):
+            ListVersion.objects.get_or_create(name=name, defaults={'version': 1})
+
+
+def scope_state_query(queryset, delta_field):
+    """The ETag's one query: the list's deletion version and the newest `delta_field` in `queryset`."""
+    latest = queryset.order_by(f'-{delta_field}').values(delta_field)[:1]
+    return (ListVersion.objects.filter(name=queryset.model._meta.label_lower)
+            .annotate(latest=Subquery(latest)).values('version', 'latest'))
+
+
+class DeltaSyncMixin:
+    """
+    Mix into a viewset (before the DRF base) to add ETag/304 and `?since=`
+    delta mode to `list`. `delta_field` must be a timestamp that is bumped
+    on every create and state change of a row.
+
+    Rows changed within DELTA_SYNC_OVERLAP_SECONDS before the cursor are
+    re-sent, so a slow transaction that commits with an older timestamp is
+    not missed; clients upsert rows by id. Deletions (Admin-only) are not
+    represented in a delta; they bump the list's ListVersion and so change
+    the ETag, and a conditional full fetch shows them.
+    """
+    delta_field = 'updated_at'
+
+    def get_scope_state(self, queryset):
+        state = scope_state_query(queryset, self.delta_field).first()
+        if state is None:
+            # Version rows are created by migration 0009; recreate one if it went missing
+            ListVersion.objects.get_or_create(name=queryset.model._meta.label_lower)
+            state = scope_state_query(queryset, self.delta_field).first()
+        return state
+
+    def get_etag(self, request, state):
+        """Weak ETag for exactly this response: scope state, who is asking, and which page/delta."""
+        user = request.user
+        latest = state['latest']
+        key = '|'.join([
+            str(latest.timestamp() if latest else 0),
+            str(state['version']),
+            str(user.role),
+            str(user.household_id),
+            '&'.join(sorted(request.GET.urlencode().split('&'))),
+        ])
+        return f'W/"{hashlib.sha1(key.encode()).hexdigest()[:20]}"'
+
+    def get_delta(self, queryset, since, latest):
+        ordering = (self.delta_field, 'id')
+        position = decode_position(since, queryset.model, ordering)
+        if position is not None:
+            # Continuation of a truncated delta: strict keyset, no overlap
+            changed = queryset.filter(keyset_filter(ordering, position))
+        else:
+            position = decode_position(since, queryset.model, ordering[:1])
+            if position is None:
+                raise ValidationError({'since': 'Invalid cursor.'})
+            overlap = timedelta(seconds=settings.DELTA_SYNC_OVERLAP_SECONDS)
+            changed = queryset.filter(**{f'{self.delta_field}__gt': position[0] - overlap})
+
+        limit = settings.KEYSET_MAX_PAGE_SIZE
+        rows = list(changed.order_by(*ordering)[:limit + 1])
+        has_more = len(rows) > limit
+        if has_more:
+            rows = rows[:limit]
+            cursor = encode_position([row_value(rows[-1], self.delta_field), row_value(rows[-1], 'id')])
+        else:
+            cursor = encode_position([latest or position[0]])
+        return {
+            'cursor': cursor,
+            'has_more': has_more,
+            'results': self.get_serializer(rows, many=True).data,
+        }
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        state = self.get_scope_state(queryset)
+        latest = state['latest']
+        etag = self.get_etag(request, state)
+
+        if etag in request.headers.get('If-None-Match', ''):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        elif 'since' in request.query_params:
+            response = Response(self.get_delta(queryset, request.query_params['since'], latest))
+        else:
+            response = super().list(request, *args, **kwargs)
+            if latest:
+                response['X-Delta-Cursor'] = encode_position([latest])
+
+        response['ETag'] = etag
+        response['Vary'] = 'Authorization'
+        return response
@@ -1,3 +1,1382 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from . import (
+    authentication, changefeed, chat_history, copilot_cache, copilot_metrics, intents, llm, notifications, replay,
+    tool_runner, transitions,
+)
+from .ai_tools import AICopilotService, get_gemini_tool, get_role_prompt, tools_for_role
+from .audit import EventRecorder
+from .models import CustomUser, Event, FCMDevice, Household, ListVersion, OutboxNotification, Visitor
+from .pagination import encode_position
+from .serializers import MyTokenObtainPairSerializer
+
+# Row counts every read path is checked at; the query budget must not move.
+ROW_COUNTS = (10, 1_000, 10_000)
+
+# A delta-sync cursor older than every row, so the whole (capped) delta is returned
+SINCE_EPOCH = encode_position([datetime(2000, 1, 1, tzinfo=timezone.utc)])
+
+
+def _change(event_id, household_id=1):
+    return {'type': 'VISITOR_APPROVED', 'event_id': event_id, 'visitor': {'id': event_id, 'host_household_id': household_id}}
+
+
+def _cursors(result):
+    changes, complete = result
+    return [change['cursor'] for change in changes], complete
+
+
+class ChangeBusTests(SimpleTestCase):
+    """Change feed cursors are audit event ids, so every worker process reads them the same way."""
+
+    def test_cursors_agree_across_processes(self):
+        worker_a, worker_b = changefeed.ChangeBus(maxlen=10), changefeed.ChangeBus(maxlen=10)
+        for event_id in (1, 2, 3):
+            worker_a.publish(_change(event_id))
+        worker_b.start_at(3)  # B started listening after event 3 committed
+        for event_id in (4, 5):
+            worker_a.publish(_change(event_id))
+            worker_b.publish(_change(event_id))
+
+        # A client can take its cursor from either worker to the other
+        for cursor in (3, 4, 5):
+            self.assertEqual(_cursors(worker_b.since(cursor)), _cursors(worker_a.since(cursor)))
+        self.assertEqual(_cursors(worker_b.since(3)), ([4, 5], True))
+        self.assertEqual(_cursors(worker_a.since(1)), ([2, 3, 4, 5], True))
+        self.assertEqual(worker_b.since(1), ([], False))  # B never saw event 2: refetch
+
+        # A cursor B hasn't reached yet means "nothing newer", not a resync
+        worker_a.publish(_change(6))
+        self.assertEqual(worker_b.since(6), ([], True))
+        worker_b.publish(_change(6))
+        worker_b.publish(_change(7))
+        self.assertEqual(_cursors(worker_b.since(6)), ([7], True))
+
+    def test_late_commit_of_a_lower_id_is_delivered(self):
+        bus = changefeed.ChangeBus(maxlen=10)
+        bus.publish(_change(11))
+        bus.publish(_change(10))  # Written first, committed second
+        self.assertEqual(_cursors(bus.since(11)), ([10], True))
+        self.assertEqual(_cursors(bus.since(10)), ([], True))
+        self.assertEqual(_cursors(bus.since(9)), ([11, 10], True))
+
+    def test_cursor_older_than_the_buffer_resyncs(self):
+        bus = changefeed.ChangeBus(maxlen=2)
+        for event_id in (1, 2, 3):
+            bus.publish(_change(event_id))
+        self.assertEqual(bus.since(0), ([], False))
+        self.assertEqual(_cursors(bus.since(1)), ([2, 3], True))
+
+
+@override_settings(CHANGEFEED_LONG_POLL_TIMEOUT=0.2)
+class ChangeFeedViewTests(TestCase):
+    """GET /api/changes/: the long-poll returns visible changes, times out empty, or asks for a resync."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.household = Household.objects.create(flat_number='A-1')
+        cls.resident = CustomUser.objects.create_user(
+            'resident', email='resident@example.com', role=CustomUser.Role.RESIDENT, household=cls.household
+        )
+        cls.neighbour = CustomUser.objects.create_user(
+            'neighbour', email='neighbour@example.com', role=CustomUser.Role.RESIDENT,
+            household=Household.objects.create(flat_number='A-2'),
+        )
+
+    def setUp(self):
+        original = changefeed.bus
+        self.bus = changefeed.bus = changefeed.ChangeBus(maxlen=3)
+        self.addCleanup(setattr, changefeed, 'bus', original)
+
+    async def _poll(self, user, cursor=None):
+        token = MyTokenObtainPairSerializer.get_token(user).access_token
+        params = {} if cursor is None else {'cursor': cursor}
+        response = await AsyncClient().get('/api/changes/', params, headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    async def test_first_poll_returns_the_current_cursor(self):
+        self.bus.publish(_change(7, self.household.id))
+        self.assertEqual(await self._poll(self.resident), {'cursor': 7, 'changes': [], 'resync': False})
+
+    async def test_poll_times_out_empty(self):
+        started = time.monotonic()
+        self.assertEqual(await self._poll(self.resident, 0), {'cursor': 0, 'changes': [], 'resync': False})
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+
+    async def test_waiting_poll_wakes_on_a_visible_change(self):
+        poll = asyncio.ensure_future(self._poll(self.resident, 0))
+        await asyncio.sleep(0.05)
+        self.bus.publish(_change(1, self.neighbour.household_id))  # Not this resident's household
+        self.bus.publish(_change(2, self.household.id))
+        body = await poll
+        self.assertEqual([change['cursor'] for change in body['changes']], [2])
+        self.assertEqual((body['cursor'], body['resync']), (2, False))
+
+    async def test_cursor_older_than_the_buffer_resyncs(self):
+        for event_id in range(1, 6):
+            self.bus.publish(_change(event_id, self.household.id))
+        self.assertEqual(await self._poll(self.neighbour, 1), {'cursor': 5, 'changes': [], 'resync': True})
+
+
+class DeltaSyncTests(TestCase):
+    """List ETags and ?since= deltas (api/sync.py)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.household = Household.objects.create(flat_number='A-1')
+        cls.admin = CustomUser.objects.create_user('admin', email='admin@example.com', role=CustomUser.Role.ADMIN)
+        cls.guard = CustomUser.objects.create_user('guard', email='guard@example.com', role=CustomUser.Role.GUARD)
+        cls.base = datetime(2030, 1, 1, 12, 0, tzinfo=timezone.utc)
+        cls.visitors = Visitor.objects.bulk_create(
+            Visitor(name=f'Guest {i}', host_household=cls.household) for i in range(3)
+        )
+        for i, visitor in enumerate(cls.visitors):
+            Visitor.objects.filter(id=visitor.id).update(updated_at=cls.base + timedelta(seconds=10 * i))
+
+    def _get(self, params=None, user=None, **headers):
+        client = APIClient()
+        client.force_authenticate(user or self.guard)
+        return client.get('/api/visitors/', params, headers=headers)
+
+    def _names(self, response):
+        return sorted(row['name'] for row in response.data['results'])
+
+    def test_unchanged_list_is_not_modified(self):
+        etag = self._get()['ETag']
+        response = self._get(**{'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        Visitor.objects.filter(id=self.visitors[0].id).update(updated_at=self.base + timedelta(minutes=5))
+        self.assertEqual(self._get(**{'If-None-Match': etag}).status_code, 200)
+
+    def test_etag_covers_page_caller_and_deletions(self):
+        etag = self._get()['ETag']
+        self.assertNotEqual(self._get({'page_size': 1})['ETag'], etag)
+        self.assertNotEqual(self._get(user=self.admin)['ETag'], etag)
+        # The newest row is unchanged, but the list is not
+        Visitor.objects.filter(id=self.visitors[0].id).delete()
+        self.assertEqual(self._get(**{'If-None-Match': etag}).status_code, 200)
+
+    def test_deletions_bump_the_list_versions(self):
+        versions = dict(ListVersion.objects.values_list('name', 'version'))
+        self.visitors[0].delete()
+        CustomUser.objects.create_user('gone', email='gone@example.com').delete()
+        self.assertEqual(dict(ListVersion.objects.values_list('name', 'version')), {
+            'api.visitor': versions['api.visitor'] + 1,
+            'api.event': versions['api.event'] + 2,
+        })
+
+    def test_since_resends_the_overlap_window(self):
+        cursor = encode_position([self.base + timedelta(seconds=21)])
+        with self.settings(DELTA_SYNC_OVERLAP_SECONDS=0):
+            self.assertEqual(self._names(self._get({'since': cursor})), [])
+        # Guest 2 changed 1s before the cursor: a slow commit the client may not have seen
+        with self.settings(DELTA_SYNC_OVERLAP_SECONDS=2):
+            response = self._get({'since': cursor})
+        self.assertEqual(self._names(response), ['Guest 2'])
+        self.assertEqual(response.data['cursor'], encode_position([self.base + timedelta(seconds=20)]))
+        self.assertFalse(response.data['has_more'])
+
+    def test_truncated_delta_continues_without_overlap(self):
+        with self.settings(KEYSET_MAX_PAGE_SIZE=2):
+            first = self._get({'since': SINCE_EPOCH})
+            self.assertEqual(self._names(first), ['Guest 0', 'Guest 1'])
+            self.assertTrue(first.data['has_more'])
+            rest = self._get({'since': first.data['cursor']})
+        self.assertEqual(self._names(rest), ['Guest 2'])
+        self.assertFalse(rest.data['has_more'])
+
+    def test_invalid_since_is_rejected(self):
+        self.assertEqual(self._get({'since': 'not-a-cursor'}).status_code, 400)
+
+
+class KeysetPaginationTests(TestCase):
+    """Keyset pages (api/pagination.py) and the guard's ?date= filter on the visitor list."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.household = Household.objects.create(flat_number='A-1')
+        cls.guard = CustomUser.objects.create_user('guard', email='guard@example.com', role=CustomUser.Role.GUARD)
+        cls.day = datetime(2030, 1, 1, tzinfo=timezone.utc)
+        cls.visitors = Visitor.objects.bulk_create(
+            Visitor(name=f'Guest {i}', host_household=cls.household) for i in range(5)
+        )
+        # Guests 1-3 share a creation time, so only the id tie-breaker orders them
+        for i, visitor in enumerate(cls.visitors):
+            Visitor.objects.filter(id=visitor.id).update(created_at=cls.day + timedelta(hours=min(i, 1)))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.guard)
+
+    def _names(self, response):
+        return [row['name'] for row in response.data['results']]
+
+    def test_following_next_visits_every_row_once(self):
+        response = self.client.get('/api/visitors/', {'page_size': 2})
+        pages = [self._names(response)]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            pages.append(self._names(response))
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual(
+            [name for page in pages for name in page], ['Guest 4', 'Guest 3', 'Guest 2', 'Guest 1', 'Guest 0']
+        )
+
+    def test_invalid_cursor_is_not_found(self):
+        self.assertEqual(self.client.get('/api/visitors/', {'cursor': 'not-a-cursor'}).status_code, 404)
+
+    def test_page_size_is_clamped(self):
+        with self.settings(KEYSET_MAX_PAGE_SIZE=3):
+            self.assertEqual(len(self._names(self.client.get('/api/visitors/', {'page_size': 1000}))), 3)
+        self.assertEqual(len(self._names(self.client.get('/api/visitors/', {'page_size': 0}))), 1)
+        self.assertEqual(len(self._names(self.client.get('/api/visitors/', {'page_size': 'all'}))), 5)
+
+    def test_date_filters_by_schedule_or_walk_in_day(self):
+        next_day = self.day + timedelta(days=1)
+        # Created on the day but scheduled for the next one; a walk-in created the next day
+        Visitor.objects.filter(id=self.visitors[0].id).update(scheduled_time=next_day + timedelta(hours=9))
+        Visitor.objects.filter(id=self.visitors[1].id).update(created_at=next_day)
+
+        response = self.client.get('/api/visitors/', {'date': '2030-01-02'})
+        self.assertEqual(sorted(self._names(response)), ['Guest 0', 'Guest 1'])
+        response = self.client.get('/api/visitors/', {'date': '2030-01-01'})
+        self.assertEqual(sorted(self._names(response)), ['Guest 2', 'Guest 3', 'Guest 4'])
+
+    def test_invalid_date_is_rejected(self):
+        self.assertEqual(self.client.get('/api/visitors/', {'date': '01/02/2030'}).status_code, 400)
+
+
+def _outbox_audience():
+    household = Household.objects.create(flat_number='A-1')
+    resident = CustomUser.objects.create_user(
+        'resident', email='resident@example.com', role=CustomUser.Role.RESIDENT, household=household
+    )
+    FCMDevice.objects.create(user=resident, registration_id='token-1')
+    return household
+
+
+@override_settings(NOTIFICATION_SENDER='api.notifications.LocalStubSender')
+class OutboxTests(TestCase):
+    """Claiming, delivering and retrying outbox rows (api/notifications.py)."""
+
+    def setUp(self):
+        notifications.LocalStubSender.reset()
+        self.addCleanup(notifications.LocalStubSender.reset)
+        self.household = _outbox_audience()
+        self.sender = notifications.get_sender()
+
+    def _queue(self, **fields):
+        notification = notifications.build('Visitor Arrived', 'Guest is at the gate.', household_id=self.household.id)
+        for name, value in fields.items():
+            setattr(notification, name, value)
+        return notifications.enqueue_many([notification])[0]
+
+    def test_claim_leases_only_due_pending_rows(self):
+        due = self._queue()
+        self._queue(next_attempt_at=datetime.now(timezone.utc) + timedelta(minutes=5))
+        self._queue(status=OutboxNotification.Status.SENT)
+
+        self.assertEqual([n.id for n in notifications.claim_due(10)], [due.id])
+        # Leased: a second worker does not get it again
+        self.assertEqual(notifications.claim_due(10), [])
+        due.refresh_from_db()
+        lease = timedelta(seconds=settings.NOTIFICATION_LEASE_SECONDS - 5)
+        self.assertGreater(due.next_attempt_at, datetime.now(timezone.utc) + lease)
+
+    def test_delivery_marks_the_row_sent(self):
+        notification = self._queue()
+        self.assertTrue(notifications.deliver(notification, self.sender))
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, OutboxNotification.Status.SENT)
+        self.assertEqual(notification.attempts, 1)
+        self.assertIsNotNone(notification.sent_at)
+        self.assertEqual(notifications.LocalStubSender.sent[0]['tokens'], ['token-1'])
+
+    @override_settings(NOTIFICATION_MAX_ATTEMPTS=2, NOTIFICATION_RETRY_BASE_SECONDS=60)
+    def test_failures_back_off_then_give_up(self):
+        notification = self._queue()
+        notifications.LocalStubSender.fail_next = 2
+
+        before = datetime.now(timezone.utc)
+        self.assertFalse(notifications.deliver(notification, self.sender))
+        notification.refresh_from_db()
+        self.assertEqual((notification.status, notification.attempts), (OutboxNotification.Status.PENDING, 1))
+        self.assertIn('Simulated', notification.last_error)
+        self.assertGreaterEqual(notification.next_attempt_at, before + timedelta(seconds=60))
+
+        self.assertFalse(notifications.deliver(notification, self.sender))
+        notification.refresh_from_db()
+        self.assertEqual((notification.status, notification.attempts), (OutboxNotification.Status.FAILED, 2))
+        self.assertEqual(notifications.claim_due(10), [])
+
+    @override_settings(NOTIFICATION_RETRY_BASE_SECONDS=5, NOTIFICATION_RETRY_MAX_SECONDS=30)
+    def test_retry_delay_doubles_up_to_the_cap(self):
+        for attempts, low in [(1, 5), (2, 10), (3, 20), (4, 30), (10, 30)]:
+            with self.subTest(attempts=attempts):
+                delay = notifications.retry_delay(attempts).total_seconds()
+                self.assertGreaterEqual(delay, low)
+                self.assertLessEqual(delay, low + 5)  # Plus up to one base of jitter
+
+
+class FailingSecondSend(notifications.LocalStubSender):
+    """Loses the connection on its second send, like FCM going away mid fan-out."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def send(self, tokens, title, body, data):
+        self.calls += 1
+        if self.calls == 2:
+            raise ConnectionError("FCM went away")
+        return super().send(tokens, title, body, data)
+
+
+@override_settings(NOTIFICATION_SENDER='api.notifications.LocalStubSender', FCM_MULTICAST_BATCH_SIZE=2)
+class FanOutTests(TestCase):
+    """Batching, dead-token pruning and per-batch progress in notifications.fan_out."""
+
+    def setUp(self):
+        notifications.LocalStubSender.reset()
+        self.addCleanup(notifications.LocalStubSender.reset)
+        self.household = _outbox_audience()
+        resident = CustomUser.objects.get(username='resident')
+        for i in range(2, 6):
+            FCMDevice.objects.create(user=resident, registration_id=f'token-{i}')
+        self.notification = notifications.enqueue_many([
+            notifications.build('Visitor Arrived', 'Guest is at the gate.', household_id=self.household.id)
+        ])[0]
+
+    def _deliver(self, sender=None):
+        self.notification.refresh_from_db()
+        return notifications.deliver(self.notification, sender or notifications.get_sender())
+
+    def _sent(self):
+        return [send['tokens'] for send in notifications.LocalStubSender.sent]
+
+    def test_tokens_go_out_in_batches(self):
+        self.assertTrue(self._deliver())
+        self.assertEqual(self._sent(), [['token-1', 'token-2'], ['token-3', 'token-4'], ['token-5']])
+
+    def test_dead_tokens_are_pruned_even_when_the_send_fails(self):
+        notifications.LocalStubSender.dead_tokens = {'token-2'}
+        notifications.LocalStubSender.unavailable_tokens = {'token-4'}
+        self.assertFalse(self._deliver())
+        self.assertFalse(FCMDevice.objects.filter(registration_id='token-2').exists())
+
+        # Only the device that failed is sent to again
+        notifications.LocalStubSender.reset()
+        self.assertTrue(self._deliver())
+        self.assertEqual(self._sent(), [['token-4']])
+
+    def test_retry_resumes_after_the_last_batch_that_went_through(self):
+        self.assertFalse(self._deliver(FailingSecondSend()))
+        self.assertEqual(self._sent(), [['token-1', 'token-2']])
+
+        notifications.LocalStubSender.reset()
+        self.assertTrue(self._deliver())
+        self.assertEqual(self._sent(), [['token-3', 'token-4'], ['token-5']])
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.status, OutboxNotification.Status.SENT)
+
+
+@override_settings(NOTIFICATION_SENDER='api.notifications.LocalStubSender')
+class DeliverNotificationsCommandTests(TransactionTestCase):
+    """The worker drains the outbox on its thread pool; rows must be committed for the pool to see them."""
+
+    def setUp(self):
+        notifications.LocalStubSender.reset()
+        self.addCleanup(notifications.LocalStubSender.reset)
+        household = _outbox_audience()
+        notifications.enqueue_many([
+            notifications.build('Visitor Arrived', f'Guest {i} is at the gate.', household_id=household.id)
+            for i in range(3)
+        ])
+
+    def test_once_drains_what_is_due(self):
+        notifications.LocalStubSender.fail_next = 1
+        output = io.StringIO()
+        call_command('deliver_notifications', '--once', '--workers', '2', stdout=output)
+
+        statuses = sorted(OutboxNotification.objects.values_list('status', flat=True))
+        self.assertEqual(statuses, ['PENDING', 'SENT', 'SENT'])
+        self.assertEqual(len(notifications.LocalStubSender.sent), 2)
+        self.assertIn('Sent 2/3 notification(s).', output.getvalue())
+        # The failed row waits out its backoff instead of being retried in the same run
+        self.assertEqual(OutboxNotification.objects.get(status='PENDING').attempts, 1)
+
+
+class EventRecorderTests(TestCase):
+    """Audit events are written in one INSERT with the changes they describe, and roll back with them."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.household = Household.objects.create(flat_number='A-1')
+        cls.admin = CustomUser.objects.create_user('admin', email='admin@example.com', role=CustomUser.Role.ADMIN)
+
+    def setUp(self):
+        original = changefeed.bus
+        self.bus = changefeed.bus = changefeed.ChangeBus(maxlen=10)
+        self.addCleanup(setattr, changefeed, 'bus', original)
+
+    def _event_inserts(self, queries):
+        return [q for q in queries if q['sql'].startswith('INSERT') and Event._meta.db_table in q['sql']]
+
+    def test_events_are_written_in_one_insert_and_published_on_commit(self):
+        visitors = Visitor.objects.bulk_create(
+            Visitor(name=f'Guest {i}', host_household=self.household) for i in range(3)
+        )
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            with EventRecorder() as audit:
+                for visitor in visitors:
+                    audit.record(Event.EventType.VISITOR_APPROVED, self.admin, visitor)
+                self.assertEqual(Event.objects.count(), 0)  # Nothing written until the block exits
+        self.assertEqual(len(self._event_inserts(queries)), 1)
+        self.assertEqual(Event.objects.count(), 3)
+        self.assertEqual(self.bus.cursor, Event.objects.order_by('-id').first().id)
+
+    def test_failure_in_the_block_rolls_back_changes_and_events(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError):
+                with EventRecorder() as audit:
+                    visitor = Visitor.objects.create(name='Guest', host_household=self.household)
+                    audit.record(Event.EventType.VISITOR_CREATED, self.admin, visitor)
+                    audit.flush()
+                    raise RuntimeError("boom")
+        self.assertFalse(Visitor.objects.exists())
+        self.assertFalse(Event.objects.exists())
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.bus.cursor, 0)
+
+    def test_failed_event_write_rolls_back_the_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ValueError):
+                with EventRecorder() as audit:
+                    Visitor.objects.create(name='Guest', host_household=self.household)
+                    # An unsaved subject makes the bulk INSERT fail on exit
+                    audit.record(Event.EventType.VISITOR_CREATED, self.admin, Visitor(name='Ghost'))
+        self.assertFalse(Visitor.objects.exists())
+        self.assertFalse(Event.objects.exists())
+        self.assertEqual(self.bus.cursor, 0)
+
+
+class BulkVisitorTests(TestCase):
+    """POST /api/visitors/bulk/ and the bulk gate endpoints."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.household = Household.objects.create(flat_number='A-1')
+        cls.other = Household.objects.create(flat_number='B-2')
+        cls.resident = CustomUser.objects.create_user(
+            'resident', email='resident@example.com', role=CustomUser.Role.RESIDENT, household=cls.household
+        )
+        cls.guard = CustomUser.objects.create_user('guard', email='guard@example.com', role=CustomUser.Role.GUARD)
+
+    def _post(self, user, path, data):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.post(path, data, format='json')
+
+    def _guests(self, count):
+        return [{'name': f'Guest {i}', 'purpose': 'Party'} for i in range(count)]
+
+    def test_bulk_create_costs_the_same_queries_for_any_size(self):
+        counts = []
+        for size in (2, 40):
+            with CaptureQueriesContext(connection) as queries:
+                response = self._post(self.resident, '/api/visitors/bulk/', self._guests(size))
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(len(response.data), size)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+        visitors = Visitor.objects.filter(host_household=self.household)
+        self.assertEqual(visitors.count(), 42)
+        self.assertEqual(set(visitors.values_list('status', flat=True)), {Visitor.Status.PENDING})
+        self.assertEqual(Event.objects.filter(type=Event.EventType.VISITOR_CREATED).count(), 42)
+
+    def test_bulk_create_is_all_or_nothing(self):
+        with self.settings(VISITOR_BULK_MAX_PASSES=3):
+            self.assertEqual(self._post(self.resident, '/api/visitors/bulk/', self._guests(4)).status_code, 400)
+        invalid = self._guests(2) + [{'purpose': 'No name'}]
+        self.assertEqual(self._post(self.resident, '/api/visitors/bulk/', invalid).status_code, 400)
+        self.assertEqual(self._post(self.resident, '/api/visitors/bulk/', []).status_code, 400)
+        self.assertEqual(self._post(self.guard, '/api/visitors/bulk/', self._guests(1)).status_code, 403)
+        self.assertFalse(Visitor.objects.exists())
+
+    def test_bulk_checkin_reports_each_id_in_request_order(self):
+        approved = Visitor.objects.create(name='Ready', host_household=self.household, status=Visitor.Status.APPROVED)
+        neighbour = Visitor.objects.create(name='Next door', host_household=self.other, status=Visitor.Status.APPROVED)
+        pending = Visitor.objects.create(name='Waiting', host_household=self.household)
+
+        response = self._post(self.guard, '/api/visitors/bulk-checkin/', {
+            'ids': [pending.id, approved.id, 999999, neighbour.id, approved.id]
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['succeeded'], response.data['failed']), (2, 2))
+        self.assertEqual(response.data['results'], [
+            {'id': pending.id, 'result': 'conflict', 'status': Visitor.Status.PENDING},
+            {'id': approved.id, 'result': 'ok', 'status': Visitor.Status.CHECKED_IN},
+            {'id': 999999, 'result': 'not_found'},
+            {'id': neighbour.id, 'result': 'ok', 'status': Visitor.Status.CHECKED_IN},
+        ])
+        # One arrival notice per host household
+        audiences = sorted(n.audience['household_id'] for n in OutboxNotification.objects.all())
+        self.assertEqual(audiences, [self.household.id, self.other.id])
+
+    def test_bulk_deny_stays_in_the_residents_household(self):
+        mine = Visitor.objects.create(name='Mine', host_household=self.household)
+        theirs = Visitor.objects.create(name='Theirs', host_household=self.other)
+
+        body = {'ids': [mine.id, theirs.id], 'reason': 'Full'}
+        response = self._post(self.resident, '/api/visitors/bulk-deny/', body)
+        self.assertEqual([r['result'] for r in response.data['results']], ['ok', 'not_found'])
+        self.assertEqual(Event.objects.get(subject_visitor=mine).payload, {'reason': 'Full'})
+        theirs.refresh_from_db()
+        self.assertEqual(theirs.status, Visitor.Status.PENDING)
+
+    def test_bulk_gate_endpoints_check_roles_and_body(self):
+        visitor = Visitor.objects.create(name='Guest', host_household=self.household)
+        body = {'ids': [visitor.id]}
+        self.assertEqual(self._post(self.guard, '/api/visitors/bulk-approve/', body).status_code, 403)
+        self.assertEqual(self._post(self.resident, '/api/visitors/bulk-checkin/', body).status_code, 403)
+        self.assertEqual(self._post(self.guard, '/api/visitors/bulk-checkin/', {'ids': []}).status_code, 400)
+        too_many = list(range(1, settings.VISITOR_BULK_MAX_TRANSITIONS + 2))
+        self.assertEqual(self._post(self.guard, '/api/visitors/bulk-checkin/', {'ids': too_many}).status_code, 400)
+
+
+class TransitionTableTests(TestCase):
+    """Every entry of transitions.TRANSITIONS: source and target state, stamps, roles and audit event."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.household = Household.objects.create(flat_number='A-1')
+        cls.users = {
+            role: CustomUser.objects.create_user(
+                role.lower(), email=f'{role.lower()}@example.com', role=role,
+                household=cls.household if role == CustomUser.Role.RESIDENT else None,
+            )
+            for role in [CustomUser.Role.RESIDENT, CustomUser.Role.GUARD, CustomUser.Role.ADMIN]
+        }
+
+    def test_each_transition_moves_source_to_target(self):
+        for name, spec in transitions.TRANSITIONS.items():
+            actor = self.users[spec['roles'][0]]
+            with self.subTest(transition=name):
+                visitor = Visitor.objects.create(name='Guest', host_household=self.household, status=spec['source'])
+                moved = transitions.transition(name, visitor.id, actor)
+                self.assertEqual(moved.status, spec['target'])
+                self.assertEqual(moved.host_household.flat_number, 'A-1')
+
+                visitor.refresh_from_db()
+                self.assertEqual(visitor.status, spec['target'])
+                for stamp in spec['stamps']:
+                    self.assertIsNotNone(getattr(visitor, stamp))
+                if spec.get('actor_field'):
+                    self.assertEqual(getattr(visitor, f"{spec['actor_field']}_id"), actor.id)
+                event = Event.objects.get(subject_visitor=visitor)
+                self.assertEqual((event.type, event.actor_id), (spec['event'], actor.id))
+
+    def test_each_transition_rejects_other_roles_and_states(self):
+        for name, spec in transitions.TRANSITIONS.items():
+            visitor = Visitor.objects.create(name='Guest', host_household=self.household, status=spec['source'])
+            for role, user in self.users.items():
+                if role in spec['roles']:
+                    continue
+                with self.subTest(transition=name, role=role):
+                    with self.assertRaises(transitions.TransitionError) as raised:
+                        transitions.transition(name, visitor.id, user)
+                    self.assertEqual(raised.exception.code, 'forbidden')
+            for status in Visitor.Status.values:
+                if status == spec['source']:
+                    continue
+                Visitor.objects.filter(id=visitor.id).update(status=status)
+                with self.subTest(transition=name, status=status):
+                    with self.assertRaises(transitions.TransitionError) as raised:
+                        transitions.transition(name, visitor.id, self.users[CustomUser.Role.ADMIN])
+                    self.assertEqual(raised.exception.code, 'conflict')
+
+    def test_residents_only_reach_their_household(self):
+        elsewhere = Visitor.objects.create(name='Guest', host_household=Household.objects.create(flat_number='B-2'))
+        for visitor_id in [elsewhere.id, 'abc', None]:
+            with self.subTest(visitor_id=visitor_id):
+                with self.assertRaises(transitions.TransitionError) as raised:
+                    transitions.transition('approve', visitor_id, self.users[CustomUser.Role.RESIDENT])
+                self.assertEqual(raised.exception.code, 'not_found')
+        elsewhere.refresh_from_db()
+        self.assertEqual(elsewhere.status, Visitor.Status.PENDING)
+
+
+class TransitionConflictTests(TestCase):
+    """Transitions are compare-and-set: a second, stale transition is rejected and changes nothing."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.household = Household.objects.create(flat_number='A-1')
+        cls.guard = CustomUser.objects.create_user('guard', email='guard@example.com', role=CustomUser.Role.GUARD)
+        cls.other_guard = CustomUser.objects.create_user(
+            'guard2', email='guard2@example.com', role=CustomUser.Role.GUARD
+        )
+
+    def setUp(self):
+        self.visitor = Visitor.objects.create(
+            name='Guest', host_household=self.household, status=Visitor.Status.APPROVED
+        )
+
+    def test_second_checkin_of_the_same_visitor_conflicts(self):
+        # Both guards saw the visitor as APPROVED; only the first write wins
+        transitions.transition('checkin', self.visitor.id, self.guard)
+        with self.assertRaises(transitions.TransitionError) as raised:
+            transitions.transition('checkin', self.visitor.id, self.other_guard)
+        self.assertEqual(raised.exception.code, 'conflict')
+        self.assertEqual(raised.exception.visitor['status'], Visitor.Status.CHECKED_IN)
+
+        self.assertEqual(Event.objects.filter(type=Event.EventType.VISITOR_CHECKIN).count(), 1)
+        self.assertEqual(OutboxNotification.objects.count(), 1)
+
+    def test_stale_conflict_is_a_bad_request_over_the_api(self):
+        client = APIClient()
+        client.force_authenticate(self.guard)
+        self.assertEqual(client.post(f'/api/visitors/{self.visitor.id}/checkin/').status_code, 200)
+        response = client.post(f'/api/visitors/{self.visitor.id}/checkin/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'error': 'Visitor must be APPROVED to be checked in.'})
+
+    def test_overlapping_bulk_calls_move_each_visitor_once(self):
+        second = Visitor.objects.create(name='Guest 2', host_household=self.household, status=Visitor.Status.APPROVED)
+        first = transitions.bulk_transition('checkin', [self.visitor.id], self.guard)
+        both = transitions.bulk_transition('checkin', [self.visitor.id, second.id], self.other_guard)
+        self.assertEqual(first[0]['result'], 'ok')
+        self.assertEqual([r['result'] for r in both], ['conflict', 'ok'])
+        self.assertEqual(Event.objects.filter(type=Event.EventType.VISITOR_CHECKIN).count(), 2)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "SQLite locks the table instead of racing the UPDATEs")
+class ConcurrentTransitionTests(TransactionTestCase):
+    """Guards racing on separate connections: exactly one check-in lands."""
+
+    def test_racing_checkins_move_the_visitor_once(self):
+        household = Household.objects.create(flat_number='A-1')
+        guards = [
+            CustomUser.objects.create_user(f'guard{i}', email=f'guard{i}@example.com', role=CustomUser.Role.GUARD)
+            for i in range(4)
+        ]
+        visitor = Visitor.objects.create(name='Guest', host_household=household, status=Visitor.Status.APPROVED)
+        barrier = threading.Barrier(len(guards))
+        outcomes = []
+
+        def check_in(guard):
+            barrier.wait()
+            try:
+                transitions.transition('checkin', visitor.id, guard)
+                outcomes.append('ok')
+            except transitions.TransitionError as e:
+                outcomes.append(e.code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=check_in, args=(guard,)) for guard in guards]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(outcomes), ['conflict', 'conflict', 'conflict', 'ok'])
+        self.assertEqual(Event.objects.filter(type=Event.EventType.VISITOR_CHECKIN).count(), 1)
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Every list and retrieve endpoint has a fixed query budget that does
+    not grow with the number of rows, so an N+1 regression (e.g. a nested
+    serializer field without select_related) fails here.
+    Requests are force-authenticated, so the budgets exclude the auth lookup.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.households = Household.objects.bulk_create(
+            Household(flat_number=f'B-{i}') for i in range(50)
+        )
+        cls.household = cls.households[0]
+        cls.admin = CustomUser.objects.create_user('admin', email='admin@example.com', role=CustomUser.Role.ADMIN)
+        cls.guard = CustomUser.objects.create_user('guard', email='guard@example.com', role=CustomUser.Role.GUARD)
+        cls.resident = CustomUser.objects.create_user(
+            'resident', email='resident@example.com', role=CustomUser.Role.RESIDENT, household=cls.household
+        )
+
+    def _seed(self, rows):
+        """Top visitors, events and users up to `rows` each, spread over many households."""
+        visitors = Visitor.objects.count()
+        Visitor.objects.bulk_create(
+            Visitor(name=f'Visitor {i}', host_household=self.households[i % len(self.households)])
+            for i in range(visitors, rows)
+        )
+        users = CustomUser.objects.count()
+        CustomUser.objects.bulk_create(
+            CustomUser(
+                username=f'user{i}',
+                email=f'user{i}@example.com',
+                household=self.households[i % len(self.households)]
+            )
+            for i in range(users, rows)
+        )
+        actors = list(CustomUser.objects.values_list('id', flat=True)[:100])
+        visitor_ids = list(Visitor.objects.values_list('id', flat=True)[:100])
+        events = Event.objects.count()
+        Event.objects.bulk_create(
+            Event(
+                type=Event.EventType.VISITOR_CREATED,
+                actor_id=actors[i % len(actors)],
+                subject_visitor_id=visitor_ids[i % len(visitor_ids)]
+            )
+            for i in range(events, rows)
+        )
+
+    def _get(self, user, path, params=None):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.get(path, params)
+
+    def assertBudget(self, user, path, queries, params=None):
+        for rows in ROW_COUNTS:
+            self._seed(rows)
+            with self.subTest(rows=rows):
+                with self.assertNumQueries(queries):
+                    response = self._get(user, path, params)
+                self.assertEqual(response.status_code, 200)
+
+    # --- Visitors: ETag state + one joined page ---
+
+    def test_visitor_list_for_guard(self):
+        self.assertBudget(self.guard, '/api/visitors/', 2, {'page_size': 200})
+
+    def test_visitor_list_for_resident(self):
+        self.assertBudget(self.resident, '/api/visitors/', 2, {'page_size': 200})
+
+    def test_visitor_delta_sync(self):
+        self.assertBudget(self.guard, '/api/visitors/', 2, {'since': SINCE_EPOCH})
+
+    def test_visitor_retrieve(self):
+        self._seed(ROW_COUNTS[0])
+        visitor = Visitor.objects.filter(host_household=self.household).first()
+        for user in [self.guard, self.resident]:
+            with self.subTest(role=user.role), self.assertNumQueries(1):
+                response = self._get(user, f'/api/visitors/{visitor.id}/')
+            self.assertEqual(response.status_code, 200)
+
+    # --- Audit log: ETag state + one page joined with the actor ---
+
+    def test_event_list(self):
+        self.assertBudget(self.admin, '/api/events/', 2, {'page_size': 200})
+
+    def test_event_delta_sync(self):
+        self.assertBudget(self.admin, '/api/events/', 2, {'since': SINCE_EPOCH})
+
+    def test_event_retrieve(self):
+        self._seed(ROW_COUNTS[0])
+        event = Event.objects.first()
+        with self.assertNumQueries(1):
+            response = self._get(self.admin, f'/api/events/{event.id}/')
+        self.assertEqual(response.status_code, 200)
+
+    # --- Users: one page joined with the household ---
+
+    def test_user_list(self):
+        self.assertBudget(self.admin, '/api/users/', 1, {'page_size': 200})
+
+    def test_user_retrieve(self):
+        with self.assertNumQueries(1):
+            response = self._get(self.admin, f'/api/users/{self.resident.id}/')
+        self.assertEqual(response.status_code, 200)
+
+
+class FastPathTests(TestCase):
+    """The .values() list path must render byte-for-byte what the ModelSerializers render."""
+
+    @classmethod
+    def setUpTestData(cls):
+        household = Household.objects.create(flat_number='A-1', name='The Rao family')
+        cls.admin = CustomUser.objects.create_user('admin', email='admin@example.com', role=CustomUser.Role.ADMIN)
+        visitor = Visitor.objects.create(
+            name='Zoë  ', purpose='Dinner', host_household=household,
+            scheduled_time=datetime(2030, 5, 1, 20, 0, tzinfo=timezone.utc)
+        )
+        Visitor.objects.create(name='Courier', host_household=household, status=Visitor.Status.CHECKED_IN)
+        Event.objects.create(type=Event.EventType.VISITOR_CREATED, actor=cls.admin, subject_visitor=visitor)
+        Event.objects.create(type=Event.EventType.VISITOR_DENIED, payload={'reason': 'Late'})
+
+    def _get(self, path, params=None):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        return client.get(path, params)
+
+    def test_same_output_as_model_serializers(self):
+        for path, params in [
+            ('/api/visitors/', None),
+            ('/api/visitors/', {'page_size': 1}),
+            ('/api/visitors/', {'since': SINCE_EPOCH}),
+            ('/api/events/', None),
+            ('/api/events/', {'since': SINCE_EPOCH}),
+        ]:
+            with self.subTest(path=path, params=params):
+                fast = self._get(path, params)
+                with self.settings(FAST_LIST_SERIALIZATION=False):
+                    slow = self._get(path, params)
+                self.assertEqual(fast.status_code, 200)
+                self.assertEqual(fast.content, slow.content)
+
+
+class ClaimsAuthenticationTests(TestCase):
+    """Requests authenticate from the JWT claims; role edits and deactivation still apply promptly."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.household = Household.objects.create(flat_number='A-1')
+        cls.admin = CustomUser.objects.create_user('admin', email='admin@example.com', role=CustomUser.Role.ADMIN)
+        cls.resident = CustomUser.objects.create_user(
+            'resident', email='resident@example.com', role=CustomUser.Role.RESIDENT, household=cls.household
+        )
+        Visitor.objects.create(name='Guest', host_household=cls.household)
+
+    def setUp(self):
+        cache.clear()
+
+    def _client(self, user):
+        client = APIClient()
+        token = MyTokenObtainPairSerializer.get_token(user).access_token
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client
+
+    def test_no_user_query_once_state_is_cached(self):
+        client = self._client(self.resident)
+        with self.assertNumQueries(3):  # user state + ETag state + page
+            self.assertEqual(client.get('/api/visitors/').status_code, 200)
+        with self.assertNumQueries(2):  # ETag state + page
+            response = client.get('/api/visitors/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_role_change_applies_to_existing_token(self):
+        resident = self._client(self.resident)
+        self.assertEqual(resident.get('/api/visitors/').status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self._client(self.admin).patch(
+                f'/api/users/{self.resident.id}/', {'role': CustomUser.Role.ADMIN}, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        # Same token, new role: the admin-only audit log opens up
+        self.assertEqual(resident.get('/api/events/').status_code, 200)
+
+    def test_deleted_user_is_rejected(self):
+        resident = self._client(self.resident)
+        self.assertEqual(resident.get('/api/visitors/').status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self._client(self.admin).delete(f'/api/users/{self.resident.id}/')
+        self.assertEqual(resident.get('/api/visitors/').status_code, 401)
+
+    def test_deactivation_applies_once_cached_state_expires(self):
+        resident = self._client(self.resident)
+        self.assertEqual(resident.get('/api/visitors/').status_code, 200)
+        CustomUser.objects.filter(id=self.resident.id).update(is_active=False)
+        cache.clear()  # AUTH_STATE_CACHE_SECONDS elapsed
+        self.assertEqual(resident.get('/api/visitors/').status_code, 401)
+
+    @override_settings(CACHES={
+        'worker-a': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'worker-a'},
+        'worker-b': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'worker-b'},
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    })
+    def test_per_process_cache_is_stale_in_other_workers_for_the_ttl(self):
+        def state(worker):
+            with self.settings(AUTH_STATE_CACHE=worker):
+                return authentication.get_user_state(self.resident.id)['role']
+
+        self.assertEqual((state('worker-a'), state('worker-b')), ('RESIDENT', 'RESIDENT'))
+        CustomUser.objects.filter(id=self.resident.id).update(role=CustomUser.Role.ADMIN)
+        with self.settings(AUTH_STATE_CACHE='worker-a'):
+            authentication.forget_user_state(self.resident.id)  # The worker that made the edit
+        self.assertEqual((state('worker-a'), state('worker-b')), ('ADMIN', 'RESIDENT'))
+        caches['worker-b'].clear()  # AUTH_STATE_CACHE_SECONDS elapsed
+        self.assertEqual(state('worker-b'), 'ADMIN')
+
+
+class CopilotContextCacheTests(TestCase):
+    """The copilot's visitor context is only re-queried when a visitor in scope changes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.household = Household.objects.create(flat_number='A-1')
+        cls.other_household = Household.objects.create(flat_number='A-2')
+        cls.resident = CustomUser.objects.create_user(
+            'resident', email='resident@example.com', role=CustomUser.Role.RESIDENT, household=cls.household
+        )
+        cls.neighbour = CustomUser.objects.create_user(
+            'neighbour', email='neighbour@example.com', role=CustomUser.Role.RESIDENT, household=cls.other_household
+        )
+        cls.visitor = Visitor.objects.create(name='Guest', host_household=cls.household)
+        cls.other_visitor = Visitor.objects.create(name='Other', host_household=cls.other_household)
+
+    def setUp(self):
+        copilot_cache.clear()
+
+    def test_context_is_reused_until_scope_changes(self):
+        copilot = AICopilotService(self.resident)
+        with self.assertNumQueries(1):
+            first = copilot._get_relevant_visitors_context()
+        with self.assertNumQueries(0):
+            self.assertEqual(copilot._get_relevant_visitors_context(), first)
+
+        # A change in another household leaves this scope's cache alone
+        with self.captureOnCommitCallbacks(execute=True):
+            transitions.transition('approve', self.other_visitor.id, self.neighbour)
+        with self.assertNumQueries(0):
+            copilot._get_relevant_visitors_context()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            transitions.transition('approve', self.visitor.id, self.resident)
+        with self.assertNumQueries(1):
+            self.assertNotEqual(copilot._get_relevant_visitors_context(), first)
+
+
+class ChatHistoryBudgetTests(TestCase):
+    """Long chats keep the newest turns verbatim and collapse the rest into a bounded summary."""
+
+    def _chat(self, turns):
+        history = []
+        for i in range(turns):
+            history.append({'role': 'user', 'text': f'Question {i}: ' + 'please help me with my visitors ' * 5})
+            history.append({'role': 'model', 'text': f'Answer {i}: ' + 'sure, here is what I found ' * 5})
+        return history
+
+    def test_short_chat_is_sent_verbatim(self):
+        history = self._chat(2)
+        recent, summary, stats = chat_history.fit_history(history, budget=1000, summary_tokens=100)
+        self.assertEqual(recent, history)
+        self.assertEqual(summary, '')
+        self.assertEqual(stats['summarized'], 0)
+
+    def test_long_chat_stays_within_budget(self):
+        for turns in (10, 100, 1000):
+            with self.subTest(turns=turns):
+                history = self._chat(turns) + [{'role': 'user', 'text': 'Approve visitor 7'}]
+                recent, summary, stats = chat_history.fit_history(history, budget=200, summary_tokens=100)
+                self.assertEqual(recent[-1]['text'], 'Approve visitor 7')
+                self.assertEqual(recent[0]['role'], 'user')
+                self.assertLessEqual(stats['recent_tokens'], 200)
+                self.assertLessEqual(stats['summary_tokens'], 110)
+                self.assertEqual(stats['recent'] + stats['summarized'], len(history))
+                self.assertIn('Answer', summary)
+
+    def test_oversized_latest_message_is_kept(self):
+        recent, summary, stats = chat_history.fit_history([{'role': 'user', 'text': 'x' * 4000}], budget=100)
+        self.assertEqual(len(recent), 1)
+
+
+class ScriptedModel:
+    """Stands in for the shared Gemini model: each generate_content call returns (or streams) the next scripted reply."""
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.tools = []
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        from vertexai.generative_models import GenerationResponse
+
+        self.tools.append(kwargs.get('tools'))
+
+        def response(parts):
+            return GenerationResponse.from_dict({'candidates': [{'content': {'role': 'model', 'parts': parts}}]})
+
+        parts = self.replies.pop(0)
+        return iter([response([part]) for part in parts]) if stream else response(parts)
+
+    async def generate_content_async(self, contents, **kwargs):
+        return self.generate_content(contents, **kwargs)
+
+
+class CopilotChatTestCase(TestCase):
+    """A resident with one pending visitor, chatting through the async copilot views."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.household = Household.objects.create(flat_number='A-1')
+        cls.resident = CustomUser.objects.create_user(
+            'resident', email='resident@example.com', role=CustomUser.Role.RESIDENT, household=cls.household
+        )
+        cls.visitor = Visitor.objects.create(name='Guest', host_household=cls.household)
+
+    def setUp(self):
+        cache.clear()
+        copilot_cache.clear()
+        copilot_metrics.reset()
+        self.addCleanup(llm.reset)
+
+    async def _post(self, data, path='/api/chat/', user=None):
+        token = MyTokenObtainPairSerializer.get_token(user or self.resident).access_token
+        return await AsyncClient().post(
+            path, data, content_type='application/json',
+            headers={'Authorization': f'Bearer {token}'},
+        )
+
+
+class ChatStreamTests(CopilotChatTestCase):
+    """The SSE copilot view, /api/chat/stream/."""
+
+    async def _post(self, data, path='/api/chat/stream/'):
+        return await super()._post(data, path)
+
+    async def _events(self, response):
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        events = []
+        for block in body.strip().split('\n\n'):
+            lines = dict(line.split(': ', 1) for line in block.splitlines())
+            events.append((lines['event'], json.loads(lines['data'])))
+        return events
+
+    async def test_tool_call_is_announced_then_summary_streams(self):
+        # create_visitor has no local template, so Gemini phrases the result
+        llm._models[settings.GEMINI_MODEL_NAME] = ScriptedModel(
+            [{'function_call': {'name': 'create_visitor', 'args': {'names': ['Ravi']}}}],
+            [{'text': 'Ravi '}, {'text': 'is expected.'}],
+        )
+        response = await self._post({'history': [{'role': 'user', 'text': 'Ravi is coming over'}]})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = await self._events(response)
+        self.assertEqual([name for name, _ in events], ['tool', 'token', 'token', 'done'])
+        self.assertEqual(events[0][1]['name'], 'create_visitor')
+        self.assertEqual(events[-1][1]['reply'], 'Ravi is expected.')
+        self.assertTrue(await Visitor.objects.filter(name='Ravi', host_household=self.household).aexists())
+
+    async def test_plain_reply_streams_tokens(self):
+        llm._models[settings.GEMINI_MODEL_NAME] = ScriptedModel([{'text': 'Hello'}, {'text': ' there!'}])
+        response = await self._post({'history': [{'role': 'user', 'text': 'hi'}]})
+        events = await self._events(response)
+        self.assertEqual(events, [
+            ('token', {'text': 'Hello'}), ('token', {'text': ' there!'}), ('done', {'reply': 'Hello there!'}),
+        ])
+
+    async def test_history_is_required(self):
+        response = await self._post({})
+        self.assertEqual(response.status_code, 400)
+
+
+class TemplatedReplyTests(CopilotChatTestCase):
+    """/api/chat/: tool results with a local template skip Gemini's summary call; anything else is phrased by Gemini."""
+
+    async def test_templated_tools_skip_the_summary_call(self):
+        model = llm._models[settings.GEMINI_MODEL_NAME] = ScriptedModel(
+            [{'function_call': {'name': 'list_my_visitors', 'args': {}}},
+             {'function_call': {'name': 'approve_visitor', 'args': {'visitor_id': str(self.visitor.id)}}}],
+            [{'text': 'Unused summary'}],
+        )
+        response = await self._post({'history': [{'role': 'user', 'text': 'approve my visitor'}]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), {'reply': (
+            f'Here are your recent visitors:\n- ID {self.visitor.id}: Guest (PENDING)\n'
+            f'Visitor Guest (ID: {self.visitor.id}) approved.'
+        )})
+        self.assertEqual(len(model.replies), 1)  # One Gemini round trip, not two
+        self.assertEqual(copilot_metrics.snapshot(), {
+            'turns': 1, 'llm_calls': 1, 'tool_calls': 2, 'summary_calls_avoided': 1,
+            'fast_path_misses': 1, 'response_cache_misses': 1,
+        })
+        visitor = await Visitor.objects.aget(id=self.visitor.id)
+        self.assertEqual(visitor.status, Visitor.Status.APPROVED)
+
+    async def test_error_outcome_is_summarized_by_gemini(self):
+        model = llm._models[settings.GEMINI_MODEL_NAME] = ScriptedModel(
+            [{'function_call': {'name': 'approve_visitor', 'args': {'visitor_id': str(self.visitor.id)}}},
+             {'function_call': {'name': 'checkin_visitor', 'args': {'visitor_id': str(self.visitor.id)}}}],
+            [{'text': 'Guest is approved; only a guard can check them in.'}],
+        )
+        response = await self._post({'history': [{'role': 'user', 'text': 'approve and check in'}]})
+        self.assertEqual(json.loads(response.content), {'reply': 'Guest is approved; only a guard can check them in.'})
+        self.assertEqual(model.replies, [])
+        self.assertEqual(copilot_metrics.snapshot()['summary_calls'], 1)
+
+
+class CommandFastPathTests(CopilotChatTestCase):
+    """/api/chat/: terse commands run through the command grammar without Gemini."""
+
+    async def test_terse_command_skips_gemini(self):
+        # No model is installed: the command grammar answers on its own
+        response = await self._post({'history': [{'role': 'user', 'text': f'approve #{self.visitor.id}'}]})
+        self.assertEqual(json.loads(response.content), {'reply': f'Visitor Guest (ID: {self.visitor.id}) approved.'})
+        visitor = await Visitor.objects.aget(id=self.visitor.id)
+        self.assertEqual(visitor.status, Visitor.Status.APPROVED)
+        metrics = copilot_metrics.snapshot()
+        self.assertEqual(metrics['fast_path_hits'], 1)
+        self.assertNotIn('llm_calls', metrics)
+
+    async def test_command_outside_the_role_goes_to_gemini(self):
+        guard = await CustomUser.objects.acreate(
+            username='guard', email='guard@example.com', role=CustomUser.Role.GUARD
+        )
+        model = llm._models[settings.GEMINI_MODEL_NAME] = ScriptedModel([{'text': 'Only residents can approve.'}])
+        response = await self._post({'history': [{'role': 'user', 'text': f'approve {self.visitor.id}'}]}, user=guard)
+        self.assertEqual(json.loads(response.content), {'reply': 'Only residents can approve.'})
+        self.assertEqual(model.replies, [])
+        self.assertEqual(copilot_metrics.snapshot()['fast_path_misses'], 1)
+        visitor = await Visitor.objects.aget(id=self.visitor.id)
+        self.assertEqual(visitor.status, Visitor.Status.PENDING)
+
+
+class ResponseCacheTests(TestCase):
+    """Replies to read-only copilot turns are reused until a visitor in scope changes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.household = Household.objects.create(flat_number='A-1')
+        cls.resident = CustomUser.objects.create_user(
+            'resident', email='resident@example.com', role=CustomUser.Role.RESIDENT, household=cls.household
+        )
+        cls.visitor = Visitor.objects.create(name='Guest', host_household=cls.household)
+
+    def setUp(self):
+        copilot_cache.clear()
+        copilot_metrics.reset()
+        self.addCleanup(llm.reset)
+
+    def _ask(self, text):
+        return AICopilotService(self.resident).process_message([{'role': 'user', 'text': text}])
+
+    def test_repeated_question_skips_gemini_and_the_db(self):
+        model = llm._models[settings.GEMINI_MODEL_NAME] = ScriptedModel(
+            [{'function_call': {'name': 'list_my_visitors', 'args': {}}}],
+            [{'text': 'Unused'}],
+        )
+        first = self._ask("Who's expected?")
+        with self.assertNumQueries(0):
+            self.assertEqual(self._ask('  who\u2019s EXPECTED  '), first)
+        self.assertEqual(len(model.replies), 1)
+        self.assertEqual(copilot_metrics.snapshot()['response_cache_hits'], 1)
+
+        # Any change in the household's visitors retires the cached reply
+        with self.captureOnCommitCallbacks(execute=True):
+            transitions.transition('deny', self.visitor.id, self.resident)
+        model.replies = [[{'text': 'Guest was denied.'}]]
+        self.assertEqual(self._ask("who's expected"), 'Guest was denied.')
+
+    def test_mutating_turn_is_not_cached(self):
+        llm._models[settings.GEMINI_MODEL_NAME] = ScriptedModel(
+            [{'function_call': {'name': 'create_visitor', 'args': {'names': ['Ravi']}}}],
+            [{'text': 'Ravi is expected.'}],
+            [{'function_call': {'name': 'create_visitor', 'args': {'names': ['Ravi']}}}],
+            [{'text': 'Ravi is expected again.'}],
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self._ask('Ravi is coming over')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self._ask('Ravi is coming over'), 'Ravi is expected again.')
+        self.assertEqual(Visitor.objects.filter(name='Ravi').count(), 2)
+        self.assertNotIn('response_cache_hits', copilot_metrics.snapshot())
+
+    def test_read_only_error_is_not_cached(self):
+        # The resident has no household yet: list_my_visitors is read-only but fails
+        self.resident.household = None
+        self.resident.save()
+        llm._models[settings.GEMINI_MODEL_NAME] = ScriptedModel(
+            [{'function_call': {'name': 'list_my_visitors', 'args': {}}}],
+            [{'text': 'You are not linked to a flat yet.'}],
+            [{'function_call': {'name': 'list_my_visitors', 'args': {}}}],
+            [{'text': 'Still no flat.'}],
+        )
+        self._ask('who is expected?')
+        self.assertEqual(self._ask('who is expected?'), 'Still no flat.')
+        self.assertNotIn('response_cache_hits', copilot_metrics.snapshot())
+
+    @override_settings(COPILOT_RESPONSE_CACHE_SIZE=2)
+    def test_least_recently_used_reply_is_evicted(self):
+        llm._models[settings.GEMINI_MODEL_NAME] = ScriptedModel(
+            [{'text': 'One'}], [{'text': 'Two'}], [{'text': 'Three'}], [{'text': 'One again'}],
+        )
+        self._ask('one')
+        self._ask('two')
+        self._ask('one')  # Refreshes "one", so "two" is the oldest entry
+        self._ask('three')
+        self.assertEqual(self._ask('one'), 'One')
+        self.assertEqual(self._ask('two'), 'One again')
+
+
+@override_settings(COPILOT_MODEL_BACKEND='api.replay.ReplayModel', COPILOT_REPLAY_LATENCY=0)
+class ReplayModelTests(TestCase):
+    """The offline model backend replays the recording in COPILOT_REPLAY_FILE, function calls included."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.household = Household.objects.create(flat_number='A-1')
+        cls.resident = CustomUser.objects.create_user(
+            'resident', email='resident@example.com', role=CustomUser.Role.RESIDENT, household=cls.household
+        )
+
+    def setUp(self):
+        llm.reset()
+        copilot_cache.clear()
+        copilot_metrics.reset()
+        self.addCleanup(llm.reset)
+
+    def test_recorded_function_call_and_summary_are_replayed(self):
+        self.assertIsInstance(llm.get_model(), replay.ReplayModel)
+        with self.captureOnCommitCallbacks(execute=True):
+            reply = AICopilotService(self.resident).process_message(
+                [{'role': 'user', 'text': 'My cousin Priya is coming tonight at 8.'}]
+            )
+        self.assertIn('Priya', reply)
+        self.assertTrue(Visitor.objects.filter(name='Priya', host_household=self.household).exists())
+        metrics = copilot_metrics.snapshot()
+        self.assertEqual((metrics['llm_calls'], metrics['summary_calls']), (2, 1))
+        self.assertGreater(metrics['prompt_tokens'], metrics['output_tokens'])
+
+    def test_unrecorded_message_gets_the_fallback_reply(self):
+        events = list(AICopilotService(self.resident).stream_message([{'role': 'user', 'text': 'Tell me a joke'}]))
+        self.assertEqual(events[-1], {'event': 'done', 'reply': (
+            'Sorry, I can only help with your visitors: listing, creating, approving or denying passes.'
+        )})
+
+
+@override_settings(COPILOT_MODEL_BACKEND='api.replay.ReplayModel', COPILOT_REPLAY_LATENCY=0)
+class AsgiLifespanTests(SimpleTestCase):
+    """The ASGI app warms the shared Gemini model on the server's event loop at startup."""
+
+    async def test_startup_builds_the_shared_model(self):
+        from community_app import asgi
+
+        llm.reset()
+        self.addCleanup(llm.reset)
+        messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        await asgi.application({'type': 'lifespan'}, receive, send)
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+        self.assertIsInstance(llm._models[settings.GEMINI_MODEL_NAME], replay.ReplayModel)
+
+
+class RoleToolsTests(TestCase):
+    """Gemini is only offered the tools the user's role may run, and a prompt that only mentions those."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.guard = CustomUser.objects.create_user('guard', email='guard@example.com', role=CustomUser.Role.GUARD)
+
+    def setUp(self):
+        copilot_cache.clear()
+        self.addCleanup(llm.reset)
+
+    def _declared(self, role):
+        return [function['name'] for function in get_gemini_tool(role).to_dict()['function_declarations']]
+
+    def test_tools_and_prompt_are_scoped_to_the_role(self):
+        self.assertEqual(self._declared(CustomUser.Role.RESIDENT),
+                         ['create_visitor', 'list_my_visitors', 'approve_visitor', 'deny_visitor'])
+        self.assertEqual(self._declared(CustomUser.Role.GUARD), ['checkin_visitor'])
+        self.assertEqual(self._declared(CustomUser.Role.ADMIN), ['approve_visitor', 'deny_visitor', 'checkin_visitor'])
+        self.assertEqual(len(self._declared(None)), 5)
+        self.assertNotIn('passes', get_role_prompt(CustomUser.Role.GUARD))
+        self.assertNotIn('checking in', get_role_prompt(CustomUser.Role.RESIDENT))
+
+    def test_guard_turn_sends_the_guard_tool(self):
+        model = llm._models[settings.GEMINI_MODEL_NAME] = ScriptedModel([{'text': 'Only residents can create passes.'}])
+        AICopilotService(self.guard).process_message([{'role': 'user', 'text': 'Create a pass for Ravi'}])
+        self.assertIs(model.tools[0][0], get_gemini_tool(CustomUser.Role.GUARD))
+
+
+class ToolRunnerTests(SimpleTestCase):
+    """A turn's tool calls overlap, except calls on the same visitor, and results keep call order."""
+
+    calls = [('approve', '12'), ('approve', '14'), ('checkin', '12'), ('list', None)]
+
+    def setUp(self):
+        self.log = []
+        self.lock = threading.Lock()
+
+    def _record(self, event, call):
+        with self.lock:
+            self.log.append((event, call))
+
+    def _execute(self, call):
+        self._record('start', call)
+        time.sleep(0.1)
+        self._record('end', call)
+        return f'{call[0]} {call[1]}'
+
+    async def _aexecute(self, call):
+        self._record('start', call)
+        await asyncio.sleep(0.1)
+        self._record('end', call)
+        return f'{call[0]} {call[1]}'
+
+    def _assert_chains_overlapped(self):
+        # Every chain's first call started before any call finished...
+        first_end = self.log.index(next(event for event in self.log if event[0] == 'end'))
+        started = {call for event, call in self.log[:first_end] if event == 'start'}
+        self.assertEqual(started, {('approve', '12'), ('approve', '14'), ('list', None)})
+        # ...but the same visitor's calls ran one after the other
+        events = [event for event in self.log if event[1][1] == '12']
+        self.assertEqual(events, [
+            ('start', ('approve', '12')), ('end', ('approve', '12')),
+            ('start', ('checkin', '12')), ('end', ('checkin', '12')),
+        ])
+
+    def test_chains_run_concurrently_in_call_order(self):
+        results = tool_runner.run(self.calls, self._execute, key=lambda call: call[1], inline=False)
+        self.assertEqual(results, ['approve 12', 'approve 14', 'checkin 12', 'list None'])
+        self._assert_chains_overlapped()
+
+    def test_async_chains_run_concurrently_in_call_order(self):
+        results = asyncio.run(tool_runner.arun(self.calls, self._aexecute, key=lambda call: call[1]))
+        self.assertEqual(results, ['approve 12', 'approve 14', 'checkin 12', 'list None'])
+        self._assert_chains_overlapped()
+
+
+class IntentMatchTests(SimpleTestCase):
+    """Only complete terse commands take the local fast path; everything else goes to Gemini."""
+
+    def test_commands_map_to_tool_calls(self):
+        cases = {
+            'approve 42': [('approve_visitor', {'visitor_id': '42'})],
+            'Please deny #17.': [('deny_visitor', {'visitor_id': '17'})],
+            'check in 88 and 90': [('checkin_visitor', {'visitor_id': '88'}), ('checkin_visitor', {'visitor_id': '90'})],
+            'show pending': [('list_my_visitors', {'status': 'PENDING'})],
+            'list my visitors': [('list_my_visitors', {'status': 'ALL'})],
+            'checked out visitors': [('list_my_visitors', {'status': 'CHECKED_OUT'})],
+        }
+        for text, expected in cases.items():
+            with self.subTest(text=text):
+                self.assertEqual([(call.name, call.args) for call in intents.match(text)], expected)
+
+    def test_anything_else_falls_back(self):
+        for text in ['approve Ramesh', 'deny 17 because he was rude', 'approved', 'hi there', '', 'approve 4 2']:
+            with self.subTest(text=text):
+                self.assertIsNone(intents.match(text))
+
+    def test_commands_outside_the_role_fall_back(self):
+        guard = tools_for_role(CustomUser.Role.GUARD)
+        admin = tools_for_role(CustomUser.Role.ADMIN)
+        self.assertEqual([call.name for call in intents.match('check in 88', allowed=guard)], ['checkin_visitor'])
+        self.assertIsNone(intents.match('approve 42', allowed=guard))
+        self.assertIsNone(intents.match('show pending', allowed=guard))
+        self.assertEqual([call.name for call in intents.match('approve 42', allowed=admin)], ['approve_visitor'])
+        self.assertIsNone(intents.match('show pending', allowed=admin))
@@ -0,0 +1,155 @@
+# Community/api/tool_runner.py
+"""
+Concurrent execution of the tool calls in one copilot turn.
+
+Gemini can return several function calls at once (e.g. "approve 12, 14
+and 15"). Calls are grouped into chains: calls on the same visitor stay in
+one chain, in the order Gemini gave them, so an approve followed by a
+check-in can't race; every other call gets a chain of its own. Chains run
+concurrently on a process-wide pool of COPILOT_TOOL_WORKERS threads, and
+results come back in call order, so a multi-action turn costs about as
+much as its slowest chain.
+
+Each pool thread keeps its own DB connection open across chains, for up
+to COPILOT_TOOL_CONN_MAX_AGE seconds. A turn with a single chain has
+nothing to overlap, so it runs on the caller's thread and connection, as
+do all calls when the caller is inside a transaction (its uncommitted
+writes would be invisible to other connections) or the database is SQLite.
+"""
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+
+_lock = threading.Lock()
+_pool = None
+_local = threading.local()
+# Set while arun() runs a single chain, so run_sync() stays on the caller's thread
+_single_chain = contextvars.ContextVar('single_chain', default=False)
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(
+                    max_workers=settings.COPILOT_TOOL_WORKERS, thread_name_prefix='copilot-tool'
+                )
+    return _pool
+
+
+def plan(calls, key):
+    """
+    Group call indexes into chains. `key(call)` names the resource a call
+    touches (None: independent); chains keep the original order.
+    """
+    chains = []
+    by_key = {}
+    for index, call in enumerate(calls):
+        k = key(call)
+        if k is None:
+            chains.append([index])
+        elif k in by_key:
+            by_key[k].append(index)
+        else:
+            by_key[k] = [index]
+            chains.append(by_key[k])
+    return chains
+
+
+def _release_connection():
+    """
+    End of a chain on a pool thread: keep the thread's connection for its
+    next chain (CONN_MAX_AGE=0 would reconnect every time), but drop it once
+    it is broken or older than COPILOT_TOOL_CONN_MAX_AGE.
+    """
+    if connection.connection is not None and getattr(_local, 'connection', None) is not connection.connection:
+        _local.connection = connection.connection
+        connection.close_at = time.monotonic() + settings.COPILOT_TOOL_CONN_MAX_AGE
+    connection.close_if_unusable_or_obsolete()
+
+
+def _on_pool_thread(func):
+    def wrapper(*args):
+        try:
+            return func(*args)
+        finally:
+            _release_connection()
+    return wrapper
+
+
+def _run_inline():
+    # SQLite (local runs) allows one writer at a time, so there is nothing to overlap
+    return (
+        _single_chain.get()
+        or connection.in_atomic_block
+        or connection.vendor == 'sqlite'
+        or settings.COPILOT_TOOL_WORKERS <= 1
+    )
+
+
+def run(calls, execute, key, inline=None):
+    """
+    Call `execute(call)` for every call, chains concurrently; returns the
+    results in call order. `inline` forces (or rules out) running on this
+    thread; by default it depends on the transaction and database.
+    """
+    results = [None] * len(calls)
+
+    def run_chain(chain):
+        for index in chain:
+            results[index] = execute(calls[index])
+
+    chains = plan(calls, key)
+    if inline is None:
+        inline = _run_inline()
+    if len(chains) <= 1 or inline:
+        for chain in chains:
+            run_chain(chain)
+    else:
+        futures = [get_pool().submit(_on_pool_thread(run_chain), chain) for chain in chains]
+        for future in futures:
+            future.result()
+    return results
+
+
+async def arun(calls, execute, key):
+    """
+    `run` for async callers: `execute` is a coroutine function, chains run
+    as concurrent tasks. A single chain runs in the caller's task, and its
+    run_sync() work on the request's own thread.
+    """
+    results = [None] * len(calls)
+
+    async def run_chain(chain):
+        for index in chain:
+            results[index] = await execute(calls[index])
+
+    chains = plan(calls, key)
+    if len(chains) <= 1:
+        token = _single_chain.set(True)
+        try:
+            for chain in chains:
+                await run_chain(chain)
+        finally:
+            _single_chain.reset(token)
+    else:
+        await asyncio.gather(*(run_chain(chain) for chain in chains))
+    return results
+
+
+async def run_sync(func, *args):
+    """
+    Run blocking DB work from async code on the tool pool, so concurrent
+    chains don't queue on the request's single sync thread.
+    """
+    # Ask on the request's sync thread: that's the connection a transaction would be open on
+    if await sync_to_async(_run_inline)():
+        return await sync_to_async(func)(*args)
+    return await sync_to_async(_on_pool_thread(func), thread_sensitive=False, executor=get_pool())(*args)
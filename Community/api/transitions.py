@@ -0,0 +1,259 @@
+# Community/api/transitions.py
+"""
+The visitor state machine, shared by the REST API (single and bulk
+actions) and the AI copilot.
+
+Every transition is declared once in TRANSITIONS and executed as one
+conditional UPDATE:
+
+    UPDATE api_visitor SET status = <target>, ...
+    WHERE id IN (...) AND status = <source> [AND host_household_id = ...]
+    RETURNING ...
+
+so a visitor only moves if it is still in the expected state when the row
+is written. Two guards checking in the same visitor at once cannot both
+succeed: the second UPDATE no longer matches and the visitor is reported
+as a conflict. The audit events (and outbox notifications) for the batch
+are then written in the same transaction, so a successful transition
+costs a fixed number of statements whatever the batch size.
+"""
+from django.db import connection
+from django.utils import timezone
+
+from . import notifications
+from .audit import EventRecorder
+from .models import CustomUser, Event, Household, Visitor
+
+
+class TransitionError(Exception):
+    """
+    A transition that could not be applied. `code` is 'forbidden',
+    'not_found' or 'conflict'; for conflicts `visitor` holds the visitor's
+    id, name and current status.
+    """
+
+    def __init__(self, code, message, visitor=None):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.visitor = visitor
+
+
+# -----------------------------------------------------------
+# Notification rules (queued in the outbox, sent by the worker)
+# -----------------------------------------------------------
+
+def _notify_guards_approved(moved):
+    """One notice to the guards per approval batch."""
+    if len(moved) == 1:
+        body = f"'{moved[0].name}' for {moved[0].host_household.flat_number} is now approved."
+    else:
+        body = f"{len(moved)} visitors are now approved: " + ', '.join(
+            f"'{visitor.name}' ({visitor.host_household.flat_number})" for visitor in moved
+        )
+    return [notifications.build("Visitor Approved", body, role=CustomUser.Role.GUARD)]
+
+
+def _notify_household_arrived(moved):
+    """One notice per host household on check-in."""
+    by_household = {}
+    for visitor in moved:
+        by_household.setdefault(visitor.host_household_id, []).append(f"'{visitor.name}'")
+    return [
+        notifications.build(
+            "Visitor Arrived",
+            f"{', '.join(names)} {'has' if len(names) == 1 else 'have'} checked in.",
+            household_id=household_id
+        )
+        for household_id, names in by_household.items()
+    ]
+
+
+# -----------------------------------------------------------
+# The transition table
+# -----------------------------------------------------------
+# source/target: required and resulting status
+# roles:         who may apply it (residents only ever reach their own household)
+# stamps:        timestamp fields set to "now"
+# actor_field:   FK set to the acting user
+# notify:        builds the outbox rows for the visitors that moved
+# verb:          past tense, for confirmations
+
+TRANSITIONS = {
+    'approve': {
+        'source': Visitor.Status.PENDING,
+        'target': Visitor.Status.APPROVED,
+        'event': Event.EventType.VISITOR_APPROVED,
+        'roles': [CustomUser.Role.RESIDENT, CustomUser.Role.ADMIN],
+        'stamps': ['approved_at'],
+        'actor_field': 'approved_by',
+        'notify': _notify_guards_approved,
+        'verb': 'approved',
+        'conflict_message': 'Visitor is not in a PENDING state.',
+    },
+    'deny': {
+        'source': Visitor.Status.PENDING,
+        'target': Visitor.Status.DENIED,
+        'event': Event.EventType.VISITOR_DENIED,
+        'roles': [CustomUser.Role.RESIDENT, CustomUser.Role.ADMIN],
+        'stamps': [],
+        'verb': 'denied',
+        'conflict_message': 'Visitor is not in a PENDING state.',
+    },
+    'checkin': {
+        'source': Visitor.Status.APPROVED,
+        'target': Visitor.Status.CHECKED_IN,
+        'event': Event.EventType.VISITOR_CHECKIN,
+        'roles': [CustomUser.Role.GUARD, CustomUser.Role.ADMIN],
+        'stamps': ['checked_in_at'],
+        'notify': _notify_household_arrived,
+        'verb': 'checked in',
+        'conflict_message': 'Visitor must be APPROVED to be checked in.',
+    },
+    'checkout': {
+        'source': Visitor.Status.CHECKED_IN,
+        'target': Visitor.Status.CHECKED_OUT,
+        'event': Event.EventType.VISITOR_CHECKOUT,
+        'roles': [CustomUser.Role.GUARD, CustomUser.Role.ADMIN],
+        'stamps': ['checked_out_at'],
+        'verb': 'checked out',
+        'conflict_message': 'Visitor must be CHECKED_IN to be checked out.',
+    },
+}
+
+
+def household_scope(actor):
+    """Household a user's transitions are confined to (None = any)."""
+    return actor.household_id if actor.role == CustomUser.Role.RESIDENT else None
+
+
+# -----------------------------------------------------------
+# Execution
+# -----------------------------------------------------------
+
+def _conditional_update(ids, source, assignments, household_id=None):
+    """
+    Run the compare-and-set UPDATE and return the visitors that actually
+    moved, fully loaded (with their host household) from RETURNING.
+    """
+    qn = connection.ops.quote_name
+    table = qn(Visitor._meta.db_table)
+    household_table = qn(Household._meta.db_table)
+
+    set_sql, params = [], []
+    for name, value in assignments.items():
+        field = Visitor._meta.get_field(name)
+        set_sql.append(f'{qn(field.column)} = %s')
+        params.append(field.get_db_prep_save(value, connection))
+
+    where_sql = [f'{qn("id")} IN ({", ".join(["%s"] * len(ids))})', f'{qn("status")} = %s']
+    params += [*ids, source]
+    if household_id is not None:
+        where_sql.append(f'{qn("host_household_id")} = %s')
+        params.append(household_id)
+
+    columns = [f'{table}.{qn(field.column)}' for field in Visitor._meta.concrete_fields]
+    for name in ['flat_number', 'name']:
+        columns.append(
+            f'(SELECT {household_table}.{qn(name)} FROM {household_table} '
+            f'WHERE {household_table}.{qn("id")} = {table}.{qn("host_household_id")}) '
+            f'AS {qn("household_" + name)}'
+        )
+    sql = (
+        f'UPDATE {table} SET {", ".join(set_sql)} '
+        f'WHERE {" AND ".join(where_sql)} '
+        f'RETURNING {", ".join(columns)}'
+    )
+    moved = list(Visitor.objects.raw(sql, params))
+    for visitor in moved:
+        visitor.host_household = Household(
+            id=visitor.host_household_id,
+            flat_number=visitor.household_flat_number,
+            name=visitor.household_name
+        )
+    return moved
+
+
+def apply(name, ids, actor, payload=None):
+    """
+    Apply transition `name` to every visitor in `ids` that is in the
+    transition's source state and within the actor's scope, recording the
+    audit events and notifications in the same transaction.
+    Returns the visitors that moved, in no particular order.
+    """
+    spec = TRANSITIONS[name]
+    if actor.role not in spec['roles']:
+        raise TransitionError('forbidden', 'Permission denied.')
+    if not ids:
+        return []
+
+    now = timezone.now()
+    # .update() and raw SQL skip auto_now, so updated_at is set explicitly
+    assignments = {'status': spec['target'], 'updated_at': now}
+    for stamp in spec['stamps']:
+        assignments[stamp] = now
+    if spec.get('actor_field'):
+        assignments[f"{spec['actor_field']}_id"] = actor.id
+
+    with EventRecorder() as audit:
+        moved = _conditional_update(ids, spec['source'], assignments, household_scope(actor))
+        for visitor in moved:
+            audit.record(spec['event'], actor, visitor, payload)
+        outbox = spec['notify'](moved) if moved and spec.get('notify') else []
+        if outbox:
+            notifications.enqueue_many(outbox)
+    return moved
+
+
+def _current(ids, actor):
+    """Current id/name/status of the visitors in `ids` the actor can see."""
+    visible = Visitor.objects.filter(id__in=ids)
+    household_id = household_scope(actor)
+    if household_id is not None:
+        visible = visible.filter(host_household_id=household_id)
+    return {row['id']: row for row in visible.values('id', 'name', 'status')}
+
+
+def transition(name, visitor_id, actor, payload=None):
+    """
+    Apply transition `name` to one visitor and return it, fully loaded.
+    Raises TransitionError if the visitor is unknown to the actor or is
+    no longer in the source state.
+    """
+    try:
+        visitor_id = int(visitor_id)
+    except (TypeError, ValueError):
+        raise TransitionError('not_found', 'Visitor not found.')
+    moved = apply(name, [visitor_id], actor, payload)
+    if moved:
+        return moved[0]
+    # Only a failed transition costs an extra lookup, to say why it failed
+    current = _current([visitor_id], actor).get(visitor_id)
+    if current is None:
+        raise TransitionError('not_found', 'Visitor not found.')
+    raise TransitionError('conflict', TRANSITIONS[name]['conflict_message'], current)
+
+
+def bulk_transition(name, ids, actor, payload=None):
+    """
+    Apply transition `name` to many visitors at once.
+
+    Returns one result per requested ID, in request order:
+        {'id': 7, 'result': 'ok', 'status': 'CHECKED_IN'}
+        {'id': 8, 'result': 'conflict', 'status': 'PENDING'}
+        {'id': 9, 'result': 'not_found'}
+    """
+    ids = list(dict.fromkeys(ids))
+    moved_ids = {visitor.id for visitor in apply(name, ids, actor, payload)}
+    missed = [pk for pk in ids if pk not in moved_ids]
+    current = _current(missed, actor) if missed else {}
+
+    results = []
+    for pk in ids:
+        if pk in moved_ids:
+            results.append({'id': pk, 'result': 'ok', 'status': TRANSITIONS[name]['target']})
+        elif pk in current:
+            results.append({'id': pk, 'result': 'conflict', 'status': current[pk]['status']})
+        else:
+            results.append({'id': pk, 'result': 'not_found'})
+    return results
@@ -6,6 +6,9 @@ from .views import (
     VisitorViewSet, 
     EventViewSet,
     ChatbotView,
+    ChatStreamView,
+    ChangeFeedView,
+    ChangeStreamView,
     UserViewSet,
     RegisterFCMDeviceView  # <-- IMPORT THIS
 )
@@ -23,8 +26,13 @@ urlpatterns = [
     
     # AI Chat endpoint
     path('chat/', ChatbotView.as_view(), name='chat'), # <-- ADD THIS LINE
+    path('chat/stream/', ChatStreamView.as_view(), name='chat-stream'), # Same, streamed as SSE
 
     path('register-fcm/', RegisterFCMDeviceView.as_view(), name='register-fcm'), # <-- 2. Add
+
+    # Change feed (long-poll + SSE) for the dashboards
+    path('changes/', ChangeFeedView.as_view(), name='changes'),
+    path('changes/stream/', ChangeStreamView.as_view(), name='changes-stream'),
     
     # API endpoints
     path('', include(router.urls)),
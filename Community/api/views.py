@@ -1,20 +1,38 @@
 # api/views.py
-from firebase_admin import messaging
-from .models import FCMDevice, CustomUser
+import asyncio
+import json
+import weakref
+from datetime import datetime, timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.http import JsonResponse, StreamingHttpResponse
 from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.settings import api_settings
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework import generics  
 from .serializers import FCMDeviceSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView
-from rest_framework.views import APIView
-from .ai_tools import AICopilotService
-from .models import Visitor, Event, CustomUser
+from . import changefeed
+from .audit import EventRecorder
+from .authentication import forget_user_state
+from .passes import create_visitor_passes
+from . import transitions
+from .fastpath import EventValuesSerializer, FastListMixin, VisitorValuesSerializer
+from .sync import DeltaSyncMixin
+from .models import CustomUser, Event, FCMDevice, Visitor
 from .ai_tools import AICopilotService
 from .serializers import (
     MyTokenObtainPairSerializer, 
     VisitorSerializer, 
+    BulkTransitionSerializer,
     EventSerializer,
     UserManagementSerializer
 )
@@ -22,8 +40,7 @@ from .permissions import (
     IsResident, 
     IsAdminOrGuard, 
     IsResidentOrAdmin, 
-    IsAdmin,
-    IsGuard
+    IsAdmin
 )
 
 # --- Auth View (from Phase 2) ---
@@ -32,44 +49,53 @@ class MyTokenObtainPairView(TokenObtainPairView):
 
 
 # --- Audit Log View (NEW) ---
-class EventViewSet(viewsets.ReadOnlyModelViewSet):
+class EventViewSet(FastListMixin, DeltaSyncMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint to view the immutable audit log.
     Only Admins can view this.
+    Supports ETag/304 and `?since=` delta sync (see api/sync.py).
+    Lists are served from .values() rows (see api/fastpath.py).
     """
-    queryset = Event.objects.all().order_by('-timestamp')
+    delta_field = 'timestamp'
+    keyset_ordering = ('-timestamp', '-id')
+    # actor is rendered by name: join it instead of one query per event
+    queryset = Event.objects.select_related('actor').order_by('-timestamp')
     serializer_class = EventSerializer
+    fast_serializer_class = EventValuesSerializer
     permission_classes = [permissions.IsAuthenticated, IsAdmin]
 
 
+# HTTP status for each transitions.TransitionError code
+TRANSITION_ERROR_STATUS = {
+    'forbidden': status.HTTP_403_FORBIDDEN,
+    'not_found': status.HTTP_404_NOT_FOUND,
+    'conflict': status.HTTP_400_BAD_REQUEST,
+}
+
+
 # --- Visitor View (UPDATED) ---
-class VisitorViewSet(viewsets.ModelViewSet):
+class VisitorViewSet(FastListMixin, DeltaSyncMixin, viewsets.ModelViewSet):
     """
     API endpoint for Visitors.
+    Supports ETag/304 and `?since=` delta sync (see api/sync.py).
+    Lists are served from .values() rows (see api/fastpath.py).
     """
-    queryset = Visitor.objects.all().order_by('-created_at')
+    queryset = Visitor.objects.select_related('host_household').order_by('-created_at')
     serializer_class = VisitorSerializer
-
-    def _log_event(self, type, actor, visitor, payload=None):
-        """Helper function to create an audit event."""
-        Event.objects.create(
-            type=type,
-            actor=actor,
-            subject_visitor=visitor,
-            payload=payload or {}
-        )
+    fast_serializer_class = VisitorValuesSerializer
+    keyset_ordering = ('-created_at', '-id')
 
     def get_permissions(self):
         """
         Assign permissions based on action.
         """
-        if self.action == 'create':
+        if self.action in ['create', 'bulk']:
             permission_classes = [permissions.IsAuthenticated, IsResident]
         elif self.action in ['list', 'retrieve']:
             permission_classes = [permissions.IsAuthenticated, IsResident | IsAdminOrGuard]
-        elif self.action in ['approve', 'deny']:
+        elif self.action in ['approve', 'deny', 'bulk_approve', 'bulk_deny']:
             permission_classes = [permissions.IsAuthenticated, IsResidentOrAdmin]
-        elif self.action in ['checkin', 'checkout']:
+        elif self.action in ['checkin', 'checkout', 'bulk_checkin', 'bulk_checkout']:
             permission_classes = [permissions.IsAuthenticated, IsAdminOrGuard]
         else:
             # For other actions (update, partial_update, destroy)
@@ -79,200 +105,366 @@ class VisitorViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         """
         Filter the queryset based on user role.
+        The nested host_household is joined, so lists cost a fixed number of queries.
         """
         user = self.request.user
+        visitors = Visitor.objects.select_related('host_household')
         
         if user.role == CustomUser.Role.RESIDENT:
-            return Visitor.objects.filter(host_household=user.household)
-        elif user.role in [CustomUser.Role.GUARD, CustomUser.Role.ADMIN]:
-            return Visitor.objects.all().order_by('-created_at')
-        
-        return Visitor.objects.none()
+            visitors = visitors.filter(host_household_id=user.household_id)
+        elif user.role not in [CustomUser.Role.GUARD, CustomUser.Role.ADMIN]:
+            return Visitor.objects.none()
+
+        if 'date' in self.request.query_params:
+            visitors = visitors.filter(self._visit_date_filter(self.request.query_params['date']))
+        return visitors.order_by('-created_at')
+
+    def _visit_date_filter(self, value):
+        """
+        ?date=YYYY-MM-DD: visitors due that day (by scheduled time, or by
+        creation for walk-ins), as index-friendly ranges in the current timezone.
+        """
+        try:
+            day = datetime.strptime(value, '%Y-%m-%d')
+        except ValueError:
+            raise exceptions.ValidationError({'date': 'Use YYYY-MM-DD.'})
+        start = timezone.make_aware(day)
+        end = start + timedelta(days=1)
+        return (
+            Q(scheduled_time__gte=start, scheduled_time__lt=end)
+            | Q(scheduled_time__isnull=True, created_at__gte=start, created_at__lt=end)
+        )
 
     def perform_create(self, serializer):
         """
         Automatically set the host_household and log the event.
         """
         if self.request.user.role == CustomUser.Role.RESIDENT:
-            visitor = serializer.save(
-                host_household=self.request.user.household, 
-                status=Visitor.Status.PENDING
-            )
-            self._log_event(
-                Event.EventType.VISITOR_CREATED, 
-                self.request.user, 
-                visitor
-            )
-    def _send_fcm_to_user(self, user, title, body, data=None):
-        """Helper to send FCM message to a single user."""
-        devices = FCMDevice.objects.filter(user=user)
-        tokens = [device.registration_id for device in devices]
-        if not tokens:
-            print(f"No FCM tokens for user {user.username}") # <-- THIS IS THE LOG WE'RE LOOKING FOR
-            return
-        
-        message = messaging.MulticastMessage(
-            notification=messaging.Notification(title=title, body=body),
-            tokens=tokens,
-            data=data or {}
+            with EventRecorder() as audit:
+                visitor = serializer.save(
+                    host_household=self.request.user.household,
+                    status=Visitor.Status.PENDING
+                )
+                audit.record(Event.EventType.VISITOR_CREATED, self.request.user, visitor)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Action for a Resident to create many visitor passes at once
+        (e.g. a party guest list). Costs a constant number of queries.
+        """
+        serializer = VisitorSerializer(
+            data=request.data,
+            many=True,
+            allow_empty=False,
+            max_length=settings.VISITOR_BULK_MAX_PASSES
         )
-        try:
-            response = messaging.send_multicast(message)
-            print(f'Sent FCM to {response.success_count} device(s) for user {user.username}') # <-- OR THIS
-        except Exception as e:
-            print(f"Error sending FCM for user {user.username}: {e}")
+        serializer.is_valid(raise_exception=True)
+        passes = [
+            {key: value for key, value in item.items() if key != 'host_household'}
+            for item in serializer.validated_data
+        ]
+        visitors = create_visitor_passes(request.user, passes)
+        return Response(VisitorSerializer(visitors, many=True).data, status=status.HTTP_201_CREATED)
 
     # --- STATE MACHINE ACTIONS ---
+    # All transitions run through the shared engine in api/transitions.py:
+    # one conditional UPDATE plus the audit insert, no read-check-save.
+
+    def _transition(self, request, name, payload=None):
+        try:
+            visitor = transitions.transition(name, self.kwargs['pk'], request.user, payload)
+        except transitions.TransitionError as e:
+            return Response({'error': e.message}, status=TRANSITION_ERROR_STATUS[e.code])
+        return Response(VisitorSerializer(visitor).data, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['post'])
     def approve(self, request, pk=None):
         """
         Action for a Resident or Admin to approve a PENDING visitor.
         """
-        visitor = self.get_object()
-        user = request.user
-        
-        # 1. State Machine Check
-        if visitor.status != Visitor.Status.PENDING:
-            return Response(
-                {'error': 'Visitor is not in a PENDING state.'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-            
-        # 2. Permission Check (extra layer)
-        if user.role == CustomUser.Role.RESIDENT and user.household != visitor.host_household:
-             return Response(
-                {'error': 'You can only approve visitors for your own household.'}, 
-                status=status.HTTP_403_FORBIDDEN
-            )
-
-        # 3. Apply Change
-        visitor.status = Visitor.Status.APPROVED
-        visitor.approved_by = user
-        visitor.approved_at = timezone.now()
-        visitor.save()
-        
-        # 4. Log Event
-        self._log_event(Event.EventType.VISITOR_APPROVED, user, visitor)
-        
-        return Response(VisitorSerializer(visitor).data, status=status.HTTP_200_OK)
-
-        guards = CustomUser.objects.filter(role=CustomUser.Role.GUARD)
-        for guard in guards:
-            self._send_fcm_to_user(
-                user=guard,
-                title="Visitor Approved",
-                body=f"'{visitor.name}' for {visitor.host_household.flat_number} is now approved."
-            )
-        return Response(VisitorSerializer(visitor).data, status=status.HTTP_200_OK)
+        return self._transition(request, 'approve')
 
     @action(detail=True, methods=['post'])
     def deny(self, request, pk=None):
         """
         Action for a Resident or Admin to deny a PENDING visitor.
         """
-        visitor = self.get_object()
-        user = request.user
         reason = request.data.get('reason', 'No reason provided')
-        
-        if visitor.status != Visitor.Status.PENDING:
-            return Response(
-                {'error': 'Visitor is not in a PENDING state.'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-            
-        if user.role == CustomUser.Role.RESIDENT and user.household != visitor.host_household:
-             return Response(
-                {'error': 'You can only deny visitors for your own household.'}, 
-                status=status.HTTP_403_FORBIDDEN
-            )
-
-        visitor.status = Visitor.Status.DENIED
-        visitor.save()
-        
-        self._log_event(
-            Event.EventType.VISITOR_DENIED, 
-            user, 
-            visitor, 
-            {'reason': reason}
-        )
-        
-        return Response(VisitorSerializer(visitor).data, status=status.HTTP_200_OK)
+        return self._transition(request, 'deny', {'reason': reason})
 
     @action(detail=True, methods=['post'])
     def checkin(self, request, pk=None):
         """
         Action for a Guard or Admin to check-in an APPROVED visitor.
         """
-        visitor = self.get_object()
-        user = request.user
-        
-        if visitor.status != Visitor.Status.APPROVED:
-            return Response(
-                {'error': 'Visitor must be APPROVED to be checked in.'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-            
-        visitor.status = Visitor.Status.CHECKED_IN
-        visitor.checked_in_at = timezone.now()
-        visitor.save()
-        
-        self._log_event(Event.EventType.VISITOR_CHECKIN, user, visitor)
-        for resident in visitor.host_household.members.all():
-             self._send_fcm_to_user(
-                user=resident,
-                title="Visitor Arrived",
-                body=f"'{visitor.name}' has checked in."
-            )
-        
-        return Response(VisitorSerializer(visitor).data, status=status.HTTP_200_OK)
+        return self._transition(request, 'checkin')
 
     @action(detail=True, methods=['post'])
     def checkout(self, request, pk=None):
         """
         Action for a Guard or Admin to check-out a CHECKED_IN visitor.
         """
-        visitor = self.get_object()
-        user = request.user
-        
-        if visitor.status != Visitor.Status.CHECKED_IN:
-            return Response(
-                {'error': 'Visitor must be CHECKED_IN to be checked out.'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-            
-        visitor.status = Visitor.Status.CHECKED_OUT
-        visitor.checked_out_at = timezone.now()
-        visitor.save()
-        
-        self._log_event(Event.EventType.VISITOR_CHECKOUT, user, visitor)
-        
-        return Response(VisitorSerializer(visitor).data, status=status.HTTP_200_OK)
-class ChatbotView(APIView):
-    permission_classes = [permissions.IsAuthenticated]
-
-    def post(self, request, *args, **kwargs):
-        # Expect a 'history' array instead of 'message' string
-        history = request.data.get('history')
-        if not history or not isinstance(history, list):
-            return Response(
-                {'error': 'Message history is required and must be an array.'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        service = AICopilotService(user=request.user)
-        
-        # Pass the whole history list to the service
-        response_message = service.process_message(history)
-        
-        return Response({'reply': response_message}, status=status.HTTP_200_OK)
+        return self._transition(request, 'checkout')
+
+    # --- BULK GATE ACTIONS ---
+    # Each is one conditional UPDATE for the whole batch.
+
+    def _bulk_transition(self, request, name):
+        serializer = BulkTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        payload = {'reason': serializer.validated_data['reason']} if name == 'deny' else None
+        try:
+            results = transitions.bulk_transition(name, serializer.validated_data['ids'], request.user, payload)
+        except transitions.TransitionError as e:
+            return Response({'error': e.message}, status=TRANSITION_ERROR_STATUS[e.code])
+        succeeded = sum(1 for r in results if r['result'] == 'ok')
+        return Response(
+            {'succeeded': succeeded, 'failed': len(results) - succeeded, 'results': results},
+            status=status.HTTP_200_OK
+        )
+
+    @action(detail=False, methods=['post'], url_path='bulk-approve')
+    def bulk_approve(self, request):
+        """Approve many PENDING visitors; reports per-ID success or conflict."""
+        return self._bulk_transition(request, 'approve')
+
+    @action(detail=False, methods=['post'], url_path='bulk-deny')
+    def bulk_deny(self, request):
+        """Deny many PENDING visitors; reports per-ID success or conflict."""
+        return self._bulk_transition(request, 'deny')
+
+    @action(detail=False, methods=['post'], url_path='bulk-checkin')
+    def bulk_checkin(self, request):
+        """Check in many APPROVED visitors; reports per-ID success or conflict."""
+        return self._bulk_transition(request, 'checkin')
+
+    @action(detail=False, methods=['post'], url_path='bulk-checkout')
+    def bulk_checkout(self, request):
+        """Check out many CHECKED_IN visitors; reports per-ID success or conflict."""
+        return self._bulk_transition(request, 'checkout')
+# --- Change Feed Views (replace dashboard polling) ---
+async def _authenticate(request):
+    """
+    Run the configured DRF authenticators against a plain Django request.
+    Returns the user, or None if the request is not authenticated.
+    """
+    for authenticator_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        try:
+            result = await sync_to_async(authenticator_class().authenticate)(request)
+        except exceptions.AuthenticationFailed:
+            return None
+        if result is not None:
+            return result[0]
+    return None
+
+
+def _parse_cursor(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ChangeFeedView(View):
+    """
+    Long-poll fallback for the change feed.
+    GET /api/changes/?cursor=N waits until a change visible to the user
+    arrives after cursor N (or the timeout passes). Without a cursor it
+    returns the current cursor immediately so the client can start.
+    """
+    async def get(self, request):
+        user = await _authenticate(request)
+        if user is None:
+            return JsonResponse({'error': 'Authentication credentials were not provided.'}, status=401)
+
+        changefeed.ensure_listener()
+        cursor = _parse_cursor(request.GET.get('cursor'))
+        if cursor is None:
+            return JsonResponse({'cursor': changefeed.bus.cursor, 'changes': [], 'resync': False})
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.CHANGEFEED_LONG_POLL_TIMEOUT
+        while True:
+            changes, cursor, resync = changefeed.visible_since(user, cursor)
+            remaining = deadline - loop.time()
+            if changes or resync or remaining <= 0:
+                return JsonResponse({'cursor': cursor, 'changes': changes, 'resync': resync})
+            await changefeed.bus.wait(cursor, remaining)
+
+
+class ChangeStreamView(View):
+    """
+    Server-Sent Events stream of changes visible to the user.
+    Resumes from the standard Last-Event-ID header after a reconnect.
+    """
+    async def get(self, request):
+        user = await _authenticate(request)
+        if user is None:
+            return JsonResponse({'error': 'Authentication credentials were not provided.'}, status=401)
+
+        changefeed.ensure_listener()
+        cursor = _parse_cursor(request.headers.get('Last-Event-ID'))
+        if cursor is None:
+            cursor = changefeed.bus.cursor
+
+        async def stream():
+            nonlocal cursor
+            yield f"retry: 3000\nevent: ready\ndata: {json.dumps({'cursor': cursor})}\n\n"
+            while True:
+                changes, cursor, resync = changefeed.visible_since(user, cursor)
+                if resync:
+                    yield f"id: {cursor}\nevent: resync\ndata: {{}}\n\n"
+                for change in changes:
+                    yield f"id: {change['cursor']}\nevent: change\ndata: {json.dumps(change)}\n\n"
+                if not changes and not resync:
+                    yield ": keepalive\n\n"
+                await changefeed.bus.wait(cursor, settings.CHANGEFEED_HEARTBEAT)
+
+        response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+# --- AI Copilot (async: a chat waiting on Gemini holds no worker thread) ---
+_chat_semaphores = weakref.WeakKeyDictionary()
+
+
+def _chat_semaphore():
+    """Caps copilot turns in flight per process (one semaphore per event loop)."""
+    loop = asyncio.get_running_loop()
+    semaphore = _chat_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _chat_semaphores[loop] = asyncio.Semaphore(settings.COPILOT_MAX_CONCURRENT_CHATS)
+    return semaphore
+
+
+async def _acquire_chat_slot():
+    """Wait up to COPILOT_CHAT_QUEUE_TIMEOUT for a slot; returns the semaphore to release, or None."""
+    semaphore = _chat_semaphore()
+    try:
+        await asyncio.wait_for(semaphore.acquire(), settings.COPILOT_CHAT_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        return None
+    return semaphore
+
+
+def _parse_history(request):
+    # Expect a 'history' array instead of 'message' string
+    try:
+        history = json.loads(request.body or b'{}').get('history')
+    except (ValueError, AttributeError):
+        return None
+    return history if history and isinstance(history, list) else None
+
+
+COPILOT_BUSY_MESSAGE = 'The assistant is busy right now, please try again shortly.'
+
+
+@method_decorator(csrf_exempt, name='dispatch') # Bearer-token API, like the DRF views
+class ChatbotView(View):
+    """
+    POST /api/chat/ with {"history": [...]}; returns {"reply": "..."}.
+    Runs under asgi.py: while Gemini works the request awaits instead of
+    pinning a thread, so chats can't starve the visitor API. At most
+    COPILOT_MAX_CONCURRENT_CHATS turns run per process; the rest wait up
+    to COPILOT_CHAT_QUEUE_TIMEOUT and then get a 503.
+    """
+    async def post(self, request):
+        user = await _authenticate(request)
+        if user is None:
+            return JsonResponse({'error': 'Authentication credentials were not provided.'}, status=401)
+
+        history = _parse_history(request)
+        if history is None:
+            return JsonResponse({'error': 'Message history is required and must be an array.'}, status=400)
+
+        semaphore = await _acquire_chat_slot()
+        if semaphore is None:
+            return JsonResponse({'error': COPILOT_BUSY_MESSAGE}, status=503)
+        try:
+            service = AICopilotService(user=user)
+            response_message = await service.aprocess_message(history)
+        finally:
+            semaphore.release()
+
+        return JsonResponse({'reply': response_message})
+
+
+async def _iterate_in_thread(iterator):
+    """
+    Drive a blocking iterator from async code, one step at a time on the
+    request's sync thread (so its DB connection is reused and closed with
+    the request). Closes the iterator if the client goes away.
+    """
+    done = object()
+    try:
+        while True:
+            item = await sync_to_async(next)(iterator, done)
+            if item is done:
+                return
+            yield item
+    finally:
+        await sync_to_async(iterator.close)()
+
+
+@method_decorator(csrf_exempt, name='dispatch') # Bearer-token API, like the DRF views
+class ChatStreamView(View):
+    """
+    Streaming variant of ChatbotView, as Server-Sent Events.
+    POST /api/chat/stream/ with {"history": [...]}; emits `token` events
+    as Gemini writes, a `tool` event before each function call runs, and a
+    final `done` event with the whole reply (or `error`).
+    """
+    async def post(self, request):
+        user = await _authenticate(request)
+        if user is None:
+            return JsonResponse({'error': 'Authentication credentials were not provided.'}, status=401)
+
+        history = _parse_history(request)
+        if history is None:
+            return JsonResponse({'error': 'Message history is required and must be an array.'}, status=400)
+
+        service = AICopilotService(user=user)
+
+        async def stream():
+            # Streams share ChatbotView's cap (each holds a thread while Gemini writes)
+            semaphore = await _acquire_chat_slot()
+            if semaphore is None:
+                yield f"event: error\ndata: {json.dumps({'message': COPILOT_BUSY_MESSAGE})}\n\n"
+                return
+            try:
+                async for event in _iterate_in_thread(service.stream_message(history)):
+                    name = event.pop('event')
+                    yield f"event: {name}\ndata: {json.dumps(event)}\n\n"
+            finally:
+                semaphore.release()
+
+        response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
 class UserViewSet(viewsets.ModelViewSet):
     """
     API endpoint for Admins to view and manage all users.
     """
-    queryset = CustomUser.objects.all().order_by('username')
+    queryset = CustomUser.objects.select_related('household').order_by('username')
     serializer_class = UserManagementSerializer
+    keyset_ordering = ('username', 'id')
     permission_classes = [permissions.IsAuthenticated, IsAdmin]
+
+    # Role, household or active-flag edits apply on the user's next request
+    def perform_update(self, serializer):
+        user = serializer.save()
+        transaction.on_commit(lambda: forget_user_state(user.id))
+
+    def perform_destroy(self, instance):
+        user_id = instance.id
+        instance.delete()
+        transaction.on_commit(lambda: forget_user_state(user_id))
 class RegisterFCMDeviceView(generics.CreateAPIView):
     """
     POST-only endpoint for clients to register their FCM device token.
@@ -0,0 +1,42 @@
+# Community/api/warmup.py
+"""
+Warm-up hooks for preforking app servers (see gunicorn.conf.py).
+
+`preload()` runs once in the master before workers are forked: it
+imports the heavy SDK modules and builds the static copilot objects, so
+every worker shares those pages copy-on-write instead of importing its
+own copy. Nothing holding a socket or a thread is created there: DB
+connections and gRPC channels don't survive fork, so `warm_worker()`
+creates the long-lived ones in each worker right after the fork. Request
+DB connections are not warmed: under ASGI each request's sync code runs
+on its own executor thread, with its own connection, so one opened here
+would never be used. The Gemini async client is warmed later, on the
+server's event loop (community_app/asgi.py).
+"""
+import time
+
+from django.db import connection, connections
+
+
+def preload():
+    start = time.perf_counter()
+    import firebase_admin.messaging  # noqa: F401
+    import vertexai.generative_models  # noqa: F401
+    from .ai_tools import get_gemini_tool
+
+    get_gemini_tool()
+    # Fail fast on a bad DATABASES config, then drop the connection before forking
+    connection.ensure_connection()
+    connections.close_all()
+    print(f"Preloaded SDKs in {time.perf_counter() - start:.2f}s")
+
+
+def warm_worker():
+    from . import changefeed, firebase, llm
+
+    start = time.perf_counter()
+    # Listen from the start, so the change feed has no gap when the first client resumes here
+    changefeed.ensure_listener()
+    llm.warm_up()
+    firebase.get_app()
+    print(f"Worker warmed up in {time.perf_counter() - start:.2f}s")
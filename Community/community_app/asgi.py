@@ -13,4 +13,23 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'community_app.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+
+async def application(scope, receive, send):
+    """
+    Django's ASGI app, plus lifespan startup: warm the Gemini async client
+    on the server's event loop, which post_fork runs too early to reach.
+    """
+    if scope['type'] != 'lifespan':
+        return await django_application(scope, receive, send)
+    from api import llm
+
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            llm.warm_up_async()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
@@ -86,12 +86,22 @@ DATABASES = {
 }
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # Builds request.user from the token claims (see api/authentication.py)
+        'api.authentication.ClaimsJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated', # Default to deny all
     ),
+    # Keyset pagination on every list endpoint (see api/pagination.py)
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
+    # orjson-backed JSON (see api/renderers.py)
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
+KEYSET_MAX_PAGE_SIZE = 200 # Upper bound for ?page_size= and for one delta-sync response
 
 # Also add Simple JWT settings
 from datetime import timedelta
@@ -103,6 +113,8 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
+AUTH_STATE_CACHE_SECONDS = 30 # How long a user's role/household/active flag is trusted before it is re-read
+AUTH_STATE_CACHE = 'default' # Cache alias for that state; per-process unless CACHES points it at a shared backend
 
 
 
@@ -156,6 +168,41 @@ STATIC_URL = 'static/'
 GCP_PROJECT_ID = "gen-lang-client-0431862828"
 GCP_LOCATION = "us-central1" # Or your preferred region
 GEMINI_MODEL_NAME = "gemini-2.0-flash-lite-001"
+COPILOT_MODEL_BACKEND = 'api.llm.vertex_model' # Use 'api.replay.ReplayModel' offline, 'api.replay.RecordingModel' to record for it
+COPILOT_REPLAY_FILE = os.path.join(BASE_DIR, 'api', 'replays', 'sample.json') # Recorded Gemini responses for ReplayModel
+COPILOT_REPLAY_LATENCY = 0.0 # Seconds ReplayModel waits per call, to stand in for Gemini's response time
+COPILOT_CONTEXT_CACHE_SECONDS = 300 # Upper bound on a cached visitor context's age (it is also dropped on any change in scope)
+COPILOT_RESPONSE_CACHE_SIZE = 1000 # Replies to read-only copilot turns kept per process (least recently used go first)
+COPILOT_RESPONSE_CACHE_SECONDS = 300 # Upper bound on a cached reply's age (it is also dropped on any change in scope)
+COPILOT_HISTORY_TOKEN_BUDGET = 2000 # Estimated tokens of recent chat sent verbatim per Gemini call
+COPILOT_HISTORY_SUMMARY_TOKENS = 300 # Cap on the summary of older turns added to the system prompt
+COPILOT_MAX_CONCURRENT_CHATS = 20 # Copilot turns in flight per worker process; more wait for a slot
+COPILOT_CHAT_QUEUE_TIMEOUT = 30 # Seconds a chat waits for a slot before a 503
+COPILOT_TOOL_WORKERS = 8 # Threads per process running one turn's tool calls concurrently (1 = one after another)
+COPILOT_TOOL_CONN_MAX_AGE = 60 # Seconds a tool thread keeps its DB connection between turns
+
+# --- Change feed (replaces 3-second dashboard polling) ---
+CHANGEFEED_BUFFER_SIZE = 1000 # Recent changes kept per process for resuming clients
+CHANGEFEED_LONG_POLL_TIMEOUT = 25 # Seconds a long-poll waits before returning empty
+CHANGEFEED_HEARTBEAT = 15 # Seconds between SSE keepalive comments
+
+# --- Visitors ---
+VISITOR_BULK_MAX_PASSES = 200 # Largest guest list POST /api/visitors/bulk/ accepts
+VISITOR_BULK_MAX_TRANSITIONS = 500 # Most IDs one bulk approve/deny/checkin/checkout call accepts
+FAST_LIST_SERIALIZATION = True # Serve visitor/event lists from .values() rows (api/fastpath.py)
+
+# --- Notification outbox (drained by `manage.py deliver_notifications`) ---
+NOTIFICATION_SENDER = 'api.notifications.FCMSender' # Use 'api.notifications.LocalStubSender' offline
+NOTIFICATION_MAX_ATTEMPTS = 6
+NOTIFICATION_RETRY_BASE_SECONDS = 5 # Doubles on every failed attempt...
+NOTIFICATION_RETRY_MAX_SECONDS = 3600 # ...up to this cap
+NOTIFICATION_LEASE_SECONDS = 60 # How long a claimed row is hidden from other workers
+FCM_MULTICAST_BATCH_SIZE = 500 # FCM's per-call token limit
+FCM_TRANSIENT_RETRIES = 2 # In-call retries for tokens FCM answers UNAVAILABLE/INTERNAL...
+FCM_TRANSIENT_RETRY_SECONDS = 0.5 # ...after this delay, doubling each time
+
+# --- Delta sync (?since= cursors on list endpoints) ---
+DELTA_SYNC_OVERLAP_SECONDS = 2 # Re-send rows this close to the cursor to cover late commits
 
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173", # Your React frontend development server
@@ -164,5 +211,6 @@ CORS_ALLOWED_ORIGINS = [
     "https://127.0.0.1:5173", # Also allow this variation
     # Add your deployed frontend URL here later
 ]
+CORS_EXPOSE_HEADERS = ['ETag', 'X-Delta-Cursor'] # Let the frontend read delta-sync headers
 
 FIREBASE_ADMIN_SDK_JSON_PATH = os.path.join(BASE_DIR, 'firebase-key.json')
\ No newline at end of file
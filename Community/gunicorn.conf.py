@@ -0,0 +1,32 @@
+# Community/gunicorn.conf.py
+"""
+Production app server: gunicorn supervising uvicorn workers (ASGI, which
+the change feed needs).
+
+    gunicorn community_app.asgi:application
+
+preload_app loads Django, the URLconf and the SDKs once in the master,
+so forked workers share them copy-on-write; each worker then starts its
+change feed listener and opens its Gemini/Firebase clients (api/warmup.py).
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'uvicorn.workers.UvicornWorker'
+preload_app = True
+timeout = 60 # Long-polls return after CHANGEFEED_LONG_POLL_TIMEOUT (25s)
+graceful_timeout = 30
+accesslog = '-'
+
+
+def when_ready(server):
+    # Master, after the app is preloaded and before the first fork
+    from api import warmup
+    warmup.preload()
+
+
+def post_fork(server, worker):
+    from api import warmup
+    warmup.warm_worker()
@@ -1,6 +1,7 @@
 // src/pages/AdminDashboard.jsx
 import React, { useState, useEffect } from 'react';
-import apiClient from '../services/apiClient';
+import { fetchAllPages } from '../services/apiClient';
+import { subscribeToChanges } from '../services/changeFeed';
 import GuardDashboard from './GuardDashboard'; // <-- 1. Import the Guard Dashboard
 import './AdminDashboard.css';
 
@@ -14,8 +15,7 @@ function AuditLogView() {
   const fetchEvents = async () => {
     setError('');
     try {
-      const response = await apiClient.get('/events/');
-      setEvents(response.data || []);
+      setEvents(await fetchAllPages('/events/')); // Every page, newest first
     } catch (err) {
       console.error('Failed to fetch events:', err);
       setError(`Failed to load audit log: ${err.message}`);
@@ -25,9 +25,7 @@ function AuditLogView() {
   };
 
   useEffect(() => {
-    fetchEvents();
-    const intervalId = setInterval(fetchEvents, 3000); // Poll for updates
-    return () => clearInterval(intervalId);
+    return subscribeToChanges(fetchEvents); // Refetch when the server reports a change
   }, []);
 
   const formatTimestamp = (timestamp) => {
@@ -96,8 +94,7 @@ function UserManagementView() {
   const fetchUsers = async () => {
     setError('');
     try {
-      const response = await apiClient.get('/users/');
-      setUsers(response.data || []);
+      setUsers(await fetchAllPages('/users/')); // Every page, ordered by username
     } catch (err) {
       console.error('Failed to fetch users:', err);
       setError(`Failed to load users: ${err.message}`);
@@ -1,6 +1,7 @@
 // src/pages/GuardDashboard.jsx
 import React, { useState, useEffect } from 'react';
-import apiClient from '../services/apiClient';
+import apiClient, { fetchAllPages } from '../services/apiClient';
+import { subscribeToChanges } from '../services/changeFeed';
 import Calendar from 'react-calendar';
 import 'react-calendar/dist/Calendar.css';
 import './GuardDashboard.css';
@@ -30,8 +31,8 @@ function GuardDashboard() {
   const fetchVisitors = async () => {
     setError('');
     try {
-      const response = await apiClient.get('/visitors/');
-      setVisitors(response.data || []);
+      // The server scopes the list to the selected day; follow every page of it
+      setVisitors(await fetchAllPages('/visitors/', { date: selectedDate }));
     } catch (err) {
       console.error('Failed to fetch visitors:', err);
       setError(`Failed to load visitors: ${err.message}`);
@@ -61,11 +62,9 @@ function GuardDashboard() {
     }
   };
 
-  // --- Polling Effect ---
+  // --- Change Feed Effect (refetch only when something changed) ---
   useEffect(() => {
-    fetchVisitors();
-    const intervalId = setInterval(fetchVisitors, 3000);
-    return () => clearInterval(intervalId);
+    return subscribeToChanges(fetchVisitors);
   }, [selectedDate]);
 
   // --- Calendar Date Change Handler ---
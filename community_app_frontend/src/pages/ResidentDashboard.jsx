@@ -1,6 +1,8 @@
 // src/pages/ResidentDashboard.jsx
 import React, { useState, useEffect, useRef } from 'react';
-import apiClient from '../services/apiClient';
+import { fetchAllPages } from '../services/apiClient';
+import { subscribeToChanges } from '../services/changeFeed';
+import { streamChat } from '../services/chatStream';
 // We no longer need the FCM service import here
 // import { requestNotificationPermission } from '../services/fcmService';
 import './ResidentDashboard.css';
@@ -46,18 +48,15 @@ function ResidentDashboard() {
   // Polling function to fetch visitors
   const fetchVisitors = async () => {
     try {
-      const response = await apiClient.get('/visitors/');
-      setVisitors(response.data || []);
+      setVisitors(await fetchAllPages('/visitors/')); // Every page, newest first
     } catch (err) {
       console.error("Failed to poll visitors:", err);
     }
   };
 
-  // Polling Effect
+  // Change Feed Effect: fetches on connect, then only when our visitors change
   useEffect(() => {
-    fetchVisitors(); // Fetch on load
-    const intervalId = setInterval(fetchVisitors, 3000); // Poll every 3 seconds
-    return () => clearInterval(intervalId); // Cleanup
+    return subscribeToChanges(fetchVisitors);
   }, []);
 
   // Notification Simulation Logic
@@ -101,17 +100,24 @@ function ResidentDashboard() {
         text: msg.text
     }));
 
-    let botResponseText = "Sorry, something went wrong.";
+    // Stream the reply into a bot bubble as it arrives
+    const botId = Date.now() + 1;
+    setMessages(prevMessages => [...prevMessages, { id: botId, sender: 'bot', text: '' }]);
+    const updateBot = (update) => setMessages(prevMessages =>
+      prevMessages.map(msg => (msg.id === botId ? { ...msg, ...update(msg) } : msg))
+    );
+
     try {
-      const response = await apiClient.post('/chat/', { history: historyForApi });
-      botResponseText = response.data.reply;
+      const reply = await streamChat(historyForApi, {
+        onToken: (text) => updateBot(msg => ({ text: msg.text + text, status: null })),
+        onTool: (message) => updateBot(() => ({ status: message })),
+      });
+      updateBot(() => ({ text: reply, status: null }));
     } catch (error) {
       console.error("Error sending chat message:", error);
-      botResponseText = "Sorry, an error occurred with the AI model.";
+      updateBot(() => ({ text: "Sorry, an error occurred with the AI model.", status: null }));
     }
     
-    const botResponse = { id: Date.now() + 1, sender: 'bot', text: botResponseText };
-    setMessages(prevMessages => [...prevMessages, botResponse]);
     setIsLoading(false); // <-- This triggers the auto-focus effect
   };
 
@@ -123,9 +129,10 @@ function ResidentDashboard() {
       {/* --- FIX 1: Yellow button is REMOVED --- */}
 
       <div className="message-list" ref={messageListRef}>
-        {messages.map(msg => (
+        {messages.filter(msg => msg.text || msg.status).map(msg => (
           <div key={msg.id} className={`message ${msg.sender}`}>
             <p>
+              {msg.status && <i>{msg.status}</i>}
               {msg.text.split('\n').map((line, index, arr) => (
                 <React.Fragment key={index}>
                   {line}
@@ -135,7 +142,9 @@ function ResidentDashboard() {
              </p>
           </div>
         ))}
-        {isLoading && (<div className="message bot"><p><i>Thinking...</i></p></div>)}
+        {isLoading && !messages[messages.length - 1].text && !messages[messages.length - 1].status && (
+          <div className="message bot"><p><i>Thinking...</i></p></div>
+        )}
       </div>
       <form className="message-input-form" onSubmit={handleSendMessage}>
         <input
@@ -27,4 +27,15 @@ apiClient.interceptors.request.use(
   }
 );
 
-export default apiClient;
\ No newline at end of file
+export default apiClient;
+
+// Fetches every page of a paginated list, following the server's `next` links
+export async function fetchAllPages(path, params = {}) {
+  let response = await apiClient.get(path, { params: { page_size: 200, ...params } });
+  const results = [...(response.data.results || [])];
+  while (response.data.next) {
+    response = await apiClient.get(response.data.next); // Absolute URL, already carries the query
+    results.push(...(response.data.results || []));
+  }
+  return results;
+}
@@ -0,0 +1,31 @@
+// src/services/changeFeed.js
+import apiClient from './apiClient';
+
+// Long-polls /api/changes/ and calls `onChange(changes)` whenever the server
+// reports a change visible to the current user (or asks us to resync).
+// `onChange([])` is also called once the feed is connected, so callers can
+// do their initial fetch there. Returns an unsubscribe function.
+export function subscribeToChanges(onChange) {
+  let active = true;
+  let cursor = null;
+
+  const loop = async () => {
+    while (active) {
+      try {
+        const params = cursor === null ? {} : { cursor };
+        // The server holds the request open for up to 25s, so allow longer than the default timeout
+        const response = await apiClient.get('/changes/', { params, timeout: 35000 });
+        if (!active) break;
+        const { changes = [], resync = false } = response.data;
+        if (cursor === null || resync || changes.length) onChange(changes);
+        cursor = response.data.cursor;
+      } catch (err) {
+        console.error('Change feed error:', err);
+        await new Promise((resolve) => setTimeout(resolve, 3000)); // Back off before reconnecting
+      }
+    }
+  };
+
+  loop();
+  return () => { active = false; };
+}
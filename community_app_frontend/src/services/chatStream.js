@@ -0,0 +1,56 @@
+// src/services/chatStream.js
+import apiClient from './apiClient';
+
+// POSTs the chat history to /api/chat/stream/ and reads the Server-Sent
+// Events as they arrive: `onToken(text)` for each piece of the reply and
+// `onTool(message)` while the copilot runs an action. Resolves with the
+// full reply. (EventSource can't POST or send our Authorization header,
+// so the stream is read with fetch.)
+export async function streamChat(history, { onToken, onTool } = {}) {
+  const token = localStorage.getItem('accessToken');
+  const response = await fetch(`${apiClient.defaults.baseURL}/chat/stream/`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      ...(token ? { Authorization: `Bearer ${token}` } : {}),
+    },
+    body: JSON.stringify({ history }),
+  });
+  if (!response.ok || !response.body) {
+    throw new Error(`Chat stream failed with status ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let reply = '';
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const block = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      let event = 'message';
+      let data = '';
+      block.split('\n').forEach((line) => {
+        if (line.startsWith('event: ')) event = line.slice(7);
+        else if (line.startsWith('data: ')) data += line.slice(6);
+      });
+      if (!data) continue;
+      const payload = JSON.parse(data);
+      if (event === 'token') {
+        reply += payload.text;
+        onToken?.(payload.text);
+      } else if (event === 'tool') {
+        onTool?.(payload.message);
+      } else if (event === 'done') {
+        return payload.reply;
+      } else if (event === 'error') {
+        throw new Error(payload.message);
+      }
+    }
+  }
+  return reply;
+}